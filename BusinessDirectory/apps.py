@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class BusinessdirectoryConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'BusinessDirectory'
+
+    def ready(self):
+        from . import signals  # noqa
@@ -0,0 +1,50 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, Sum
+
+from BusinessDirectory.models import (
+    BusinessListing, BusinessListingPopularity, BusinessListingRating, top_rated_cache
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuilds the popularity ranking of every business listing from its ratings, a chunk of listings "
+        "at a time. Ratings are tracked incrementally as they change, so this only needs to run periodically, "
+        "to repair drift from bulk writes that bypass signals."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        last_id, refreshed = 0, 0
+        while True:
+            listing_ids = list(
+                BusinessListing.objects.filter(pk__gt=last_id).order_by('pk').values_list('pk', flat=True)[:options['chunk_size']]
+            )
+            if not listing_ids:
+                break
+            with transaction.atomic():
+                rankings = [
+                    BusinessListingPopularity(
+                        listing_id=row['listing'], category_id=row['listing__category'],
+                        rating_count=row['count'], rating_sum=row['total'], rating_avg=row['total'] / row['count'],
+                        score=BusinessListingPopularity.score_for(row['count'], row['total'])
+                    )
+                    for row in BusinessListingRating.objects.filter(listing__in=listing_ids).order_by().values(
+                        'listing', 'listing__category'
+                    ).annotate(count=Count('id'), total=Sum('value'))
+                ]
+                BusinessListingPopularity.objects.filter(listing__in=listing_ids).exclude(
+                    listing__in=[ranking.listing_id for ranking in rankings]
+                ).delete()
+                BusinessListingPopularity.objects.bulk_create(
+                    rankings, update_conflicts=True, unique_fields=['listing'],
+                    update_fields=['category', 'rating_count', 'rating_sum', 'rating_avg', 'score', 'updated_at']
+                )
+            last_id = listing_ids[-1]
+            refreshed += len(listing_ids)
+            self.stdout.write(f'Refreshed the popularity of {refreshed} listings')
+        top_rated_cache.invalidate('feed')
+        self.stdout.write(self.style.SUCCESS(f'Done, {refreshed} listings refreshed.'))
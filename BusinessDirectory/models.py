@@ -1,10 +1,14 @@
 from django.db import models
+from django.db.models import ExpressionWrapper, F, Value
+from django.db.models.functions import Cast, NullIf
+from helpers.cache import VersionedCache
 from helpers.models import TimestampsModel
 from django.core.validators import MinValueValidator, MaxValueValidator
 from django.core.exceptions import ValidationError
 from django.utils.translation import gettext_lazy as _
 from django.contrib.auth import get_user_model
 from helpers.fields import ValidatedImageField
+from helpers import search
 
 User = get_user_model()
 
@@ -81,7 +85,10 @@ class BusinessListing(TimestampsModel):
     )
     name = models.CharField(max_length=255)
     description = models.TextField()
-    cover_image = ValidatedImageField(upload_to='listings/cover_images', null=True, blank=True)
+    cover_image = ValidatedImageField(
+        upload_to='listings/cover_images', null=True, blank=True, variants_field='cover_image_variants'
+    )
+    cover_image_variants = models.CharField(max_length=100, blank=True, editable=False)
     country = models.CharField(max_length=255)
     province = models.CharField(max_length=255)
     city = models.CharField(max_length=255)
@@ -108,6 +115,13 @@ class BusinessListing(TimestampsModel):
         return self.name
 
 
+search.register(
+    BusinessListing,
+    {'name': 'A', 'city': 'B', 'province': 'B', 'country': 'C', 'description': 'C', 'phone_number': 'D'},
+    fuzzy_fields=('city',)
+)
+
+
 class BusinessListingRating(TimestampsModel):
     user = models.ForeignKey(
         User, on_delete=models.CASCADE, related_name="listing_ratings"
@@ -119,6 +133,80 @@ class BusinessListingRating(TimestampsModel):
         default=5, validators=[MinValueValidator(1), MaxValueValidator(5)]
     )
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # the value counted in the listing's popularity
+        instance._aggregated_value = instance.__dict__.get('value')
+        return instance
+
+
+class BusinessListingPopularityQueryset(models.query.QuerySet):
+    def add_ratings(self, count, total):
+        """
+        Adds `count` ratings summing to `total` (negative to take ratings away) to the listings in
+        the queryset, rescoring them in the same single update.
+        """
+        rating_count, rating_sum = F('rating_count') + count, F('rating_sum') + total
+        return self.update(
+            rating_count=rating_count,
+            rating_sum=rating_sum,
+            rating_avg=Cast(rating_sum, models.FloatField()) / NullIf(rating_count, 0),
+            score=BusinessListingPopularity.score_expression(rating_count, rating_sum),
+        )
+
+
+class BusinessListingPopularity(models.Model):
+    """
+    Precomputed rating aggregates of rated listings, ranking them by Bayesian `score` (popular) and by plain
+    `rating_avg` (top rated). Kept up to date as ratings are saved and deleted (see BusinessDirectory.signals)
+    and rebuilt by the `refresh_listing_popularity` management command.
+    """
+    # the Bayesian prior: every listing starts as if it had PRIOR_WEIGHT ratings of PRIOR_MEAN,
+    # so a single 5-star rating doesn't outrank a hundred 4-star ones
+    PRIOR_MEAN = 3.0
+    PRIOR_WEIGHT = 5
+
+    listing = models.OneToOneField(
+        BusinessListing, primary_key=True, on_delete=models.CASCADE, related_name='popularity'
+    )
+    # denormalized from the listing, for the per-category top rated feed
+    category = models.ForeignKey(
+        BusinessListingCategory, on_delete=models.CASCADE, related_name='listing_popularities'
+    )
+    rating_count = models.PositiveIntegerField(default=0)
+    rating_sum = models.PositiveIntegerField(default=0)
+    rating_avg = models.FloatField(null=True, blank=True)
+    score = models.FloatField(default=PRIOR_MEAN)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    objects = models.manager.BaseManager.from_queryset(BusinessListingPopularityQueryset)()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['-score', '-listing'], name='listing_popularity_score_idx'),
+            models.Index(fields=['-rating_avg', '-listing'], name='listing_popularity_avg_idx'),
+            models.Index(fields=['category', '-rating_avg', '-listing'], name='listing_popularity_cat_avg_idx'),
+        ]
+
+    @classmethod
+    def score_expression(cls, rating_count, rating_sum):
+        return ExpressionWrapper(
+            (Value(cls.PRIOR_MEAN * cls.PRIOR_WEIGHT) + rating_sum) / (Value(float(cls.PRIOR_WEIGHT)) + rating_count),
+            output_field=models.FloatField()
+        )
+
+    @classmethod
+    def score_for(cls, rating_count, rating_sum):
+        return (cls.PRIOR_MEAN * cls.PRIOR_WEIGHT + rating_sum) / (cls.PRIOR_WEIGHT + rating_count)
+
+    def __str__(self):
+        return f"{self.listing} scores {self.score:.2f} from {self.rating_count} ratings"
+
+
+# responses of the top rated listings feed, invalidated whenever a rating changes
+top_rated_cache = VersionedCache('business-listings-top-rated', timeout=300)
+
 
 class BusinessListingImage(TimestampsModel):
     image = models.ImageField(upload_to="business_listing_images")
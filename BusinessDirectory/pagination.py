@@ -1,5 +1,6 @@
 from rest_framework.pagination import PageNumberPagination
 from rest_framework.response import Response
+from helpers.pagination import EstimatedCountPaginator
 
 
 DEFAULT_PAGE = 1
@@ -13,6 +14,8 @@ class ListingPagination(PageNumberPagination):
     page = DEFAULT_PAGE
     page_size = DEFAULT_PAGE_SIZE
     page_size_query_param = 'page_size'
+    # exact counts for small results, planner estimates past `exact_count_threshold`, cached per filter
+    django_paginator_class = EstimatedCountPaginator
     
     def get_total_pages(self):
               """
@@ -35,14 +38,19 @@ class ListingPagination(PageNumberPagination):
             Response: Paginated response including count, total pages, current
             page,and results.
         """
+        count = self.page.paginator.count
         return Response({
-            'total': self.page.paginator.count,
+            'total': count,
             'page': int(self.request.GET.get('page', DEFAULT_PAGE)),
             'page_size': int(self.request.GET.get('page_size', self.page_size)),
-            'count': self.page.paginator.count,
+            'count': count,
+            'count_is_estimate': self.page.paginator.count_is_estimate,
             'num_pages': self.page.paginator.num_pages,
             'total_pages': self.get_total_pages(),
             'current_page': self.page.number,
+            # the way to tell whether there are more pages when the count is an estimate
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
             'results': data
         })
         
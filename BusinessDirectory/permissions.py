@@ -4,16 +4,23 @@ from rest_framework import permissions
 class IsVendorVerified(permissions.BasePermission):
     """
     Custom permission to check if the user is in the vendor table and is verified.
-    Allows access if the user is authenticated and has a related vendor instance that is verified.
+    Allows reads to any authenticated user, and writes if the user has a related vendor instance that is approved.
     """
     def has_permission(self, request, view):
         """
-        Check if the user is authenticated and has a verified vendor profile.
+        Check if the user is authenticated and, for unsafe methods, has an approved vendor profile.
         Args:
             request: Request instance.
             view: View instance.
         Returns:
-            bool: True if the user is authenticated and has a verified vendor profile, False otherwise.
+            bool: True if the user is authenticated and may read, or has an approved vendor profile, False otherwise.
         """
-        return request.user.is_authenticated and hasattr(request.user, 'vendor') and request.user.vendor.is_verified
+        if not request.user.is_authenticated:
+            return False
+        if request.method in permissions.SAFE_METHODS:
+            return True
+        return (
+            hasattr(request.user, 'business_listing_vendor_profile')
+            and request.user.business_listing_vendor_profile.is_approved
+        )
         
\ No newline at end of file
@@ -1,4 +1,5 @@
 from rest_framework import serializers
+from helpers.fields import ImageVariantsField
 from .models import (
     BusinessListingCategory,
     BusinessListingVendor,
@@ -52,6 +53,22 @@ class BusinessListingFileSerializer(serializers.ModelSerializer):
         return value
 
 
+class BusinessListingMediaSerializer(serializers.Serializer):
+    """
+    Validates the `images` and `files` uploaded along with a new listing, before any of them is stored
+    """
+    images = serializers.ListField(child=serializers.ImageField(), required=False, default=list)
+    files = serializers.ListField(child=serializers.FileField(), required=False, default=list)
+
+    def validate_files(self, value):
+        max_size = 5 * 1024 * 1024  # 5MB in bytes
+
+        if any(file.size > max_size for file in value):
+            raise serializers.ValidationError("File size should not exceed 5MB.")
+
+        return value
+
+
 class BusinessListingSocialSerializer(serializers.ModelSerializer):
     class Meta:
         model = BusinessListingSocial
@@ -78,6 +95,7 @@ class BusinessListingRequestSerializer(serializers.ModelSerializer):
 
 class BusinessListingSerializer(serializers.ModelSerializer):
     vendor = serializers.HiddenField(default=serializers.CurrentUserDefault())
+    cover_image_variants = ImageVariantsField(source='cover_image')
 
     class Meta:
         model = BusinessListing
@@ -0,0 +1,46 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from .models import (
+    BusinessListing, BusinessListingCategory, BusinessListingPopularity, BusinessListingRating, top_rated_cache
+)
+
+
+@receiver(post_save, sender=BusinessListingRating)
+def add_rating_to_listing_popularity(sender, instance, created, **kwargs):
+    popularity = BusinessListingPopularity.objects.filter(pk=instance.listing_id)
+    if created:
+        category_id = BusinessListing.objects.filter(pk=instance.listing_id).values_list('category', flat=True).get()
+        BusinessListingPopularity.objects.bulk_create(
+            [BusinessListingPopularity(listing_id=instance.listing_id, category_id=category_id)], ignore_conflicts=True
+        )
+        popularity.add_ratings(1, instance.value)
+        top_rated_cache.invalidate('feed')
+    elif getattr(instance, '_aggregated_value', None) not in (None, instance.value):
+        popularity.add_ratings(0, instance.value - instance._aggregated_value)
+        top_rated_cache.invalidate('feed')
+    instance._aggregated_value = instance.value
+
+
+@receiver(post_delete, sender=BusinessListingRating)
+def remove_rating_from_listing_popularity(sender, instance, **kwargs):
+    BusinessListingPopularity.objects.filter(pk=instance.listing_id).add_ratings(
+        -1, -getattr(instance, '_aggregated_value', instance.value)
+    )
+    top_rated_cache.invalidate('feed')
+
+
+@receiver(post_save, sender=BusinessListing)
+def sync_listing_popularity_category(sender, instance, created, **kwargs):
+    if not created:
+        BusinessListingPopularity.objects.filter(pk=instance.pk).exclude(category=instance.category_id).update(
+            category=instance.category_id
+        )
+
+
+@receiver(post_save, sender=BusinessListing)
+@receiver(post_delete, sender=BusinessListing)
+@receiver(post_save, sender=BusinessListingCategory)
+@receiver(post_delete, sender=BusinessListingCategory)
+def invalidate_top_rated_feed(sender, **kwargs):
+    "The feed serializes the listings themselves, so any edit to one, or to a category, makes it stale"
+    top_rated_cache.invalidate('feed')
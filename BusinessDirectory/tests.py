@@ -1,11 +1,26 @@
-from django.test import TestCase
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import DatabaseError, connection
 from django.conf import settings 
 from django.urls import reverse
 from django.contrib.auth import get_user_model
-from rest_framework.test import APIClient
+from rest_framework.test import APIClient, APIRequestFactory
+from rest_framework.request import Request
+from django.core.cache import cache
+from django.core.management import call_command
+from io import StringIO
+from helpers.pagination import EstimatedCountPaginator
+from .pagination import ListingPagination
+from .views import BusinessListingListCreateView, PopularBusinessListingView, TopRatedListingsAPIView
+from helpers import search
 from rest_framework import status
+from rest_framework.exceptions import NotFound
 from PIL import Image
-import tempfile, os
+import base64, json, tempfile, os, shutil
+from io import BytesIO
+from unittest import skipUnless
+from unittest.mock import patch
 from .models import *
 
 User = get_user_model()
@@ -14,6 +29,7 @@ User = get_user_model()
 class BusinessListing_TopRated_UserListings_ListingDetail_TestCase(TestCase):
 
     def setUp(self):
+        cache.clear()
         self.client = APIClient()
         self.user = User.objects.create_user(email='testvendor@example.com', password='testpass')
         self.business_listing_vendor = BusinessListingVendor.objects.create(
@@ -99,17 +115,127 @@ class BusinessListing_TopRated_UserListings_ListingDetail_TestCase(TestCase):
         url = reverse('BusinessDirectory:top-rated-listings')
         response = self.client.get(url)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertEqual(len(response.data), 3)
+        self.assertEqual(len(response.data['results']), 3)
         self.assertTupleEqual(
-            tuple([item['id'] for item in response.data]), 
+            tuple([item['id'] for item in response.data['results']]), 
             (self.listing2.id, self.listing1.id, self.listing3.id)
         )
 
+    def test_popular_listings(self):
+        self.client.force_authenticate(user=self.user)
+        url = reverse('BusinessDirectory:popular-business-listings')
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertListEqual(
+            [item['id'] for item in response.data['results']],
+            [self.listing2.id, self.listing1.id, self.listing3.id]
+        )
+        self.assertEqual(response.data['results'][0]['name'], 'Test Business 2')
+
+    def test_popular_listings_pages(self):
+        class SmallPagePagination(PopularBusinessListingView.pagination_class):
+            page_size = 2
+
+        queryset = PopularBusinessListingView().get_queryset()
+        paginator = SmallPagePagination()
+        first_page = paginator.paginate_queryset(queryset, Request(APIRequestFactory().get('/')))
+        next_link = paginator.get_paginated_response([]).data['next']
+        second_page = SmallPagePagination().paginate_queryset(queryset, Request(APIRequestFactory().get(next_link)))
+        self.assertListEqual(first_page + second_page, [self.listing2, self.listing1, self.listing3])
+
+    def test_popular_listings_crafted_cursor(self):
+        self.client.force_authenticate(user=self.user)
+        url = reverse('BusinessDirectory:popular-business-listings')
+        for values in ([{'a': 1}, 1], ['high', 1], [None, 1], [1.0, 'x'], {'v': 1}):
+            cursor = base64.urlsafe_b64encode(json.dumps({'v': values}).encode()).decode()
+            response = self.client.get(url, {'cursor': cursor})
+            self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_popularity_weighs_rating_counts(self):
+        # four 4-star ratings outweigh a single 5-star one
+        BusinessListingRating.objects.bulk_create([
+            BusinessListingRating(listing=self.listing1, user=self.user, value=4) for _ in range(3)
+        ])
+        call_command('refresh_listing_popularity', stdout=StringIO())
+        popularity = BusinessListingPopularity.objects.get(listing=self.listing1)
+        self.assertEqual((popularity.rating_count, popularity.rating_sum), (4, 16))
+        self.assertGreater(popularity.score, self.listing2.popularity.score)
+
+    def test_popularity_follows_rating_changes(self):
+        self.rating1.value = 2
+        self.rating1.save()
+        self.listing1.popularity.refresh_from_db()
+        self.assertEqual((self.listing1.popularity.rating_sum, self.listing1.popularity.score), (2, 17 / 6))
+
+        BusinessListingRating.objects.get(pk=self.rating1.pk).delete()
+        self.listing1.popularity.refresh_from_db()
+        self.assertEqual((self.listing1.popularity.rating_count, self.listing1.popularity.score), (0, 3.0))
+
+        self.client.force_authenticate(user=self.user)
+        response = self.client.get(reverse('BusinessDirectory:popular-business-listings'))
+        self.assertNotIn(self.listing1.id, [item['id'] for item in response.data['results']])
+
     def test_top_rated_listings_no_data(self):
         BusinessListingRating.objects.all().delete()
         url = reverse('BusinessDirectory:top-rated-listings')
         response = self.client.get(url)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertListEqual(response.data['results'], [])
+
+    def test_top_rated_listings_by_category(self):
+        category = BusinessListingCategory.objects.create(name='Food')
+        BusinessListingRequest.objects.filter(listing=self.listing3).update(listing_category=category)
+        self.listing3.refresh_from_db()
+        self.listing3.category = category
+        self.listing3.save()
+        url = reverse('BusinessDirectory:category-top-rated-listings', kwargs={'category_id': self.listing3.category_id})
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertListEqual([item['id'] for item in response.data['results']], [self.listing3.id])
+
+    def test_top_rated_listings_cached_until_ratings_change(self):
+        url = reverse('BusinessDirectory:top-rated-listings')
+        self.client.get(url)
+        with self.assertNumQueries(0):
+            self.client.get(url)
+
+        for _ in range(4):
+            BusinessListingRating.objects.create(listing=self.listing3, user=self.user, value=5)
+        response = self.client.get(url)
+        # (1 + 4 * 5) / 5 now ranks above listing1's single 4
+        self.assertListEqual(
+            [item['id'] for item in response.data['results']], [self.listing2.id, self.listing3.id, self.listing1.id]
+        )
+
+    def test_top_rated_listings_cached_by_cursor_only(self):
+        url = reverse('BusinessDirectory:top-rated-listings')
+        self.client.get(url)
+        with self.assertNumQueries(0):
+            response = self.client.get(url, {'page_size': 1, 'anything': 'else'})
+        self.assertEqual(len(response.data['results']), 3)
+
+        with patch.object(TopRatedListingsAPIView.pagination_class, 'page_size', 1):
+            cache.clear()
+            response = self.client.get(url, {'anything': 'else'})
+        self.assertNotIn('anything', response.data['next'])
+        self.assertEqual(self.client.get(url, {'cursor': 'not-a-cursor'}).status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_top_rated_listings_invalidated_by_listing_changes(self):
+        url = reverse('BusinessDirectory:top-rated-listings')
+        self.client.get(url)
+        self.listing2.name = 'Renamed Business'
+        self.listing2.save()
+        self.assertEqual(self.client.get(url).data['results'][0]['name'], 'Renamed Business')
+
+        self.listing2.delete()
+        self.assertListEqual(
+            [item['id'] for item in self.client.get(url).data['results']], [self.listing1.id, self.listing3.id]
+        )
+
+        self.client.get(url)
+        BusinessListingCategory.objects.create(name='Other')
+        with self.assertNumQueries(1):
+            self.client.get(url)
 
     def test_user_listings(self):
         self.client.force_authenticate(user=self.user)
@@ -130,6 +256,224 @@ class BusinessListing_TopRated_UserListings_ListingDetail_TestCase(TestCase):
         self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
 
 
+class ListingPaginationTestCase(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(email='testvendor@example.com', password='testpass')
+        self.vendor = BusinessListingVendor.objects.create(user=self.user, email=self.user.email, id_type='NIN')
+        self.category = BusinessListingCategory.objects.create(name='Finance')
+        for i in range(5):
+            self.create_listing(i)
+
+    def create_listing(self, i):
+        return BusinessListing.objects.create(
+            vendor=self.vendor,
+            listing_request=BusinessListingRequest.objects.create(
+                user=self.user, listing_category=self.category, id_type='type_1', is_approved=True
+            ),
+            category=self.category,
+            name=f'Test Business {i}',
+            description=f'Description for Test Business {i}',
+            country='Test Country',
+            province='Test Province',
+            city='Test City',
+            phone_number='123456789',
+            physical_address=f'Test Address {i}',
+        )
+
+    def paginate(self, paginator_class=ListingPagination, page=1):
+        paginator = paginator_class()
+        request = Request(APIRequestFactory().get('/', {'page_size': 2, 'page': page}))
+        rows = paginator.paginate_queryset(BusinessListing.objects.order_by('-id'), request)
+        return paginator.get_paginated_response([listing.id for listing in rows]).data
+
+    def test_exact_count_below_threshold(self):
+        data = self.paginate()
+        self.assertEqual(data['count'], 5)
+        self.assertEqual(data['total_pages'], 3)
+        self.assertFalse(data['count_is_estimate'])
+
+    def test_count_above_threshold_without_estimates(self):
+        class SmallThresholdPaginator(EstimatedCountPaginator):
+            exact_count_threshold = 2
+
+        class SmallThresholdPagination(ListingPagination):
+            django_paginator_class = SmallThresholdPaginator
+
+        # sqlite has no planner estimate to offer, so the count stays exact
+        data = self.paginate(SmallThresholdPagination)
+        self.assertEqual(data['count'], 5)
+        self.assertFalse(data['count_is_estimate'])
+
+    def test_count_cached_per_filter(self):
+        self.paginate()
+        # only the page itself is queried the second time round
+        with self.assertNumQueries(1):
+            self.assertEqual(self.paginate()['count'], 5)
+
+        BusinessListing.objects.filter(name='Test Business 0').delete()
+        # still the cached count until it expires
+        self.assertEqual(self.paginate()['count'], 5)
+        cache.clear()
+        self.assertEqual(self.paginate()['count'], 4)
+
+    def test_stale_count_does_not_bound_pages(self):
+        self.assertEqual(self.paginate()['count'], 5)
+        for i in range(5, 7):
+            self.create_listing(i)
+
+        # the cached count still says 3 pages of 2, but the 7th listing is on a 4th one
+        third_page = self.paginate(page=3)
+        self.assertEqual(third_page['count'], 5)
+        self.assertEqual(len(third_page['results']), 2)
+        self.assertIsNotNone(third_page['next'])
+        fourth_page = self.paginate(page=4)
+        self.assertEqual(len(fourth_page['results']), 1)
+        self.assertIsNone(fourth_page['next'])
+        with self.assertRaises(NotFound):
+            self.paginate(page=5)
+
+
+class BusinessListingSearchTestCase(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(email='testvendor@example.com', password='testpass')
+        self.vendor = BusinessListingVendor.objects.create(user=self.user, email=self.user.email, id_type='NIN')
+        self.category = BusinessListingCategory.objects.create(name='Finance')
+        self.bakery = self.create_listing('Golden Bakery', 'Fresh bread every morning', 'Lagos')
+        self.cafe = self.create_listing('Corner Cafe', 'Coffee and bakery treats', 'Abuja')
+        self.garage = self.create_listing('Quick Garage', 'Car repairs', 'Lagos')
+
+    def create_listing(self, name, description, city):
+        return BusinessListing.objects.create(
+            vendor=self.vendor,
+            listing_request=BusinessListingRequest.objects.create(
+                user=self.user, listing_category=self.category, id_type='type_1', is_approved=True
+            ),
+            category=self.category,
+            name=name,
+            description=description,
+            country='Nigeria',
+            province='Test Province',
+            city=city,
+            phone_number='123456789',
+            physical_address='Test Address',
+        )
+
+    def search(self, terms):
+        request = Request(APIRequestFactory().get('/', {'search': terms}))
+        queryset = search.SearchIndexFilter().filter_queryset(
+            request, BusinessListing.objects.all(), BusinessListingListCreateView()
+        )
+        return list(queryset)
+
+    def test_name_matches_rank_above_description_matches(self):
+        self.assertListEqual(self.search('bakery'), [self.bakery, self.cafe])
+
+    def test_terms_match_across_fields(self):
+        self.assertListEqual(self.search('lagos garage'), [self.garage])
+        self.assertListEqual(self.search('repair'), [self.garage])
+
+    def test_search_follows_saved_changes(self):
+        self.garage.city = 'Ibadan'
+        self.garage.save()
+        self.assertListEqual(self.search('lagos'), [self.bakery])
+
+    def test_without_search_terms(self):
+        self.assertEqual(len(self.search('')), 3)
+
+    @skipUnless(connection.vendor == 'sqlite', 'checks the FTS5 table of the sqlite backend')
+    def test_reinstall_follows_field_changes(self):
+        index = search.get_index(BusinessListing)
+        names_only = search.SQLiteSearchBackend(BusinessListing, {'name': 'A'})
+        try:
+            names_only.install(connection)
+            self.assertListEqual(list(names_only.search(BusinessListing.objects.all(), 'bakery')), [self.bakery])
+        finally:
+            index.backend(connection.alias).install(connection)
+        self.assertListEqual(self.search('bakery'), [self.bakery, self.cafe])
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class BusinessListingCreateViewTestCase(TestCase):
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(email='testvendor@example.com', password='testpass')
+        BusinessListingVendor.objects.create(user=self.user, email=self.user.email, id_type='NIN', is_approved=True)
+        self.category = BusinessListingCategory.objects.create(name='Finance')
+        self.client.force_authenticate(user=self.user)
+
+    def tearDown(self):
+        shutil.rmtree(settings.MEDIA_ROOT, ignore_errors=True)
+
+    def listing_data(self, images=0, files=0):
+        listing_request = BusinessListingRequest.objects.create(
+            user=self.user, listing_category=self.category, id_type='type_1', is_approved=True
+        )
+        data = {
+            'listing_request': listing_request.id,
+            'category': self.category.id,
+            'name': 'Test Business',
+            'description': 'Description for Test Business',
+            'country': 'Test Country',
+            'province': 'Test Province',
+            'city': 'Test City',
+            'phone_number': '123456789',
+            'physical_address': 'Test Address',
+            'images': [],
+            'files': [SimpleUploadedFile(f'file{i}.txt', b'brochure') for i in range(files)],
+        }
+        for i in range(images):
+            image = BytesIO()
+            Image.new('RGB', (10, 10)).save(image, 'PNG')
+            data['images'].append(SimpleUploadedFile(f'image{i}.png', image.getvalue(), content_type='image/png'))
+        return data
+
+    def post(self, data):
+        return self.client.post(reverse('BusinessDirectory:business-listings'), data, format='multipart')
+
+    def test_create_listing_with_media(self):
+        response = self.post(self.listing_data(images=3, files=2))
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        listing = BusinessListing.objects.get()
+        self.assertEqual(listing.listing_images.count(), 3)
+        self.assertEqual(listing.listing_files.count(), 2)
+        for listing_image in listing.listing_images.all():
+            self.assertTrue(listing_image.image.storage.exists(listing_image.image.name))
+
+    def test_query_count_independent_of_uploads(self):
+        data = self.listing_data(images=1, files=1)
+        with CaptureQueriesContext(connection) as few:
+            self.assertEqual(self.post(data).status_code, status.HTTP_201_CREATED)
+        data = self.listing_data(images=8, files=4)
+        with CaptureQueriesContext(connection) as many:
+            self.assertEqual(self.post(data).status_code, status.HTTP_201_CREATED)
+        self.assertEqual(len(few.captured_queries), len(many.captured_queries))
+
+    def test_invalid_image_stores_nothing(self):
+        data = self.listing_data(images=2)
+        data['images'].append(SimpleUploadedFile('image.png', b'not an image', content_type='image/png'))
+        response = self.post(data)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(BusinessListing.objects.exists())
+        self.assertFalse(os.path.exists(os.path.join(settings.MEDIA_ROOT, 'business_listing_images')))
+
+    def test_failed_insert_removes_stored_files(self):
+        with patch.object(BusinessListingFile.objects, 'bulk_create', side_effect=DatabaseError):
+            with self.assertRaises(DatabaseError):
+                self.post(self.listing_data(images=2, files=1))
+        self.assertFalse(BusinessListing.objects.exists())
+        self.assertListEqual(os.listdir(os.path.join(settings.MEDIA_ROOT, 'business_listing_images')), [])
+
+    def test_unapproved_vendor_cannot_create(self):
+        BusinessListingVendor.objects.update(is_approved=False)
+        self.client.force_authenticate(user=User.objects.get(pk=self.user.pk))
+        response = self.post(self.listing_data())
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+
 class BusinessListingRequestCreateViewTestCase(TestCase):
 
     def setUp(self):
@@ -44,6 +44,10 @@ urlpatterns = [
         TopRatedListingsAPIView.as_view(),
         name='top-rated-listings'
     ),
+    path('listings/top-rated/category/<int:category_id>/',
+        TopRatedListingsAPIView.as_view(),
+        name='category-top-rated-listings'
+    ),
     path('me/listings/', 
          UserListingsView.as_view(), 
          name='user-listings'
@@ -1,47 +1,65 @@
+import hashlib
+import json
 from rest_framework import generics, filters, status
 from drf_yasg.utils import swagger_auto_schema
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from .permissions import IsVendorVerified
-from django.db.models import Count, Avg
+from django.db.models import Count, F
 from .pagination import ListingPagination
+from helpers import search
+from helpers.pagination import PaginatorGenerator, KeysetPagination
+from helpers.media import store_uploads, delete_stored
+from helpers.uploadhandler import UploadSizeLimitMixin
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db import transaction
+from rest_framework import exceptions
 from .serializers import *
 from .models import *
 from drf_yasg.utils import swagger_auto_schema
 from .permissions import IsVendorVerified
-from django.db.models import Count, Avg, Max
-from django.http import Http404
+from django.db.models import Count, Max
 from rest_framework.permissions import IsAuthenticated
 
 #Endpoint to Retrieve top-rated listings based on average rating
 @swagger_auto_schema(tags=['BusinessDirectory'])
 class TopRatedListingsAPIView(generics.ListAPIView):
+    """
+    Keyset pages of the rated listings, optionally within a category, by the average rating stored in
+    `BusinessListingPopularity`. Pages are cached until a rating changes, since the endpoint is public.
+    """
     serializer_class = BusinessListingSerializer
     permission_classes = []
+    pagination_class = PaginatorGenerator()(
+        _page_size=10, _paginator_class=KeysetPagination, ordering=('-avg_rating', '-id')
+    )
 
     @swagger_auto_schema(tags=['BusinessDirectory'])
     def get(self, request, *args, **kwargs):
         return super().get(request, *args, **kwargs)
 
     def get_queryset(self):
-        return BusinessListing.objects.all().annotate(avg_rating=Avg('ratings__value')).order_by('-avg_rating')
+        queryset = BusinessListing.objects.filter(popularity__rating_count__gt=0)
+        if 'category_id' in self.kwargs:
+            queryset = queryset.filter(popularity__category=self.kwargs['category_id'])
+        return queryset.annotate(avg_rating=F('popularity__rating_avg'))
 
     def list(self, request, *args, **kwargs):
-        try:
-            queryset = self.get_queryset()
-            serializer = self.get_serializer(queryset, many=True)
-            return Response(serializer.data)
-
-        except BusinessListing.DoesNotExist:
-            raise Http404("No top-rated listings found")
-
-        except Exception as e:
-            error_message = str(e)
-            response = {
-                'status_message': 'error',
-                'message': 'An error occurred: ' + error_message,
-            }
-            return Response(response, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        # pages are cached and linked by the URL's path (which holds the category) and the decoded cursor alone,
+        # so other query parameters neither make new cache entries nor end up in cached links
+        base_url = request.build_absolute_uri(request.path)
+        queryset = self.filter_queryset(self.get_queryset())
+        values, reverse = self.paginator.decode_cursor(
+            queryset, request.query_params.get(self.paginator.cursor_query_param)
+        )
+        cache_key = hashlib.sha1(json.dumps([base_url, values, reverse], default=str).encode()).hexdigest()
+        data = top_rated_cache.get('feed', cache_key)
+        if data is None:
+            page = self.paginate_queryset(queryset)
+            self.paginator.base_url = base_url
+            data = self.get_paginated_response(self.get_serializer(page, many=True).data).data
+            top_rated_cache.set('feed', cache_key, data)
+        return Response(data)
         
 
 #Endpoint to Retrieve user listings
@@ -97,7 +115,7 @@ class BusinessListingVendorRequestCreateView(generics.CreateAPIView):
         serializer.save(user=self.request.user, is_approved=False)
 
 
-class BusinessListingListCreateView(generics.ListCreateAPIView):
+class BusinessListingListCreateView(UploadSizeLimitMixin, generics.ListCreateAPIView):
     """
     API view for listing and creating business listings.
     - GET method: Retrieves a paginated list of business listings.
@@ -108,7 +126,10 @@ class BusinessListingListCreateView(generics.ListCreateAPIView):
 
     queryset = BusinessListing.objects.all()
     serializer_class = BusinessListingSerializer
-    filter_backends = [filters.SearchFilter, filters.OrderingFilter]
+    # the limit `BusinessListingMediaSerializer` holds the attached files to
+    upload_max_sizes = {'files': 5 * 1024 * 1024}
+    # indexed, ranked search through `helpers.search`; `search_fields` only documents what it covers
+    filter_backends = [search.SearchIndexFilter, filters.OrderingFilter]
     search_fields = [
         "name",
         "description",
@@ -118,7 +139,7 @@ class BusinessListingListCreateView(generics.ListCreateAPIView):
         "phone_number",
     ]
     ordering_fields = ["name", "created_at"]
-    ordering = ["-created_at"]
+    # no default `ordering`: unsearched listings keep the model's -created_at, searches their rank
     pagination_class = ListingPagination
     permission_classes = [IsVendorVerified]
 
@@ -155,58 +176,55 @@ class BusinessListingListCreateView(generics.ListCreateAPIView):
         Args:
             serializer: BusinessListingSerializer instance, responsible for validating and saving the main listing details.
         Raises:
-            rest_framework.exceptions.ValidationError: If validation fails for the main listing details.
-        Creates a new BusinessListing and associates images and files with it.
+            rest_framework.exceptions.ValidationError: If validation fails for the listing or its uploads.
+        Creates a new BusinessListing, then stores its images and files in parallel and records them with one
+        `bulk_create` each in the same transaction, so a post costs the same queries however many files it has.
         """
-        images_data = self.request.FILES.getlist("images", [])
-        files_data = self.request.FILES.getlist("files", [])
-
-        # Save associated images
-        for image_data in images_data:
-            image_serializer = BusinessListingImageSerializer(
-                data={"image": image_data, "listing": business_listing.id}
-            )
-            image_serializer.is_valid(raise_exception=True)
-            image_serializer.save()
-
-        # save associated files
-        for file_data in files_data:
-            file_serializer = BusinessListingFileSerializer(
-                data={"file": file_data, "listing": business_listing.id}
-            )
-            file_serializer.is_valid(raise_exception=True)
-            file_serializer.save()
-
-        # save an instance of business listing
-        serializer.is_valid(raise_exception=True)
-        business_listing = serializer.save(vendor_id=self.request.user)
+        media = BusinessListingMediaSerializer(data=self.request.FILES)
+        media.is_valid(raise_exception=True)
+
+        images, files = [], []
+        try:
+            with transaction.atomic():
+                business_listing = serializer.save(vendor=self.request.user.business_listing_vendor_profile)
+                images = store_uploads(
+                    BusinessListingImage, 'image', media.validated_data['images'], listing=business_listing
+                )
+                files = store_uploads(
+                    BusinessListingFile, 'file', media.validated_data['files'], listing=business_listing
+                )
+                BusinessListingImage.objects.bulk_create(images)
+                BusinessListingFile.objects.bulk_create(files)
+        except Exception as error:
+            # the rows were rolled back, which would leave their stored files orphaned
+            delete_stored(images, 'image')
+            delete_stored(files, 'file')
+            if isinstance(error, DjangoValidationError):
+                raise exceptions.ValidationError(error.messages) from error
+            raise
 
     @swagger_auto_schema(tags=['BusinessDirectory'])
     def post(self, request, *args, **kwargs):
-        serializer = self.get_serializer(data=request.data)
-        serializer.is_valid(raise_exception=True)
-        try:
-            self.perform_create(serializer)
-        except Exception as response:
-            return response
-        headers = self.get_success_headers(serializer.data)
-        return Response(
-            serializer.data, status=status.HTTP_201_CREATED, headers=headers
+        return super().post(request, *args, **kwargs)
+
+class PopularBusinessListingView(generics.ListAPIView):
+    """
+    Retrieve popular business listings, ranked by the Bayesian-weighted score of their ratings
+    precomputed in `BusinessListingPopularity`
+    """
+    serializer_class = BusinessListingSerializer
+    pagination_class = PaginatorGenerator()(
+        _page_size=10, _paginator_class=KeysetPagination, ordering=('-popularity_score', '-id')
+    )
+
+    def get_queryset(self):
+        return BusinessListing.objects.filter(popularity__rating_count__gt=0).annotate(
+            popularity_score=F('popularity__score')
         )
 
-class PopularBusinessListingView(APIView):
     @swagger_auto_schema(tags=['BusinessDirectory'])
-    def get(self, request, format=None):
-        """
-        Retrieve popular business listings
-        popularity is based on the number of ratings
-        """
-        popular_businesses = BusinessListingRating.objects.values(
-            "listing").annotate(avg_rating=Avg("value")
-            ).order_by("-avg_rating")
-
-        serializer = BusinessListingSerializer(popular_businesses, many=True)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+    def get(self, request, *args, **kwargs):
+        return super().get(request, *args, **kwargs)
 
 class BusinessListingCategoryListView(APIView):
     @swagger_auto_schema(tags=['BusinessDirectory'])
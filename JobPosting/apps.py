@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class JobpostingConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'JobPosting'
+
+    def ready(self):
+        from . import signals  # noqa
@@ -0,0 +1,103 @@
+import random
+import statistics
+import time
+import uuid
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext, override_settings
+
+from JobPosting.models import Company, FreelancerProfile, JobCategory, JobOpening, JobRole, JobSkill
+
+User = get_user_model()
+
+# no cache, so that every call recomputes the skill weights
+UNCACHED = {'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}}
+
+
+def legacy_matches(freelancer, page_size):
+    "`BestMatchJobsAPIView` before `JobOpening.objects.best_matches`: every opening sharing a skill, unranked and unpaginated"
+    return list(JobOpening.objects.filter(required_skills__in=freelancer.skills.all()).distinct())
+
+
+def ranked_matches(freelancer, page_size):
+    skill_ids = freelancer.skills.values_list('pk', flat=True)
+    return list(JobOpening.objects.best_matches(skill_ids).order_by('-match_score', '-id')[:page_size])
+
+
+def uncached_ranked_matches(freelancer, page_size):
+    with override_settings(CACHES=UNCACHED):
+        return ranked_matches(freelancer, page_size)
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmarks the query count and latency of the legacy best-match query against the weighted "
+        "`JobOpening.objects.best_matches` ranking, on generated openings whose skills follow a long-tailed "
+        "popularity. All data is rolled back afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--openings', type=int, default=100000)
+        parser.add_argument('--skills', type=int, default=5000)
+        parser.add_argument('--skills-per-opening', type=int, default=5)
+        parser.add_argument('--freelancer-skills', type=int, default=10)
+        parser.add_argument('--page-size', type=int, default=10)
+        parser.add_argument('--repeat', type=int, default=10)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        random.seed(options['seed'])
+        strategies = (
+            ('legacy', legacy_matches), ('ranked, uncached', uncached_ranked_matches), ('ranked', ranked_matches)
+        )
+        with transaction.atomic():
+            skills = self.create_openings(options['openings'], options['skills'], options['skills_per_opening'])
+            freelancer = self.create_freelancer(skills, options['freelancer_skills'])
+            self.stdout.write(f"{'strategy':>18} {'queries':>8} {'median ms':>10} {'rows':>8}")
+            for name, strategy in strategies:
+                queries, latency, rows = self.measure(strategy, freelancer, options['page_size'], options['repeat'])
+                self.stdout.write(f"{name:>18} {queries:>8} {latency:>10.2f} {rows:>8}")
+            transaction.set_rollback(True)
+
+    def measure(self, strategy, freelancer, page_size, repeat):
+        # warms the skill weights' cache for the cached strategy
+        strategy(freelancer, page_size)
+        with CaptureQueriesContext(connection) as context:
+            rows = len(strategy(freelancer, page_size))
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            strategy(freelancer, page_size)
+            timings.append((time.perf_counter() - start) * 1000)
+        return len(context.captured_queries), statistics.median(timings), rows
+
+    def create_openings(self, total, skill_total, skills_per_opening):
+        company = Company.objects.create(name='Benchmark Company', employee_number_range='1-10')
+        role = JobRole.objects.create(name='Benchmark Role')
+        category = JobCategory.objects.create(name='Benchmark Category')
+        skills = JobSkill.objects.bulk_create([JobSkill(name=f'Skill {i}') for i in range(skill_total)])
+        # skill popularity falls off like 1/rank, as it does for real job ads
+        skill_weights = [1 / rank for rank in range(1, skill_total + 1)]
+        Through = JobOpening.required_skills.through
+        for offset in range(0, total, 5000):
+            openings = JobOpening.objects.bulk_create([
+                JobOpening(
+                    company=company, role=role, category=category, title=f'Opening {i}',
+                    time_commitment='full-time', presence_type='remote', experience_range='2-5'
+                ) for i in range(offset, min(offset + 5000, total))
+            ])
+            Through.objects.bulk_create([
+                Through(jobopening_id=opening.id, jobskill_id=skill.id)
+                for opening in openings
+                for skill in set(random.choices(skills, weights=skill_weights, k=skills_per_opening))
+            ])
+        return skills
+
+    def create_freelancer(self, skills, skill_total):
+        user = User.objects.create(email=f'bench-{uuid.uuid4().hex}@zionnet.bench')
+        freelancer = FreelancerProfile.objects.create(user=user, title='Benchmark Freelancer')
+        # a mix of common and rare skills
+        freelancer.skills.add(*random.sample(skills[:skill_total * 10], skill_total))
+        return freelancer
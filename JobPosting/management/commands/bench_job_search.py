@@ -0,0 +1,107 @@
+import random
+import statistics
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from rest_framework.parsers import JSONParser
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from JobPosting.models import Company, JobCategory, JobOpening, JobRole, JobSkill
+from JobPosting.views import JobSearchView
+
+WORDS = (
+    'senior', 'junior', 'backend', 'frontend', 'data', 'product', 'designer', 'engineer', 'manager', 'analyst',
+    'python', 'django', 'react', 'mobile', 'cloud', 'security', 'marketing', 'sales', 'support', 'finance',
+)
+
+SCENARIOS = {
+    'title': {'title': 'python engineer'},
+    'facets': {'category': 'Category 3', 'presence_type': 'remote', 'time_commitment': 'contract'},
+    'skills': {'skills': ['Skill 1', 'Skill 2', 'Skill 3']},
+    'everything': {'title': 'engineer', 'presence_type': 'hybrid', 'skills': ['Skill 1', 'Skill 7']},
+}
+
+
+def legacy_search(filters):
+    "`JobSearchView` before its search index, facets and pagination: every matching row, repeated per matching skill"
+    queryset = JobOpening.objects.all()
+    if filters.get('title'):
+        queryset = queryset.filter(title__icontains=filters['title'])
+    if filters.get('category'):
+        queryset = queryset.filter(category__name=filters['category'])
+    for facet in JobOpening.FACETS:
+        if facet in filters:
+            queryset = queryset.filter(**{facet: filters[facet]})
+    if filters.get('skills'):
+        queryset = queryset.filter(required_skills__name__in=filters['skills'])
+    return [job.id for job in queryset]
+
+
+def engine_search(filters):
+    request = Request(
+        APIRequestFactory().post('/', filters, format='json', SERVER_NAME=settings.ALLOWED_HOSTS[0]), parsers=[JSONParser()]
+    )
+    return [job['id'] for job in JobSearchView().post(request).data['data']]
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmarks the legacy job search query against `JobSearchView`'s first page, on generated job openings "
+        "with random titles, facets and skills. All data is rolled back afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--openings', type=int, default=1000000)
+        parser.add_argument('--skills', type=int, default=500)
+        parser.add_argument('--categories', type=int, default=20)
+        parser.add_argument('--repeat', type=int, default=5)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        random.seed(options['seed'])
+        with transaction.atomic():
+            self.create_openings(options['openings'], options['skills'], options['categories'])
+            self.stdout.write(f"{'scenario':>12} {'strategy':>8} {'queries':>8} {'median ms':>10} {'rows':>8}")
+            for scenario, filters in SCENARIOS.items():
+                for name, strategy in (('legacy', legacy_search), ('engine', engine_search)):
+                    queries, latency, rows = self.measure(strategy, filters, options['repeat'])
+                    self.stdout.write(f"{scenario:>12} {name:>8} {queries:>8} {latency:>10.2f} {rows:>8}")
+            transaction.set_rollback(True)
+
+    def measure(self, strategy, filters, repeat):
+        with CaptureQueriesContext(connection) as context:
+            rows = len(strategy(filters))
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            strategy(filters)
+            timings.append((time.perf_counter() - start) * 1000)
+        return len(context.captured_queries), statistics.median(timings), rows
+
+    def create_openings(self, total, skill_total, category_total):
+        company = Company.objects.create(name='Benchmark Company', employee_number_range='1-10')
+        role = JobRole.objects.create(name='Benchmark Role')
+        categories = JobCategory.objects.bulk_create([JobCategory(name=f'Category {i}') for i in range(category_total)])
+        skills = JobSkill.objects.bulk_create([JobSkill(name=f'Skill {i}') for i in range(skill_total)])
+        choices = {
+            'time_commitment': [value for value, _ in JobOpening.JOB_COMMITMENT_CHOICES],
+            'presence_type': [value for value, _ in JobOpening.JOB_PRESENCE_CHOICES],
+            'experience_range': [value for value, _ in JobOpening.EXPERIENCE_RANGE_CHOICES],
+        }
+        Through = JobOpening.required_skills.through
+        for offset in range(0, total, 10000):
+            openings = JobOpening.objects.bulk_create([
+                JobOpening(
+                    company=company, role=role, category=random.choice(categories),
+                    title=' '.join(random.sample(WORDS, 3)).title(),
+                    **{field: random.choice(values) for field, values in choices.items()}
+                ) for _ in range(offset, min(offset + 10000, total))
+            ])
+            Through.objects.bulk_create([
+                Through(jobopening_id=opening.id, jobskill_id=skill.id)
+                for opening in openings for skill in random.sample(skills, 3)
+            ])
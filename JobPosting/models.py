@@ -1,9 +1,16 @@
+import hashlib
+import json
+import math
+from django.core.cache import cache
 from django.db import models
+from django.db.models import Case, Count, Exists, IntegerField, OuterRef, Sum, Value, When
 from django.utils.translation import gettext_lazy as _
 from django.core.validators import MinValueValidator, MaxValueValidator
 from django.contrib.auth import get_user_model
+from helpers.cache import VersionedCache
 from helpers.fields import ValidatedImageField, ValidatedResumeFileField
 from helpers.models import TimestampsModel
+from helpers import search
 
 User = get_user_model()
 
@@ -21,7 +28,12 @@ class Company(TimestampsModel):
     name = models.CharField(_('company name'), max_length=255)
     description = models.TextField(_('company description'), null=True, blank=True)
     website = models.URLField(_('company website'), null=True, blank=True)
-    logo = ValidatedImageField(upload_to='job_posting/company/logos', null=True, blank=True)
+    logo = ValidatedImageField(
+        upload_to='job_posting/company/logos', null=True, blank=True, variants_field='logo_variants'
+    )
+    logo_variants = models.CharField(
+        _('logo variants generated from'), max_length=100, blank=True, editable=False
+    )
     country = models.CharField(_('country'), max_length=255, null=True, blank=True)
     city = models.CharField(_('city'), max_length=255, null=True, blank=True)
     employee_number_range = models.CharField(
@@ -53,9 +65,54 @@ class JobSkill(TimestampsModel):
     "Represents job skills like 'Figma', 'Django', 'Kubernetes'"
     name = models.CharField(_('skill name'), max_length=255)
 
+    # weights drift slowly as openings come and go, so they are recomputed at most this often
+    MATCH_WEIGHTS_TIMEOUT = 300
+
     def __str__(self):
         return self.name
 
+    @classmethod
+    def match_weights(cls, skill_ids) -> dict:
+        """
+        How much sharing each of `skill_ids` says about a job match: its inverse document frequency,
+        ln(1 + openings / openings requiring it), in thousandths so that scores add up exactly.
+        A skill few openings ask for weighs more than one nearly all of them do; skills no opening asks for are left out.
+        """
+        skill_ids = sorted(set(skill_ids))
+        if not skill_ids:
+            return {}
+        # the opening total is shared by every skill, and each skill's opening count by every set it is in
+        openings = cache.get_or_set('job-openings-count', JobOpening.objects.count, cls.MATCH_WEIGHTS_TIMEOUT)
+        cache_keys = {skill_id: f'job-skill-openings:{skill_id}' for skill_id in skill_ids}
+        cached = cache.get_many(cache_keys.values())
+        counts = {skill_id: cached[key] for skill_id, key in cache_keys.items() if key in cached}
+        missing = [skill_id for skill_id in skill_ids if skill_id not in counts]
+        if missing:
+            # the skill -> opening side of the `required_skills` table, i.e. its inverted index
+            frequencies = dict(JobOpening.required_skills.through.objects.filter(jobskill__in=missing).values_list(
+                'jobskill'
+            ).annotate(Count('jobopening')).order_by())
+            fetched = {skill_id: frequencies.get(skill_id, 0) for skill_id in missing}
+            cache.set_many({cache_keys[skill_id]: count for skill_id, count in fetched.items()}, cls.MATCH_WEIGHTS_TIMEOUT)
+            counts.update(fetched)
+        return {
+            skill_id: round(1000 * math.log(1 + openings / count)) for skill_id, count in counts.items() if count
+        }
+
+    @classmethod
+    def get_or_create_many(cls, names) -> list:
+        """
+        The skills named `names`, in their order and without repeats: the existing ones fetched with one IN query,
+        the rest created with one bulk insert. Where several skills share a name, the oldest is used.
+        """
+        names = list(dict.fromkeys(names))
+        skills = {}
+        for skill in cls.objects.filter(name__in=names).order_by('-id'):
+            skills[skill.name] = skill
+        missing = [cls(name=name) for name in names if name not in skills]
+        skills.update((skill.name, skill) for skill in cls.objects.bulk_create(missing))
+        return [skills[name] for name in names]
+
 
 class JobRole(TimestampsModel):
     "Represents job roles like 'Developers', 'Product Managers'"
@@ -97,10 +154,18 @@ class FreelancerProfile(TimestampsModel):
     title = models.CharField(_('profile title'), max_length=255)
     bio = models.TextField(_('bio'), max_length=1535, null=True, blank=True)
     profile_pic = ValidatedImageField(
-        upload_to='job_posting/freelancers/profile_images', extensions=('jpg', 'jpeg', 'png'), null=True, blank=True
+        upload_to='job_posting/freelancers/profile_images', extensions=('jpg', 'jpeg', 'png'), null=True, blank=True,
+        variants_field='profile_pic_variants'
+    )
+    profile_pic_variants = models.CharField(
+        _('profile picture variants generated from'), max_length=100, blank=True, editable=False
     )
     banner_image = ValidatedImageField(
-        upload_to='job_posting/freelancers/banner_images', extensions=('jpg', 'jpeg', 'png'), null=True, blank=True
+        upload_to='job_posting/freelancers/banner_images', extensions=('jpg', 'jpeg', 'png'), null=True, blank=True,
+        variants_field='banner_image_variants'
+    )
+    banner_image_variants = models.CharField(
+        _('banner image variants generated from'), max_length=100, blank=True, editable=False
     )
     resume = ValidatedResumeFileField(
         upload_to='job_posting/freelancers/resume_files', extensions=('pdf', 'docx'), null=True, blank=True
@@ -136,6 +201,72 @@ class FreelancerSocialLink(TimestampsModel):
     social_link = models.URLField(_('social link'))
 
 
+class JobOpeningQueryset(models.QuerySet):
+
+    def for_listing(self):
+        """
+        The openings as `JobOpeningSerializer` lists them: their skills prefetched in one query for the whole page
+        rather than one per opening. Company, role, category and poster are serialized as their ids, which the
+        openings' rows already hold, so they need no join.
+        """
+        return self.prefetch_related('required_skills')
+
+    def matching(self, filters:dict):
+        "The openings matching the validated filters of a `JobSearchSerializer`, ranked by relevance when searching a title"
+        queryset = self.filter(**{facet: filters[facet] for facet in JobOpening.FACETS if facet in filters})
+        if filters.get('category'):
+            queryset = queryset.filter(category__name=filters['category'])
+        if filters.get('skills'):
+            queryset = queryset.requiring_any_skill(filters['skills'])
+        if filters.get('title'):
+            queryset = queryset.search(filters['title'])
+        return queryset
+
+    def facet_counts(self) -> dict:
+        """
+        The number of openings per category name and per value of each of `JobOpening.FACETS`, plus their `total`,
+        counted in one query grouped by all of them together. Facet values no opening has are counted as 0.
+        """
+        counts = {'category': {}}
+        counts.update({
+            facet: {value: 0 for value, _ in JobOpening._meta.get_field(facet).choices} for facet in JobOpening.FACETS
+        })
+        counts['total'] = 0
+        groups = self.order_by().values('category__name', *JobOpening.FACETS).annotate(openings=Count('pk'))
+        for group in groups:
+            group['category'] = group.pop('category__name')
+            for facet in ('category', *JobOpening.FACETS):
+                counts[facet][group[facet]] = counts[facet].get(group[facet], 0) + group['openings']
+            counts['total'] += group['openings']
+        return counts
+
+    def search(self, text):
+        "Ranked full-text search over job titles, see `helpers.search`"
+        return search.get_index(self.model).search(self, text)
+
+    def requiring_any_skill(self, names):
+        "Openings requiring any of the skills named `names`, each once: an EXISTS, not a join that repeats them per skill"
+        return self.filter(Exists(
+            JobOpening.required_skills.through.objects.filter(jobopening=OuterRef('pk'), jobskill__name__in=names)
+        ))
+
+    def best_matches(self, skill_ids):
+        """
+        The openings requiring any of `skill_ids`, annotated with their `match_score`, the summed
+        `JobSkill.match_weights` of the skills they share, and the number of them, `matched_skills`.
+        Rank them by ('-match_score', '-id').
+        """
+        weights = JobSkill.match_weights(skill_ids)
+        # filtering first makes both aggregates run over the matching skills only
+        return self.filter(required_skills__in=list(weights)).annotate(
+            match_score=Sum(Case(
+                *[When(required_skills=skill_id, then=Value(weight)) for skill_id, weight in weights.items()],
+                default=Value(0), output_field=IntegerField()
+            )),
+            matched_skills=Count('required_skills'),
+        )
+
+
 class JobOpening(TimestampsModel):
 
     JOB_COMMITMENT_CHOICES = [
@@ -154,6 +285,10 @@ class JobOpening(TimestampsModel):
         ('5-10', '5-10 years'),
         ('10-', '10+ years'),
     ]
+    # the choice fields openings are filtered and counted by, besides their category
+    FACETS = ('presence_type', 'time_commitment', 'experience_range')
+    # the non-null columns openings can be sorted by, each with an index on (column, id) for keyset pages
+    SORT_KEYS = ('id', 'created_at', 'updated_at', 'title')
 
     company = models.ForeignKey(
         Company, related_name='job_openings', on_delete=models.CASCADE
@@ -184,9 +319,41 @@ class JobOpening(TimestampsModel):
 
     featured = models.BooleanField(default=False)
 
+    objects = models.manager.BaseManager.from_queryset(JobOpeningQueryset)()
+
+    class Meta(TimestampsModel.Meta):
+        indexes = [
+            # the latest openings, optionally narrowed down by one of the facets of `JobSearchView`
+            models.Index(fields=['-created_at', '-id'], name='job_opening_created_idx'),
+            models.Index(fields=['category', '-created_at', '-id'], name='job_opening_category_idx'),
+            models.Index(fields=['presence_type', '-created_at', '-id'], name='job_opening_presence_idx'),
+            models.Index(fields=['time_commitment', '-created_at', '-id'], name='job_opening_commitment_idx'),
+            models.Index(fields=['experience_range', '-created_at', '-id'], name='job_opening_experience_idx'),
+            # the other `SORT_KEYS`, `id` being the primary key and `created_at` scanning the first index backwards
+            models.Index(fields=['updated_at', 'id'], name='job_opening_updated_idx'),
+            models.Index(fields=['title', 'id'], name='job_opening_title_idx'),
+        ]
+
     def __str__(self):
         return self.title
 
+    @classmethod
+    def cached_facet_counts(cls, filters:dict) -> dict:
+        "`JobOpeningQueryset.facet_counts` of the openings matching `filters`, cached per set of filters"
+        signature = dict(filters, skills=sorted(set(filters['skills']))) if 'skills' in filters else filters
+        key = hashlib.sha1(json.dumps(signature, sort_keys=True).encode()).hexdigest()
+        counts = facet_counts_cache.get('counts', key)
+        if counts is None:
+            counts = cls.objects.matching(filters).facet_counts()
+            facet_counts_cache.set('counts', key, counts)
+        return counts
+
+
+search.register(JobOpening, {'title': 'A'})
+
+# every cached count goes stale whenever an opening, its skills or a category changes, see `JobPosting.signals`
+facet_counts_cache = VersionedCache('job-opening-facets', timeout=300)
+
 
 class JobApplication(TimestampsModel):
 
@@ -205,6 +372,12 @@ class JobApplication(TimestampsModel):
         upload_to='job_posting/freelancers/resume_files', extensions=('pdf', 'docx'), null=True, blank=True
     )
 
+    class Meta(TimestampsModel.Meta):
+        indexes = [
+            # an applicant's applications, in the keyset order of `JobApplicationView`
+            models.Index(fields=['applicant', '-updated_at', '-id'], name='job_application_applicant_idx'),
+        ]
+
 
 class JobRating(TimestampsModel):
 
@@ -1,5 +1,7 @@
 
+from django.db import transaction
 from rest_framework import serializers
+from helpers.fields import HeaderImageSerializerMixin, ImageVariantsField
 from .models import *
 
 
@@ -9,12 +11,13 @@ class CompanySocialLinkSerializer(serializers.ModelSerializer):
         fields = ['social_name', 'social_link']
 
 
-class CompanySerializer(serializers.ModelSerializer):
+class CompanySerializer(HeaderImageSerializerMixin, serializers.ModelSerializer):
     social_links = CompanySocialLinkSerializer(many=True, read_only=True)
+    logo_variants = ImageVariantsField(source='logo')
 
     class Meta:
         model = Company
-        fields = ['id', 'name', 'description', 'website', 'logo', 'country',
+        fields = ['id', 'name', 'description', 'website', 'logo', 'logo_variants', 'country',
         'city', 'employee_number_range', 'social_links']
         
 
@@ -42,9 +45,11 @@ class FreelancerSocialLinkSerializer(serializers.ModelSerializer):
         fields = ['social_name', 'social_link']
 
 
-class FreelancerProfileSerializer(serializers.ModelSerializer):
+class FreelancerProfileSerializer(HeaderImageSerializerMixin, serializers.ModelSerializer):
     skills = JobSkillSerializer(many=True, required=False)
     social_links = FreelancerSocialLinkSerializer(many=True, required=False)
+    profile_pic_variants = ImageVariantsField(source='profile_pic')
+    banner_image_variants = ImageVariantsField(source='banner_image')
 
     class Meta:
         model = FreelancerProfile
@@ -53,6 +58,22 @@ class FreelancerProfileSerializer(serializers.ModelSerializer):
             'user': {'read_only':True},
         }
 
+    def create(self, validated_data):
+        "Creates the profile with its skills, resolved by name, and social links in a constant number of queries"
+        skills = validated_data.pop('skills', [])
+        social_links = validated_data.pop('social_links', [])
+        with transaction.atomic():
+            profile = super().create(validated_data)
+            skills = JobSkill.get_or_create_many(skill['name'] for skill in skills)
+            # straight into the through table: the profile is new, so there are no existing rows for `add` to skip
+            FreelancerProfile.skills.through.objects.bulk_create([
+                FreelancerProfile.skills.through(freelancerprofile=profile, jobskill=skill) for skill in skills
+            ])
+            FreelancerSocialLink.objects.bulk_create([
+                FreelancerSocialLink(freelancer=profile, **social_link) for social_link in social_links
+            ])
+        return profile
+
 
 class JobOpeningSerializer(serializers.ModelSerializer):
     required_skills = JobSkillSerializer(many=True, read_only=True)
@@ -64,6 +85,25 @@ class JobOpeningSerializer(serializers.ModelSerializer):
             'featured': {'required':False}
         }
 
+class JobSearchSerializer(serializers.Serializer):
+    title = serializers.CharField(required=False, allow_blank=True)
+    category = serializers.CharField(required=False, allow_blank=True)
+    skills = serializers.ListField(child=serializers.CharField(), required=False)
+    presence_type = serializers.ChoiceField(choices=JobOpening.JOB_PRESENCE_CHOICES, required=False)
+    time_commitment = serializers.ChoiceField(choices=JobOpening.JOB_COMMITMENT_CHOICES, required=False)
+    experience_range = serializers.ChoiceField(choices=JobOpening.EXPERIENCE_RANGE_CHOICES, required=False)
+
+
+class JobSortSerializer(serializers.Serializer):
+    sort_by = serializers.ChoiceField(choices=JobOpening.SORT_KEYS)
+    reverse = serializers.BooleanField(required=False, default=False)
+
+
+class JobMatchSerializer(JobOpeningSerializer):
+    match_score = serializers.IntegerField(read_only=True)
+    matched_skills = serializers.IntegerField(read_only=True)
+
+
 class JobApplicationSerializer(serializers.ModelSerializer):
     class Meta:
         model = JobApplication
@@ -0,0 +1,17 @@
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+from .models import JobCategory, JobOpening, JobSkill, facet_counts_cache
+
+
+@receiver(post_save, sender=JobOpening)
+@receiver(post_delete, sender=JobOpening)
+@receiver(post_save, sender=JobCategory)
+@receiver(post_save, sender=JobSkill)
+def invalidate_facet_counts(sender, **kwargs):
+    facet_counts_cache.invalidate('counts')
+
+
+@receiver(m2m_changed, sender=JobOpening.required_skills.through)
+def invalidate_facet_counts_of_skills(sender, action, **kwargs):
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        facet_counts_cache.invalidate('counts')
@@ -1,14 +1,38 @@
 from django.test import TestCase
+from django.core.cache import cache
 from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from rest_framework.test import APIClient
 from rest_framework import status
 
 from Accounts.models import CustomUser
 from .models import *
+from .views import BestMatchJobsAPIView, JobSearchView, JobSortView
+from helpers.pagination import PaginatorGenerator
+from unittest.mock import patch
 
 User = get_user_model()
 
+
+class PagesTestMixin:
+
+    def get_pages(self, view, url, page_size, data=None, method='get', pagination_attribute='pagination_class'):
+        "Every page of `view` from `url` on, following the `next` links, with `page_size` results a page"
+        pagination_class = PaginatorGenerator()(
+            _page_size=page_size, _paginator_class=getattr(view, pagination_attribute)
+        )
+        pages = []
+        with patch.object(view, pagination_attribute, pagination_class):
+            while url:
+                response = getattr(self.client, method)(url, data=data)
+                self.assertEqual(response.status_code, status.HTTP_200_OK)
+                pages.append(response.data)
+                url = response.data['next']
+        return pages
+
+
 class FreelancerProfileViewTestCase(TestCase):
 
     def setUp(self):
@@ -46,6 +70,44 @@ class FreelancerProfileViewTestCase(TestCase):
         )
         self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
 
+    def test_create_freelancer_profile_with_skills_and_social_links(self):
+        self.client.force_authenticate(self.user)
+        response = self.client.post(
+            reverse('JobPosting:freelancer-profile-create'),
+            data = {
+                'title': 'Software Engineer',
+                'skills': [{'name': 'Python'}, {'name': 'Kubernetes'}, {'name': 'Python'}],
+                'social_links': [{'social_name': 'github', 'social_link': 'https://github.com/test'}],
+            },
+            format='json'
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        profile = self.user.freelancer_profile
+        self.assertListEqual(sorted(profile.skills.values_list('name', flat=True)), ['Kubernetes', 'Python'])
+        self.assertEqual(JobSkill.objects.filter(name='Python').count(), 1)
+        self.assertListEqual(
+            list(profile.social_links.values_list('social_name', 'social_link')), [('github', 'https://github.com/test')]
+        )
+        self.assertCountEqual([skill['name'] for skill in response.data['skills']], ['Python', 'Kubernetes'])
+
+    def test_create_freelancer_profile_query_count(self):
+        def create_profile(email, skill_total):
+            self.client.force_authenticate(User.objects.create(email=email, password='testpassword'))
+            skills = [{'name': name} for name in ('Python', 'Git')] + [
+                {'name': f'{email} skill {i}'} for i in range(skill_total - 2)
+            ]
+            with CaptureQueriesContext(connection) as context:
+                response = self.client.post(
+                    reverse('JobPosting:freelancer-profile-create'),
+                    data={'title': 'Software Engineer', 'skills': skills}, format='json'
+                )
+            self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+            self.assertEqual(len(response.data['skills']), skill_total)
+            return len(context.captured_queries)
+
+        self.assertEqual(create_profile('few@example.com', 3), create_profile('many@example.com', 30))
+
     def tearDown(self):
         JobSkill.objects.all().delete()
         FreelancerProfile.objects.all().delete()
@@ -138,7 +200,7 @@ class JobApplicationViewTestCase(TestCase):
         User.objects.all().delete()
 
 
-class JobPosting_Search_Sort_and_GetByCategoryTestCase(TestCase):
+class JobPosting_Search_Sort_and_GetByCategoryTestCase(PagesTestMixin, TestCase):
     def setUp(self):
         # Create a user, category, and jobs for testing
         self.client = APIClient()
@@ -180,6 +242,63 @@ class JobPosting_Search_Sort_and_GetByCategoryTestCase(TestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(len(response.data['data']), 2)  # Assuming both jobs match the search
 
+    def test_job_search_by_skills_without_duplicates(self):
+        python, django = JobSkill.objects.create(name='Python'), JobSkill.objects.create(name='Django')
+        self.job1.required_skills.add(python, django)
+        self.job2.required_skills.add(django)
+        response = self.client.post(reverse('JobPosting:job-search'), data={'skills': ['Python', 'Django']})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertListEqual([job['id'] for job in response.data['data']], [self.job2.id, self.job1.id])
+
+    def test_job_search_by_facets(self):
+        response = self.client.post(
+            reverse('JobPosting:job-search'),
+            data={'title': 'job', 'category': 'Test Category', 'presence_type': 'remote', 'time_commitment': 'full-time'}
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertListEqual([job['id'] for job in response.data['data']], [self.job1.id])
+
+        response = self.client.post(reverse('JobPosting:job-search'), data={'experience_range': '10-'})
+        self.assertListEqual(response.data['data'], [])
+
+    def test_job_search_invalid_facet(self):
+        response = self.client.post(reverse('JobPosting:job-search'), data={'presence_type': 'anywhere'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('presence_type', response.data)
+
+    def test_job_search_pages(self):
+        pages = self.get_pages(
+            JobSearchView, reverse('JobPosting:job-search'), 1, data={'title': 'Test'}, method='post',
+            pagination_attribute='search_pagination_class'
+        )
+        self.assertEqual(len(pages), 2)
+        self.assertCountEqual([job['id'] for page in pages for job in page['data']], [self.job1.id, self.job2.id])
+
+    def test_job_search_facets(self):
+        with self.assertNumQueries(1):
+            response = self.client.post(reverse('JobPosting:job-search-facets'), data={'title': 'job'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['total'], 2)
+        self.assertDictEqual(response.data['category'], {'Test Category': 2})
+        self.assertDictEqual(response.data['presence_type'], {'remote': 1, 'on-site': 1, 'hybrid': 0})
+        self.assertDictEqual(response.data['time_commitment'], {'part-time': 1, 'full-time': 1, 'contract': 0})
+        self.assertDictEqual(response.data['experience_range'], {'0-2': 1, '2-5': 1, '5-10': 0, '10-': 0})
+
+        response = self.client.post(reverse('JobPosting:job-search-facets'), data={'presence_type': 'remote'})
+        self.assertEqual(response.data['total'], 1)
+        self.assertDictEqual(response.data['experience_range'], {'0-2': 1, '2-5': 0, '5-10': 0, '10-': 0})
+
+    def test_job_search_facets_cached_until_openings_change(self):
+        self.client.post(reverse('JobPosting:job-search-facets'), data={})
+        with self.assertNumQueries(0):
+            response = self.client.post(reverse('JobPosting:job-search-facets'), data={})
+        self.assertEqual(response.data['total'], 2)
+
+        self.job2.presence_type = 'remote'
+        self.job2.save()
+        response = self.client.post(reverse('JobPosting:job-search-facets'), data={})
+        self.assertEqual(response.data['presence_type']['remote'], 2)
+
     def test_job_sort_view(self):
         response = self.client.post(
             reverse('JobPosting:job-sort'),
@@ -188,6 +307,19 @@ class JobPosting_Search_Sort_and_GetByCategoryTestCase(TestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(response.data['data'][0]['title'], 'Test Job 2')
 
+    def test_job_sort_view_rejects_unsortable_fields(self):
+        for sort_by in ('applications', 'required_skills', 'description', ''):
+            response = self.client.post(reverse('JobPosting:job-sort'), data={'sort_by': sort_by})
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+            self.assertIn('sort_by', response.data)
+
+    def test_job_sort_view_pages(self):
+        JobOpening.objects.filter(pk=self.job2.pk).update(title='Test Job 1')
+
+        pages = self.get_pages(JobSortView, reverse('JobPosting:job-sort'), 1, data={'sort_by': 'title'}, method='post')
+        # titles tie, so the ids order them
+        self.assertListEqual([job['id'] for page in pages for job in page['data']], [self.job1.id, self.job2.id])
+
     def test_job_category_view(self):
         response = self.client.get(
             reverse('JobPosting:job-categories'),
@@ -290,7 +422,7 @@ class CompanyJobsTests(TestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
 
 
-class Job_BestMatch_MostRecent_and_Featured_Tests(TestCase):
+class Job_BestMatch_MostRecent_and_Featured_Tests(PagesTestMixin, TestCase):
 
     def setUp(self):
         # Create a user and log them in
@@ -314,9 +446,9 @@ class Job_BestMatch_MostRecent_and_Featured_Tests(TestCase):
 
         role = JobRole.objects.create(name='Test Role')
         category = JobCategory.objects.create(name='Test Category')
-        skill1 = JobSkill.objects.create(name='Skill 1')
-        skill2 = JobSkill.objects.create(name='Skill 2')
-        skill3 = JobSkill.objects.create(name='Skill 3')
+        skill1 = self.skill1 = JobSkill.objects.create(name='Skill 1')
+        skill2 = self.skill2 = JobSkill.objects.create(name='Skill 2')
+        skill3 = self.skill3 = JobSkill.objects.create(name='Skill 3')
 
         self.job1 = JobOpening.objects.create(
             company=company,
@@ -375,6 +507,59 @@ class Job_BestMatch_MostRecent_and_Featured_Tests(TestCase):
     def test_get_best_match_jobs(self):
         response = self.client.get(reverse('JobPosting:best-match-jobs'))
         self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertListEqual(response.data['results'], [])
+
+    def add_best_match_data(self):
+        cache.clear()
+        self.freelancer_profile.skills.add(self.skill1, self.skill2)
+        self.job4 = JobOpening.objects.create(
+            company=self.job1.company, role=self.job1.role, category=self.job1.category, title='Job 4',
+            time_commitment='full-time', presence_type='remote', experience_range='2-5',
+        )
+        # skill 2 is now the most common, so it weighs the least
+        self.job4.required_skills.add(self.skill2)
+
+    def test_best_match_jobs_ranked_by_weighted_overlap(self):
+        self.add_best_match_data()
+        response = self.client.get(reverse('JobPosting:best-match-jobs'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        results = response.data['results']
+        self.assertListEqual([job['id'] for job in results], [self.job1.id, self.job3.id, self.job4.id, self.job2.id])
+        # ln(1 + 4/2) and ln(1 + 4/3), in thousandths
+        self.assertListEqual([job['match_score'] for job in results], [1946, 1099, 847, 847])
+        self.assertListEqual([job['matched_skills'] for job in results], [2, 1, 1, 1])
+
+    def test_best_match_jobs_pages(self):
+        self.add_best_match_data()
+
+        pages = self.get_pages(BestMatchJobsAPIView, reverse('JobPosting:best-match-jobs'), 3)
+        self.assertListEqual([len(page['results']) for page in pages], [3, 1])
+        self.assertListEqual(
+            [job['id'] for page in pages for job in page['results']],
+            [self.job1.id, self.job3.id, self.job4.id, self.job2.id]
+        )
+
+    def test_best_match_jobs_query_count(self):
+        self.add_best_match_data()
+        self.client.get(reverse('JobPosting:best-match-jobs'))
+        # the skill weights are cached: the freelancer's skills, the page and its prefetched skills remain
+        with self.assertNumQueries(3):
+            self.client.get(reverse('JobPosting:best-match-jobs'))
+
+    def test_match_weights_cached_per_skill(self):
+        self.add_best_match_data()
+        weights = JobSkill.match_weights([self.skill1.id, self.skill2.id])
+        # the opening total and the skills' opening counts are all cached, whichever set they came in
+        with self.assertNumQueries(0):
+            self.assertEqual(JobSkill.match_weights([self.skill2.id]), {self.skill2.id: weights[self.skill2.id]})
+        skill = JobSkill.objects.create(name='Rust')
+        with self.assertNumQueries(1):
+            self.assertEqual(JobSkill.match_weights([self.skill1.id, skill.id]), {self.skill1.id: weights[self.skill1.id]})
+
+    def test_best_match_jobs_without_freelancer_profile(self):
+        self.client.force_authenticate(user=User.objects.create_user(email='other@gmail.com', password='testpassword'))
+        response = self.client.get(reverse('JobPosting:best-match-jobs'))
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
 
     def test_get_most_recent_jobs(self):
         response = self.client.get(reverse('JobPosting:most-recent-jobs'))
@@ -388,3 +573,50 @@ class Job_BestMatch_MostRecent_and_Featured_Tests(TestCase):
             if hasattr(obj, 'id'):
                 obj.delete()
 
+
+
+class JobListQueryCountTests(TestCase):
+    "Every job list costs the same number of queries however many jobs and skills it holds"
+
+    def setUp(self):
+        self.user = User.objects.create_user(email='testuser@gmail.com', password='testpassword')
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+        self.company = Company.objects.create(name='Test Company', employee_number_range='11-50')
+        self.category = JobCategory.objects.create(name='Test Category')
+        role = JobRole.objects.create(name='Test Role')
+        skills = [JobSkill.objects.create(name=f'Skill {i}') for i in range(3)]
+        for i in range(5):
+            job = JobOpening.objects.create(
+                company=self.company, role=role, category=self.category, poster=self.user, title=f'Test Job {i}',
+                time_commitment='full-time', presence_type='remote', experience_range='2-5', featured=True
+            )
+            job.required_skills.add(*skills)
+
+    def assertListQueries(self, queries, url, method='get', data=None, jobs=lambda response: response.data['data']):
+        with self.assertNumQueries(queries):
+            response = getattr(self.client, method)(url, data=data)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        listed = jobs(response)
+        self.assertEqual(len(listed), 5)
+        self.assertTrue(all(len(job['required_skills']) == 3 for job in listed))
+
+    def test_jobs_in_category(self):
+        # the category, the jobs and their skills
+        self.assertListQueries(3, reverse('JobPosting:jobs-in-category', args=[self.category.id]))
+
+    def test_featured_jobs(self):
+        self.assertListQueries(2, reverse('JobPosting:featured-jobs'), jobs=lambda response: response.data)
+
+    def test_company_jobs(self):
+        self.assertListQueries(2, reverse('JobPosting:company-jobs', args=[self.company.id]), jobs=lambda response: response.data)
+
+    def test_most_recent_jobs(self):
+        # the count, the page and its skills
+        self.assertListQueries(3, reverse('JobPosting:most-recent-jobs'), jobs=lambda response: response.data['results'])
+
+    def test_sorted_jobs(self):
+        self.assertListQueries(2, reverse('JobPosting:job-sort'), method='post', data={'sort_by': 'title'})
+
+    def test_searched_jobs(self):
+        self.assertListQueries(2, reverse('JobPosting:job-search'), method='post', data={'title': 'job'})
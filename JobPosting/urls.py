@@ -21,6 +21,7 @@ urlpatterns = [
         name='job-applications-list'
     ),
     path('jobs/search/', JobSearchView.as_view(), name='job-search'),
+    path('jobs/search/facets/', JobFacetsView.as_view(), name='job-search-facets'),
     path('jobs/sort/', JobSortView.as_view(), name='job-sort'),
     path('jobs/categories/', JobCategoryView.as_view(), name='job-categories'),
     path('jobs/categories/<int:category_id>/jobs/', GetJobsByCategory.as_view(), name='jobs-in-category'),
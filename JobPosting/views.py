@@ -3,7 +3,8 @@ from rest_framework import (
     decorators, viewsets, mixins, permissions, status, generics
 )
 from drf_yasg.utils import swagger_auto_schema
-from helpers.pagination import PaginatorGenerator
+from helpers.pagination import PaginatorGenerator, KeysetPagination
+from helpers.uploadhandler import UploadSizeLimitMixin
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from .permissions import HasFreelancerProfile
@@ -11,7 +12,7 @@ from .serializers import *
 from .models import *
 
 
-class FreelancerProfileView(viewsets.GenericViewSet, mixins.CreateModelMixin):
+class FreelancerProfileView(UploadSizeLimitMixin, viewsets.GenericViewSet, mixins.CreateModelMixin):
 
     serializer_class = FreelancerProfileSerializer
     permission_classes = [permissions.IsAuthenticated]
@@ -27,11 +28,13 @@ class FreelancerProfileView(viewsets.GenericViewSet, mixins.CreateModelMixin):
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
-class JobApplicationView(viewsets.GenericViewSet, mixins.CreateModelMixin):
+class JobApplicationView(UploadSizeLimitMixin, viewsets.GenericViewSet, mixins.CreateModelMixin):
 
     serializer_class = JobApplicationSerializer
     permission_classes = [HasFreelancerProfile]
-    pagination_class = PaginatorGenerator()(_page_size=10)
+    pagination_class = PaginatorGenerator()(
+        _page_size=10, _paginator_class=KeysetPagination, ordering=('-updated_at', '-id'), include_count=True
+    )
 
     def get_queryset(self):
         return JobApplication.objects.filter(
@@ -63,62 +66,74 @@ class JobApplicationView(viewsets.GenericViewSet, mixins.CreateModelMixin):
 
 
 class JobSearchView(APIView):
-
-    "API View to search for jobs using the job title, the required skills and also category"
-
-    @swagger_auto_schema(tags=['JobPosting'])
+    """
+    API View to search for jobs using the job title, the required skills, the category and the other facets
+    (presence type, time commitment, experience range). Title searches are ranked by relevance, the rest ordered
+    by the latest job, both in keyset pages: post the same filters to the `next` link for the following page.
+    """
+    pagination_class = PaginatorGenerator()(_page_size=20, _paginator_class=KeysetPagination)
+    search_pagination_class = PaginatorGenerator()(
+        _page_size=20, _paginator_class=KeysetPagination, ordering=('-search_rank', '-id')
+    )
+
+    @swagger_auto_schema(tags=['JobPosting'], request_body=JobSearchSerializer)
     def post(self, request):
-        try:
-            title = request.data.get('title', None)
-            category = request.data.get('category', None)
-            skills = request.data.get('skills', [])
-
-            queryset = JobOpening.objects.all()
-            if title:
-                queryset = queryset.filter(title__icontains=title)
-            if category:
-                queryset = queryset.filter(category__name=category)
-            if skills:
-                queryset = queryset.filter(required_skills__name__in=skills)
-
-            serialized_jobs = JobOpeningSerializer(queryset, many=True)
-            return Response({'data': serialized_jobs.data}, status=status.HTTP_200_OK)
-        except Exception as e:
-            return Response(data={"error": str(e)},
-            status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        serializer = JobSearchSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        filters = serializer.validated_data
+
+        queryset = JobOpening.objects.matching(filters)
+        paginator = self.search_pagination_class() if filters.get('title') else self.pagination_class()
+
+        page = paginator.paginate_queryset(queryset.for_listing(), request, view=self)
+        serialized_jobs = JobOpeningSerializer(page, many=True)
+        return Response({
+            'next': paginator.get_next_link(),
+            'previous': paginator.get_previous_link(),
+            'data': serialized_jobs.data
+        }, status=status.HTTP_200_OK)
+
+
+class JobFacetsView(APIView):
+    """
+    API View to count the jobs matching the filters of `JobSearchView` per category, presence type, time commitment
+    and experience range, all at once
+    """
+
+    @swagger_auto_schema(tags=['JobPosting'], request_body=JobSearchSerializer)
+    def post(self, request):
+        serializer = JobSearchSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        return Response(JobOpening.cached_facet_counts(serializer.validated_data), status=status.HTTP_200_OK)
 
 
 class JobSortView(APIView):
+    """
+    API View to sort jobs by one of `JobOpening.SORT_KEYS`, ascending unless `reverse` is set, with the job id
+    as tie-breaker. Jobs come in keyset pages: post the same body to the `next` link for the following page.
+    """
+    pagination_class = PaginatorGenerator()(_page_size=20, _paginator_class=KeysetPagination)
 
-    "API View to sort jobs using the meta fields and return a response ordered by the latest job"
-
-    @swagger_auto_schema(tags=['JobPosting'])
+    @swagger_auto_schema(tags=['JobPosting'], request_body=JobSortSerializer)
     def post(self, request):
-        try:
-            sort_by = request.data.get('sort_by', None)
-            reverse_order = request.data.get('reverse', False)
-            
-            if not sort_by:
-                return Response({'error': 'Missing "sort_by" parameter'}, status=status.HTTP_400_BAD_REQUEST)
-
-            valid_fields = [field.name for field in JobOpening._meta.get_fields()]
-
-            if sort_by not in valid_fields:
-                return Response({'error': f'Invalid "sort_by" field. Valid values: {", ".join(valid_fields)}'},
-                                status=status.HTTP_400_BAD_REQUEST)
-
-            jobs = JobOpening.objects.order_by(sort_by)
-            
-            # reverse the order of sorted jobs data
-            if reverse_order == 'true':
-                jobs = jobs.reverse()
-
-            serialized_jobs = JobOpeningSerializer(jobs, many=True)
-            return Response({'data': serialized_jobs.data}, status=status.HTTP_200_OK)
-        except Exception as e:
-            return Response(data={"error": str(e)},
-            status=status.HTTP_500_INTERNAL_SERVER_ERROR)
-            
+        serializer = JobSortSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        sort_by, reverse = serializer.validated_data['sort_by'], serializer.validated_data['reverse']
+
+        paginator = self.pagination_class()
+        ordering = (sort_by,) if sort_by == 'id' else (sort_by, 'id')
+        paginator.ordering = tuple(f'-{field}' for field in ordering) if reverse else ordering
+        page = paginator.paginate_queryset(JobOpening.objects.for_listing(), request, view=self)
+        serialized_jobs = JobOpeningSerializer(page, many=True)
+        return Response({
+            'next': paginator.get_next_link(),
+            'previous': paginator.get_previous_link(),
+            'data': serialized_jobs.data
+        }, status=status.HTTP_200_OK)
+
 
 class JobCategoryView(APIView):
 
@@ -146,14 +161,14 @@ class GetJobsByCategory(APIView):
         except JobCategory.DoesNotExist:
             return Response({'error': 'Category not found'}, status=status.HTTP_404_NOT_FOUND)
 
-        jobs = JobOpening.objects.filter(category=category)
+        jobs = JobOpening.objects.filter(category=category).for_listing()
         serialized_jobs = JobOpeningSerializer(jobs, many=True)
         return Response({'data': serialized_jobs.data},
         status=status.HTTP_200_OK)
         
 
 class FeaturedJobsAPIView(generics.ListAPIView):
-    queryset = JobOpening.objects.filter(featured=True)
+    queryset = JobOpening.objects.filter(featured=True).for_listing()
     serializer_class = JobOpeningSerializer
 
     @swagger_auto_schema(tags=['JobPosting'])
@@ -162,20 +177,27 @@ class FeaturedJobsAPIView(generics.ListAPIView):
 
 
 class BestMatchJobsAPIView(generics.ListAPIView):
-    serializer_class = JobOpeningSerializer
+    """
+    Job openings ranked by how well their required skills match the freelancer's, weighted by
+    how rare each shared skill is (see `JobOpeningQueryset.best_matches`), in keyset pages
+    """
+    serializer_class = JobMatchSerializer
+    permission_classes = [HasFreelancerProfile]
+    pagination_class = PaginatorGenerator()(
+        _page_size=10, _paginator_class=KeysetPagination, ordering=('-match_score', '-id')
+    )
 
     @swagger_auto_schema(tags=['JobPosting'])
     def get(self, request, *args, **kwargs):
-        return super().get(self, request, *args, **kwargs)
+        return super().get(request, *args, **kwargs)
 
     def get_queryset(self):
-        freelancer_skills = self.request.user.freelancer_profile.skills.all()
-        queryset = JobOpening.objects.filter(required_skills__in=freelancer_skills).distinct()
-        return queryset
+        skill_ids = self.request.user.freelancer_profile.skills.values_list('pk', flat=True)
+        return JobOpening.objects.best_matches(skill_ids).for_listing()
 
 
 class MostRecentJobsAPIView(generics.ListAPIView):
-    queryset = JobOpening.objects.order_by('-created_at')
+    queryset = JobOpening.objects.order_by('-created_at').for_listing()
     serializer_class = JobOpeningSerializer
     pagination_class = PaginatorGenerator()(_page_size=10)
 
@@ -227,7 +249,7 @@ class CompanyJobsView(APIView):
     def get(self, request, *args, **kwargs):
         company_id = kwargs.get('company_id')
         if company_id is not None:
-            jobs = JobOpening.objects.filter(company__id=company_id)
+            jobs = JobOpening.objects.filter(company__id=company_id).for_listing()
             serializer = JobOpeningSerializer(jobs, many=True)
             return Response(serializer.data, status=status.HTTP_200_OK)
         return Response({'error': 'Company ID is required'}, status=status.HTTP_400_BAD_REQUEST)
\ No newline at end of file
@@ -0,0 +1,100 @@
+import statistics
+import time
+import uuid
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+
+from MarketPlace.models import (
+    Cart, CartItem, MarketPlace, Product, ProductCategory, Store, StoreVendor
+)
+
+User = get_user_model()
+
+
+def legacy_summary(cart):
+    "The per-item loop `Cart._summary` used before `Cart.objects.with_totals()`, kept for comparison"
+    cartitems = cart.items.prefetch_related('product').all()
+    if not cartitems:
+        return {'sub_total':0, 'total_discount':0, 'currency':'₦'}
+    sub_total = total_discount = 0
+    for cartitem in cartitems:
+        actual_price = cartitem.product.price
+        discounted_price = cartitem.product.discounted_price
+        sub_total += (discounted_price * cartitem.quantity)
+        total_discount += (actual_price - discounted_price) * cartitem.quantity
+    return {
+        'currency':cart.items.first().product.currency_symbol,
+        'delivery_address':cart.delivery_address,
+        'sub_total':sub_total,
+        'total_discount':total_discount
+    }
+
+
+def aggregate_summary(cart):
+    return Cart.objects.filter(pk=cart.pk).with_totals().get()._summary
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmarks the query count and latency of the legacy cart summary loop against "
+        "the single-query `Cart.objects.with_totals()`. All data is rolled back afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', nargs='+', type=int, default=[1, 50, 500])
+        parser.add_argument('--repeat', type=int, default=20)
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            store, category = self.create_store()
+            self.stdout.write(f"{'items':>6} {'strategy':>10} {'queries':>8} {'median ms':>10}")
+            for size in options['sizes']:
+                cart = self.create_cart(store, category, size)
+                results = []
+                for name, strategy in (('legacy', legacy_summary), ('aggregate', aggregate_summary)):
+                    queries, latency, summary = self.measure(strategy, cart, options['repeat'])
+                    results.append(summary)
+                    self.stdout.write(f"{size:>6} {name:>10} {queries:>8} {latency:>10.2f}")
+                if results[0] != results[1]:
+                    self.stderr.write(f"Summaries differ for {size} items: {results[0]} != {results[1]}")
+            transaction.set_rollback(True)
+
+    def measure(self, strategy, cart, repeat):
+        with CaptureQueriesContext(connection) as context:
+            summary = strategy(cart)
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            strategy(cart)
+            timings.append((time.perf_counter() - start) * 1000)
+        return len(context.captured_queries), statistics.median(timings), summary
+
+    def create_store(self):
+        user = User.objects.create_user(email=f'bench-{uuid.uuid4().hex}@zionnet.bench', password=None)
+        marketplace = MarketPlace.objects.create(name='Benchmark Market', cover_image='bench.jpg')
+        vendor = StoreVendor.objects.create(user=user, email=user.email, id_type='NIN')
+        store = Store.objects.create(
+            marketplace=marketplace, vendor=vendor, name='Benchmark Store',
+            country='Nigeria', city='Lagos', province='Lagos'
+        )
+        category = ProductCategory.objects.create(marketplace=marketplace, name='Benchmark Category')
+        return store, category
+
+    def create_cart(self, store, category, size):
+        owner = User.objects.create_user(email=f'bench-{uuid.uuid4().hex}@zionnet.bench', password=None)
+        cart = Cart.objects.create(owner=owner)
+        products = Product.objects.bulk_create([
+            Product(
+                store=store, category=category, name=f'Product {i}', quantity=100,
+                price=f'{(i % 97) * 13 + 0.99:.2f}', discount=f'{i % 60}.{i % 100:02d}'
+            ) for i in range(size)
+        ])
+        # bulk_create skips CartItem.save, which would otherwise move stock for every item.
+        CartItem.objects.bulk_create([
+            CartItem(cart=cart, product=product, quantity=(i % 5) + 1)
+            for i, product in enumerate(products)
+        ])
+        return cart
@@ -0,0 +1,98 @@
+import statistics
+import time
+import uuid
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from MarketPlace.models import FlashSale, MarketPlace, Product, ProductCategory, Store, StoreVendor
+
+User = get_user_model()
+
+
+def legacy_active_sales(marketplace_id, now):
+    "The join `FlashSaleProductsView` filtered on before `FlashSale.marketplace`, kept for comparison"
+    return FlashSale.objects.filter(
+        product__store__marketplace=marketplace_id, start_datetime__lte=now, end_datetime__gte=now
+    ).order_by('-id')
+
+
+def indexed_active_sales(marketplace_id, now):
+    return FlashSale.objects.filter(marketplace=marketplace_id).active(now).order_by('-id')
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmarks listing the live flash sales of a marketplace through the product/store join against the "
+        "denormalized `FlashSale.marketplace` and `flash_sale_active_idx`, over synthetic historical sales. "
+        "All data is rolled back afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--historical', type=int, default=200000)
+        parser.add_argument('--active', type=int, default=50)
+        parser.add_argument('--marketplaces', type=int, default=10)
+        parser.add_argument('--page-size', type=int, default=20)
+        parser.add_argument('--repeat', type=int, default=20)
+        parser.add_argument('--explain', action='store_true')
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            now = timezone.now()
+            marketplace_ids = self.create_sales(now, options)
+            self.stdout.write(f"{'strategy':>10} {'rows':>6} {'median ms':>10}")
+            results = []
+            for name, strategy in (('legacy', legacy_active_sales), ('indexed', indexed_active_sales)):
+                queryset = strategy(marketplace_ids[0], now)
+                rows, latency = self.measure(queryset, options['page_size'], options['repeat'])
+                results.append(rows)
+                self.stdout.write(f"{name:>10} {len(rows):>6} {latency:>10.2f}")
+                if options['explain']:
+                    self.stdout.write(queryset[:options['page_size']].explain())
+            if results[0] != results[1]:
+                self.stderr.write(f"Strategies returned different sales: {results[0]} != {results[1]}")
+            transaction.set_rollback(True)
+
+    def measure(self, queryset, page_size, repeat):
+        rows = list(queryset.values_list('pk', flat=True)[:page_size])
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            list(queryset.values_list('pk', flat=True)[:page_size])
+            timings.append((time.perf_counter() - start) * 1000)
+        return rows, statistics.median(timings)
+
+    def create_sales(self, now, options):
+        user = User.objects.create(email=f'bench-{uuid.uuid4().hex}@zionnet.bench')
+        vendor = StoreVendor.objects.create(user=user, email=user.email, id_type='NIN')
+        products = []
+        for i in range(options['marketplaces']):
+            marketplace = MarketPlace.objects.create(name=f'Benchmark Market {i}', cover_image='bench.jpg')
+            store = Store.objects.create(
+                marketplace=marketplace, vendor=vendor, name='Benchmark Store',
+                country='Nigeria', city='Lagos', province='Lagos'
+            )
+            category = ProductCategory.objects.create(marketplace=marketplace, name='Benchmark Category')
+            products += Product.objects.bulk_create([
+                Product(store=store, category=category, name=f'Product {j}', price=10) for j in range(50)
+            ])
+
+        # bulk_create skips FlashSale.save, so the marketplace is copied here as save would.
+        marketplace_ids = {store.pk: store.marketplace_id for store in Store.objects.filter(vendor=vendor)}
+        total = options['historical'] + options['active']
+        for offset in range(0, total, 5000):
+            sales = []
+            for i in range(offset, min(offset + 5000, total)):
+                product = products[i % len(products)]
+                # historical sales ended at some point over the past year, active ones straddle now
+                start = now - timedelta(minutes=(i * 7919) % 525600 + 60) if i >= options['active'] else now - timedelta(hours=1)
+                end = start + timedelta(minutes=30) if i >= options['active'] else now + timedelta(hours=1)
+                sales.append(FlashSale(
+                    product=product, marketplace_id=marketplace_ids[product.store_id],
+                    discount_percentage=20, start_datetime=start, end_datetime=end
+                ))
+            FlashSale.objects.bulk_create(sales)
+        return list(MarketPlace.objects.filter(stores__vendor=vendor).values_list('pk', flat=True).order_by('pk'))
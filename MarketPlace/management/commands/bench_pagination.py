@@ -0,0 +1,89 @@
+import statistics
+import time
+import uuid
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from helpers.pagination import KeysetPagination, PaginatorGenerator
+from MarketPlace.models import MarketPlace, Product, ProductCategory, Store, StoreVendor
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmarks page-number pagination (COUNT plus OFFSET) against keyset pagination on a marketplace's "
+        "product list, at the first and at a deep page. All data is rolled back afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--page-size', type=int, default=20)
+        parser.add_argument('--pages', type=int, nargs='+', default=[1, 10000])
+        parser.add_argument('--repeat', type=int, default=20)
+
+    def handle(self, *args, **options):
+        page_size = options['page_size']
+        with transaction.atomic():
+            marketplace = self.create_products(page_size * max(options['pages']))
+            queryset = Product.objects.filter(marketplace=marketplace)
+            paginators = {
+                'page-number': PaginatorGenerator()(_page_size=page_size),
+                'keyset': PaginatorGenerator()(_page_size=page_size, _paginator_class=KeysetPagination),
+            }
+            self.stdout.write(f"{'page':>7} {'strategy':>12} {'queries':>8} {'median ms':>10}")
+            for page in options['pages']:
+                results = []
+                for name, paginator_class in paginators.items():
+                    request = self.page_request(paginator_class, queryset, page, page_size)
+                    queries, latency, ids = self.measure(paginator_class, queryset, request, options['repeat'])
+                    results.append(ids)
+                    self.stdout.write(f"{page:>7} {name:>12} {queries:>8} {latency:>10.2f}")
+                if results[0] != results[1]:
+                    self.stderr.write(f"Page {page} differs between strategies")
+            transaction.set_rollback(True)
+
+    def page_request(self, paginator_class, queryset, page, page_size):
+        if not issubclass(paginator_class, KeysetPagination):
+            return self.request({'page': page})
+        if page == 1:
+            return self.request({})
+        # a client reaches a deep page by following `next` links; the cursor of its predecessor's last row
+        # is built directly here, outside of the timings.
+        paginator = paginator_class()
+        last = queryset.order_by(*paginator.ordering)[(page - 1) * page_size - 1]
+        return self.request({'cursor': paginator.encode_cursor(last, False)})
+
+    def request(self, params):
+        return Request(APIRequestFactory().get('/', params, SERVER_NAME=settings.ALLOWED_HOSTS[0]))
+
+    def measure(self, paginator_class, queryset, request, repeat):
+        with CaptureQueriesContext(connection) as context:
+            ids = [product.id for product in paginator_class().paginate_queryset(queryset, request)]
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            paginator_class().paginate_queryset(queryset, request)
+            timings.append((time.perf_counter() - start) * 1000)
+        return len(context.captured_queries), statistics.median(timings), ids
+
+    def create_products(self, total):
+        user = User.objects.create(email=f'bench-{uuid.uuid4().hex}@zionnet.bench')
+        vendor = StoreVendor.objects.create(user=user, email=user.email, id_type='NIN')
+        marketplace = MarketPlace.objects.create(name='Benchmark Market', cover_image='bench.jpg')
+        store = Store.objects.create(
+            marketplace=marketplace, vendor=vendor, name='Benchmark Store',
+            country='Nigeria', city='Lagos', province='Lagos'
+        )
+        category = ProductCategory.objects.create(marketplace=marketplace, name='Benchmark Category')
+        for offset in range(0, total, 5000):
+            Product.objects.bulk_create([
+                Product(store=store, category=category, name=f'Product {i}', price=10)
+                for i in range(offset, min(offset + 5000, total))
+            ])
+        return marketplace
@@ -0,0 +1,94 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from django.apps import apps
+from django.core.files import File
+from django.core.management.base import BaseCommand
+from django.db import models
+
+from helpers import variants
+from helpers.fields import ValidatedImageField
+from helpers.storage import content_addressed_storage
+
+
+class Command(BaseCommand):
+    help = (
+        "Moves the existing files of every file field stored by `helpers.storage`, and their image variants, into "
+        "its content-addressed storage: every such file becomes a hard link to the blob of its content, so "
+        "duplicates stop taking space. Other files under MEDIA_ROOT are left alone. Files are hashed in parallel; "
+        "blobs no file links to any more are removed."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=4)
+        parser.add_argument('--dry-run', action='store_true')
+
+    def handle(self, *args, **options):
+        storage = content_addressed_storage
+        blob_root = os.path.join(storage.location, storage.blob_dir)
+        # files already linked to a blob need no hashing
+        paths = sorted({path for path in self.stored_paths() if os.path.exists(path) and os.stat(path).st_nlink == 1})
+
+        with ThreadPoolExecutor(max_workers=options['workers']) as executor:
+            digests = list(executor.map(self.digest, paths))
+
+        linked, freed, seen = 0, 0, set()
+        for path, digest in zip(paths, digests):
+            blob = storage.blob_path(digest)
+            if digest in seen or os.path.exists(blob):
+                freed += os.path.getsize(path)
+                if not options['dry_run']:
+                    # linked beside the file and renamed over it, so the name never goes missing
+                    temporary = f'{path}.dedupe'
+                    try:
+                        # left behind by an interrupted run
+                        os.remove(temporary)
+                    except FileNotFoundError:
+                        pass
+                    os.link(blob, temporary)
+                    os.replace(temporary, path)
+            elif not options['dry_run']:
+                os.makedirs(os.path.dirname(blob), exist_ok=True)
+                os.link(path, blob)
+            seen.add(digest)
+            linked += 1
+
+        orphans = 0
+        for directory, directories, file_names in os.walk(blob_root):
+            if directory == blob_root:
+                # uploads being written, not blobs yet
+                continue
+            for file_name in file_names:
+                blob = os.path.join(directory, file_name)
+                if os.stat(blob).st_nlink == 1:
+                    orphans += 1
+                    freed += os.path.getsize(blob)
+                    if not options['dry_run']:
+                        os.remove(blob)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"{'Would link' if options['dry_run'] else 'Done, linked'} {linked} files and "
+            f"remove {orphans} orphaned blobs, freeing {freed} bytes."
+        ))
+
+    @staticmethod
+    def stored_paths():
+        "The paths of the files the content-addressed storage's fields refer to, along with their image variants"
+        storage = content_addressed_storage
+        for model in apps.get_models():
+            for field in model._meta.concrete_fields:
+                if not isinstance(field, models.FileField) or field.storage is not storage:
+                    continue
+                names = model._default_manager.exclude(**{field.attname: ''}).exclude(
+                    **{f'{field.attname}__isnull': True}
+                ).values_list(field.attname, flat=True).distinct()
+                for name in names.iterator():
+                    yield storage.path(name)
+                    if isinstance(field, ValidatedImageField):
+                        for variant in variants.VARIANTS:
+                            yield storage.path(variants.variant_name(name, variant))
+
+    @staticmethod
+    def digest(path):
+        with open(path, 'rb') as file:
+            return content_addressed_storage.digest(File(file))
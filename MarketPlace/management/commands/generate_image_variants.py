@@ -0,0 +1,60 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from django.apps import apps
+from django.core.management.base import BaseCommand
+from django.db.models import F
+
+from helpers import variants
+from helpers.fields import ValidatedImageField
+
+
+class Command(BaseCommand):
+    help = (
+        "Generates the resized variants of every image stored through a `ValidatedImageField` with a "
+        "`variants_field`, across all apps, "
+        "in parallel. New uploads get theirs in the background already, so this backfills media uploaded before "
+        "variants existed, or regenerates all of them with --overwrite after `helpers.variants.VARIANTS` changes."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=4)
+        parser.add_argument('--chunk-size', type=int, default=500)
+        parser.add_argument('--overwrite', action='store_true')
+
+    def handle(self, *args, **options):
+        generated, failed = 0, 0
+        with ThreadPoolExecutor(max_workers=options['workers']) as executor:
+            for model, field in self.image_fields():
+                last_id = 0
+                while True:
+                    rows = list(
+                        model._default_manager.filter(pk__gt=last_id).exclude(**{field.name: ''})
+                        .exclude(**{f'{field.name}__isnull': True}).order_by('pk')
+                        .values_list('pk', field.name)[:options['chunk_size']]
+                    )
+                    if not rows:
+                        break
+                    futures = [
+                        executor.submit(variants.generate_variants, field.storage, name, options['overwrite'])
+                        for _, name in rows
+                    ]
+                    done = []
+                    for (pk, name), future in zip(rows, futures):
+                        if future.exception() is None:
+                            generated += len(future.result())
+                            done.append(pk)
+                        else:
+                            failed += 1
+                            self.stderr.write(f'{model._meta.label} {pk}: {name}: {future.exception()}')
+                    model._default_manager.filter(pk__in=done).update(**{field.variants_field: F(field.attname)})
+                    last_id = rows[-1][0]
+                self.stdout.write(f'Processed {model._meta.label}.{field.name}')
+        self.stdout.write(self.style.SUCCESS(f'Done, {generated} variants generated, {failed} images failed.'))
+
+    @staticmethod
+    def image_fields():
+        for model in apps.get_models():
+            for field in model._meta.concrete_fields:
+                # the others' variants would never be served, see `ValidatedImageField`
+                if isinstance(field, ValidatedImageField) and field.variants_field:
+                    yield model, field
@@ -0,0 +1,43 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, Sum
+
+from MarketPlace.models import Product, ProductRating
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuilds the rating_count, rating_sum and rating_avg aggregates of every product from its "
+        "ratings, a chunk of products at a time."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        last_id, rebuilt = 0, 0
+        while True:
+            product_ids = list(
+                Product.objects.filter(pk__gt=last_id).order_by('pk').values_list('pk', flat=True)[:options['chunk_size']]
+            )
+            if not product_ids:
+                break
+            with transaction.atomic():
+                aggregates = {
+                    row['product']: (row['count'], row['total'])
+                    for row in ProductRating.objects.filter(product__in=product_ids).order_by().values(
+                        'product'
+                    ).annotate(count=Count('id'), total=Sum('value'))
+                }
+                products = []
+                for product_id in product_ids:
+                    count, total = aggregates.get(product_id, (0, 0))
+                    products.append(Product(
+                        pk=product_id, rating_count=count, rating_sum=total,
+                        rating_avg=total / count if count else None
+                    ))
+                Product.objects.bulk_update(products, ['rating_count', 'rating_sum', 'rating_avg'])
+            last_id = product_ids[-1]
+            rebuilt += len(product_ids)
+            self.stdout.write(f'Rebuilt rating aggregates of {rebuilt} products')
+        self.stdout.write(self.style.SUCCESS(f'Done, {rebuilt} products rebuilt.'))
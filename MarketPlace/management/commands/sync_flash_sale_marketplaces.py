@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+from MarketPlace.models import FlashSale
+
+
+class Command(BaseCommand):
+    help = (
+        "Copies the marketplace of every flash sale from its product's store. Run it once to backfill "
+        "sales created before `FlashSale.marketplace` existed, or after bulk writes that moved products or stores."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        last_id, synced = 0, 0
+        while True:
+            sale_ids = list(
+                FlashSale.objects.filter(pk__gt=last_id).order_by('pk').values_list('pk', flat=True)[:options['chunk_size']]
+            )
+            if not sale_ids:
+                break
+            synced += FlashSale.objects.filter(pk__in=sale_ids).sync_marketplaces()
+            last_id = sale_ids[-1]
+        self.stdout.write(self.style.SUCCESS(f'Done, {synced} flash sales synced.'))
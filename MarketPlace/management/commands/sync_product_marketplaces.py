@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+from MarketPlace.models import Product
+
+
+class Command(BaseCommand):
+    help = (
+        "Copies the marketplace of every product from its store. Run it once to backfill "
+        "products created before `Product.marketplace` existed, or after bulk writes that moved stores or products."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        last_id, synced = 0, 0
+        while True:
+            product_ids = list(
+                Product.objects.filter(pk__gt=last_id).order_by('pk').values_list('pk', flat=True)[:options['chunk_size']]
+            )
+            if not product_ids:
+                break
+            synced += Product.objects.filter(pk__in=product_ids).sync_marketplaces()
+            last_id = product_ids[-1]
+        self.stdout.write(self.style.SUCCESS(f'Done, {synced} products synced.'))
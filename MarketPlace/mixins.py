@@ -1,8 +1,12 @@
-from .models import MarketPlace,Store,Product
+from .models import MarketPlace,Product
 
 class ProductQuerysetMixin():
      def custom_queryset(self,market_place_id):
-        market_place = MarketPlace.objects.get(id=market_place_id)
-        stores_in_marketplace = Store.objects.filter(marketplace=market_place)
-        products_in_marketplace = Product.objects.filter(store__in= stores_in_marketplace )
-        return products_in_marketplace
\ No newline at end of file
+        # a single indexed lookup on the denormalized `Product.marketplace`, see `product_market_created_idx`.
+        # Nothing runs here; whether the marketplace exists is only asked by `check_marketplace` when no product came back.
+        return Product.objects.filter(marketplace=market_place_id)
+
+     def check_marketplace(self,market_place_id,results):
+        # any product of the marketplace proves it exists, so only an empty result costs a lookup
+        if not results and not MarketPlace.objects.filter(id=market_place_id).exists():
+            raise MarketPlace.DoesNotExist("MarketPlace with id '{}' not found.".format(market_place_id))
@@ -1,4 +1,7 @@
-from django.db import models
+from decimal import Decimal
+from django.db import connections, models, transaction
+from django.db.models import Case, Count, DecimalField, ExpressionWrapper, F, OuterRef, Subquery, Sum, Value, When
+from django.db.models.functions import Cast, NullIf
 from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 from django.core.validators import MinValueValidator, MaxValueValidator
@@ -6,6 +9,8 @@ from django.core.exceptions import ValidationError
 from django.contrib.auth import get_user_model
 from django.utils import timezone
 from helpers import *
+from helpers import search
+from helpers.cache import VersionedCache
 
 User = get_user_model()
 
@@ -42,13 +47,28 @@ class Store(TimestampsModel):
     vendor = models.ForeignKey(StoreVendor, verbose_name=_('store vendor'), related_name='stores', on_delete=models.CASCADE)
     name = models.CharField(_('store name'), max_length=255)
     description = models.TextField(_('store description'), null=True, blank=True)
-    logo = ValidatedImageField(upload_to='store/logos', null=True, blank=True)
-    cover_image = ValidatedImageField(upload_to='store/cover_images', null=True, blank=True)
+    logo = ValidatedImageField(upload_to='store/logos', null=True, blank=True, variants_field='logo_variants')
+    logo_variants = models.CharField(
+        _('logo variants generated from'), max_length=100, blank=True, editable=False
+    )
+    cover_image = ValidatedImageField(
+        upload_to='store/cover_images', null=True, blank=True, variants_field='cover_image_variants'
+    )
+    cover_image_variants = models.CharField(
+        _('cover image variants generated from'), max_length=100, blank=True, editable=False
+    )
     country = models.CharField(_('country of location'), max_length=255)
     city = models.CharField(_('store city'), max_length=255)
     province = models.CharField(_('store province'), max_length=255)
     additional_information = models.JSONField(_('store additional information'), null=True, blank=True)
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # the marketplace copied onto the flash sales of the store's products, see `FlashSale.marketplace`
+        instance._loaded_marketplace_id = instance.__dict__.get('marketplace_id')
+        return instance
+
     def __str__(self) -> str:
         return self.name.__str__()
 
@@ -62,12 +82,127 @@ class ProductCategory(TimestampsModel):
         return self.name
 
 
+class InsufficientStock(ValidationError):
+    "Raised when a stock reservation asks for more than a product has on the shelves"
+
+    def __init__(self, available):
+        # `available` maps the id of every product short on stock to its current quantity
+        self.available = available
+        super().__init__({
+            'quantity': [
+                f'Product with id {product_id} has a quantity of {quantity}.'
+                for product_id, quantity in available.items()
+            ]
+        })
+
+
+class ProductQueryset(models.query.QuerySet):
+    def reserve(self, quantities):
+        """
+        Takes `quantities` ({product_id: quantity}) off the shelves, all or nothing. The whole batch
+        is a single conditional `UPDATE ... WHERE quantity >= <requested>`, so concurrent reservations
+        can never oversell, and it is rolled back unless every product had enough stock.
+        The rows are locked in pk order first, so that overlapping batches queue up instead of deadlocking.
+        """
+        quantities = {product_id: quantity for product_id, quantity in quantities.items() if quantity > 0}
+        if not quantities:
+            return
+        requested = Case(
+            *[When(pk=product_id, then=Value(quantity)) for product_id, quantity in quantities.items()],
+            default=Value(0), output_field=models.IntegerField()
+        )
+        with transaction.atomic(using=self.db):
+            self.lock(quantities)
+            updated = self.filter(pk__in=quantities, quantity__gte=requested).update(
+                quantity=F('quantity') - requested
+            )
+            if updated == len(quantities):
+                return
+            transaction.set_rollback(True, using=self.db)
+
+        available = dict.fromkeys(quantities, 0)
+        available.update(self.filter(pk__in=quantities).values_list('pk', 'quantity'))
+        shortages = {
+            product_id: quantity for product_id, quantity in available.items()
+            if quantity < quantities[product_id]
+        }
+        # stock may have been returned since the update, report every product in that case
+        raise InsufficientStock(shortages or available)
+
+    def add_ratings(self, count, total):
+        """
+        Adds `count` ratings with values summing up to `total` to the products' rating aggregates,
+        in one update. Negative figures take ratings away.
+        """
+        return self.update(
+            rating_count=F('rating_count') + count,
+            rating_sum=F('rating_sum') + total,
+            rating_avg=Cast(F('rating_sum') + total, models.FloatField()) / NullIf(F('rating_count') + count, 0),
+        )
+
+    def release(self, quantities):
+        "Returns `quantities` ({product_id: quantity}) to the shelves in a single update query, locking rows like `reserve`"
+        quantities = {product_id: quantity for product_id, quantity in quantities.items() if quantity}
+        if not quantities:
+            return 0
+        with transaction.atomic(using=self.db):
+            self.lock(quantities)
+            return self.filter(pk__in=quantities).update(
+                quantity=F('quantity') + Case(
+                    *[When(pk=product_id, then=Value(quantity)) for product_id, quantity in quantities.items()],
+                    default=Value(0), output_field=models.IntegerField()
+                )
+            )
+
+    def lock(self, pks):
+        """
+        Row-locks the products in `pks` in ascending pk order, for the rest of the transaction. An `UPDATE`
+        locks rows in whatever order it scans them, so two of them over the same products could each hold
+        a lock the other is waiting for. Databases without row locks (SQLite) serialize writers as a whole,
+        and reading first would only hold them up.
+        """
+        if not connections[self.db].features.has_select_for_update:
+            return
+        list(self.select_for_update().filter(pk__in=pks).order_by('pk').values_list('pk', flat=True))
+
+    def bulk_create(self, objs, *args, **kwargs):
+        # `Product.save` isn't called here, so the marketplaces are copied from the stores in one query instead
+        objs = list(objs)
+        store_ids = {obj.store_id for obj in objs if obj.marketplace_id is None}
+        if store_ids:
+            marketplaces = dict(Store.objects.filter(pk__in=store_ids).values_list('pk', 'marketplace'))
+            for obj in objs:
+                if obj.marketplace_id is None:
+                    obj.marketplace_id = marketplaces.get(obj.store_id)
+        return super().bulk_create(objs, *args, **kwargs)
+
+    def sync_marketplaces(self):
+        "Copies each product's marketplace from its store in one update, returning how many products had drifted"
+        return self.exclude(marketplace=F('store__marketplace')).update(
+            marketplace=Subquery(Store.objects.filter(pk=OuterRef('store')).values('marketplace')[:1])
+        )
+
+    def search(self, text):
+        "Ranked full-text search over product names and descriptions, see `helpers.search`"
+        return search.get_index(self.model).search(self, text)
+
+
 class Product(TimestampsModel):
     store = models.ForeignKey(Store, related_name='products', on_delete=models.CASCADE)
+    # denormalized from the store, so that marketplace listings filter and sort products without joining stores.
+    # Set on save and bulk_create, and updated along with the store's marketplace.
+    marketplace = models.ForeignKey(
+        MarketPlace, related_name='products', on_delete=models.CASCADE, null=True, editable=False
+    )
     category = models.ForeignKey(ProductCategory, related_name='products', on_delete=models.CASCADE)
     name = models.CharField(_('product name'), max_length=255)
     description = models.TextField(_('product description'), null=True, blank=True)
-    cover_image = ValidatedImageField(upload_to='products/cover_images', null=True, blank=True)
+    cover_image = ValidatedImageField(
+        upload_to='products/cover_images', null=True, blank=True, variants_field='cover_image_variants'
+    )
+    cover_image_variants = models.CharField(
+        _('cover image variants generated from'), max_length=100, blank=True, editable=False
+    )
     quantity = models.IntegerField(_('available quantity'), default=0)
     discount = models.DecimalField(_('discount percentage'), decimal_places=2, max_digits=5, default=0.00)
 
@@ -77,6 +212,43 @@ class Product(TimestampsModel):
     currency_abbrev = models.CharField(_('abbreviated product currency'), max_length=3, default='NGN')
     currency_verbose = models.CharField(_('verbose product currency'), max_length=20, default='Naira')
 
+    # rating aggregates, kept up to date as ratings are saved and deleted (see MarketPlace.signals)
+    # and rebuilt from scratch by the `rebuild_product_ratings` management command.
+    rating_count = models.PositiveIntegerField(_('number of ratings'), default=0, editable=False)
+    rating_sum = models.PositiveIntegerField(_('sum of rating values'), default=0, editable=False)
+    rating_avg = models.FloatField(_('average rating'), null=True, blank=True, editable=False)
+
+    objects = models.manager.BaseManager.from_queryset(ProductQueryset)()
+
+    class Meta(TimestampsModel.Meta):
+        indexes = [
+            models.Index(fields=['marketplace', '-created_at', '-id'], name='product_market_created_idx'),
+            models.Index(fields=['marketplace', '-rating_avg', '-id'], name='product_rating_avg_idx'),
+        ]
+
+    # only ever moved by the relative updates of `ProductQueryset.add_ratings`
+    RATING_FIELDS = ('rating_count', 'rating_sum', 'rating_avg')
+
+    def save(self, *args, **kwargs):
+        if self.marketplace_id is None or self.store_id != getattr(self, '_loaded_store_id', None):
+            self.marketplace_id = self.store.marketplace_id
+        if not self._state.adding and not args and kwargs.get('update_fields') is None \
+                and not kwargs.get('force_insert'):
+            # a full save would write back the aggregates as they were loaded, undoing any rating saved since
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in self.RATING_FIELDS
+            ]
+        return super().save(*args, **kwargs)
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # the discount last stored, so that saves which don't change it leave the promotions cache alone
+        instance._loaded_discount = instance.__dict__.get('discount')
+        instance._loaded_store_id = instance.__dict__.get('store_id')
+        return instance
+
     @property
     def discounted_price(self):
         return self.price - (self.price * self.discount / 100)
@@ -85,10 +257,18 @@ class Product(TimestampsModel):
         return self.name
 
 
+search.register(Product, {'name': 'A', 'description': 'B'})
+
+
 class FavouriteProduct(TimestampsModel):
     user = models.ForeignKey(User, related_name='favourite_products', on_delete=models.CASCADE)
     product = models.ForeignKey(Product, related_name='enlisted_favourites', on_delete=models.CASCADE)
 
+    class Meta(TimestampsModel.Meta):
+        indexes = [
+            models.Index(fields=['user', '-created_at', '-id'], name='favourite_product_user_idx'),
+        ]
+
     def __str__(self) -> str:
         return self.product.__str__()
 
@@ -106,6 +286,13 @@ class ProductRating(TimestampsModel):
     product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='ratings')
     value = models.PositiveSmallIntegerField(default=5, validators=[MinValueValidator(1), MaxValueValidator(5)])
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # the value counted in the product's rating aggregates
+        instance._aggregated_value = instance.__dict__.get('value')
+        return instance
+
     def __str__(self) -> str:
         return f"{self.user.__str__()} rates {self.product.__str__()} a {self.value}/5"
 
@@ -123,26 +310,64 @@ class ProductReaction(TimestampsModel):
         return f"{self.product.__str__()} {self.reaction}d by {self.reactor.__str__() or 'AnonymousUser'}"
 
 
+def _price_breakdown(gross_total, discount_total):
+    """
+    Turns sum(price * quantity) and sum(price * discount * quantity) into the actual price and the
+    discount amount. Both sums are exact at 2 and 4 decimal places respectively, quantizing them drops
+    the float noise of backends (SQLite) that compute decimal arithmetic with floats.
+    """
+    return gross_total.quantize(Decimal('0.01')), discount_total.quantize(Decimal('0.0001')) / 100
+
+
+class CartQueryset(models.query.QuerySet):
+    def with_totals(self):
+        """
+        Annotates every cart with the figures `Cart._summary` is built from, so that the
+        totals, the item count and the currency are all worked out in one database query.
+        """
+        return self.annotate(
+            items_count=Count('items'),
+            gross_total=Sum(
+                F('items__product__price') * F('items__quantity'),
+                output_field=DecimalField(max_digits=24, decimal_places=2)
+            ),
+            discount_total=Sum(
+                F('items__product__price') * F('items__product__discount') * F('items__quantity'),
+                output_field=DecimalField(max_digits=30, decimal_places=4)
+            ),
+            # the currency of the most recently added cartitem's product, as `self.items.first()` gave.
+            currency_symbol=Subquery(
+                CartItem.objects.filter(cart=OuterRef('pk')).values('product__currency_symbol')[:1]
+            ),
+        )
+
+
 class Cart(TimestampsModel):
     owner = models.OneToOneField(User, related_name='cart', on_delete=models.CASCADE)
     delivery_address = models.CharField(_('delivery address'), max_length=255, blank=True)
 
+    objects = models.manager.BaseManager.from_queryset(CartQueryset)()
+
     @property
     def _summary(self):
-        cartitems = self.items.prefetch_related('product').all()
-        if not cartitems:
+        if hasattr(self, 'items_count'):
+            # loaded through `Cart.objects.with_totals()`, no further queries required.
+            totals = self.__dict__
+        elif self.pk is not None:
+            totals = Cart.objects.filter(pk=self.pk).with_totals().values(
+                'items_count', 'gross_total', 'discount_total', 'currency_symbol'
+            ).get()
+        else:
+            totals = {'items_count': 0}
+        if not totals['items_count']:
             return {'sub_total':0, 'total_discount':0, 'currency':'₦'}
-        sub_total = total_discount = 0
-        for cartitem in cartitems:
-            actual_price = cartitem.product.price
-            discounted_price = cartitem.product.discounted_price
-            sub_total += (discounted_price * cartitem.quantity)
-            total_discount += (actual_price - discounted_price) * cartitem.quantity
+        # sub_total = sum((price - price * discount / 100) * quantity)
+        # total_discount = sum(price * discount / 100 * quantity)
+        gross_total, total_discount = _price_breakdown(totals['gross_total'], totals['discount_total'])
         return {
-            # getting the currency from the first cartitem's product (#noqa)
-            'currency':self.items.first().product.currency_symbol,
+            'currency':totals['currency_symbol'],
             'delivery_address':self.delivery_address,
-            'sub_total':sub_total,
+            'sub_total':gross_total - total_discount,
             'total_discount':total_discount
         }
 
@@ -151,11 +376,43 @@ class Cart(TimestampsModel):
 
 
 class CartItemQueryset(models.query.QuerySet):
+    def with_prices(self):
+        "Annotates every cartitem with the figures `_actual_price` and `_discounted_price` are derived from"
+        return self.annotate(
+            gross_total=ExpressionWrapper(
+                F('product__price') * F('quantity'),
+                output_field=DecimalField(max_digits=24, decimal_places=2)
+            ),
+            discount_total=ExpressionWrapper(
+                F('product__price') * F('product__discount') * F('quantity'),
+                output_field=DecimalField(max_digits=30, decimal_places=4)
+            ),
+        )
+
     def delete(self, *args, **kwargs):
-        for cartitem in self.all():
-            cartitem.product.quantity += cartitem.quantity
-            cartitem.product.save()
-        return super().delete(*args, **kwargs)
+        # return the product(s) to the shelves, grouped by product so that clearing any number of
+        # cartitems costs one aggregate query, one product update and one delete.
+        with transaction.atomic(using=self.db):
+            cartitems = self.lock()
+            returned_quantities = dict(
+                cartitems.order_by().values_list('product').annotate(total=Sum('quantity'))
+            )
+            Product.objects.release(returned_quantities)
+            return super(CartItemQueryset, cartitems).delete(*args, **kwargs)
+
+    def lock(self):
+        """
+        Row-locks the cartitems in pk order, like `ProductQueryset.lock`, so that their quantities can't change
+        before the transaction ends, and returns them as a queryset of exactly the locked rows.
+        """
+        features = connections[self.db].features
+        if not features.has_select_for_update:
+            return self
+        pks = list(
+            self.select_for_update(of=('self',) if features.has_select_for_update_of else ())
+            .order_by('pk').values_list('pk', flat=True)
+        )
+        return self.model._default_manager.using(self.db).filter(pk__in=pks)
 
 
 class CartItem(TimestampsModel):
@@ -182,54 +439,68 @@ class CartItem(TimestampsModel):
 
     @property
     def _actual_price(self):
+        if 'gross_total' in self.__dict__:
+            # loaded through `CartItem.objects.with_prices()`
+            return _price_breakdown(self.gross_total, self.discount_total)[0]
         return self.product.price * self.quantity
 
     @property
     def _discounted_price(self):
+        if 'gross_total' in self.__dict__:
+            actual_price, discount = _price_breakdown(self.gross_total, self.discount_total)
+            return actual_price - discount
         return self.product.discounted_price * self.quantity
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # the quantity currently held off the shelves, so that `save` can work out how much stock
+        # to move without fetching the original row again.
+        instance._reserved_quantity = instance.__dict__.get('quantity')
+        return instance
+
     def save(
         self, force_insert=False, force_update=False, using=None, update_fields=None
     ):
-        invalid_quantity = ValidationError(
-            {
-            'quantity': f'Invalid quantity: {self.quantity}. Product \'{self.product.__str__()}\' '
-                        f'has a quantity of {self.product.quantity}.'
-            }
-        )
-        if bool(self.pk) is True:
-            # functionality to check if the quantity is updated, from when last this object was saved and
-            # then make the corresponding increase or decrease to the product's available quantity.
-            original = self.__class__.objects.get(pk=self.pk)
-            quantity_was_updated = original.quantity != self.quantity
-            if quantity_was_updated:
-                if self.quantity < 0:
-                    raise invalid_quantity
-                difference = original.quantity - self.quantity
-                if self.product.quantity + difference < 0:
-                    raise invalid_quantity
-                self.product.quantity += difference
-                self.product.save()
+        if self.quantity < 0:
+            raise ValidationError({'quantity': f'Invalid quantity: {self.quantity}.'})
 
+        if self._state.adding:
+            reserved = 0
+        elif getattr(self, '_reserved_quantity', None) is not None:
+            reserved = self._reserved_quantity
         else:
-            # take the product(s) from the shelves
-            if self.product.quantity < self.quantity:
-                raise invalid_quantity
-            self.product.quantity -= self.quantity
-            self.product.save()
-
-        super().save(
-            using=using,
-            force_insert=force_insert,
-            force_update=force_update,
-            update_fields=update_fields,
-        )
+            reserved = self.__class__.objects.filter(pk=self.pk).values_list('quantity', flat=True).get()
+        difference = self.quantity - reserved
+
+        with transaction.atomic(using=using):
+            # take the product(s) from, or return them to, the shelves
+            if difference > 0:
+                try:
+                    Product.objects.reserve({self.product_id: difference})
+                except InsufficientStock as error:
+                    raise ValidationError(
+                        {
+                        'quantity': f'Invalid quantity: {self.quantity}. Product \'{self.product.__str__()}\' '
+                                    f'has a quantity of {error.available[self.product_id]}.'
+                        }
+                    )
+            elif difference < 0:
+                Product.objects.release({self.product_id: -difference})
+
+            super().save(
+                using=using,
+                force_insert=force_insert,
+                force_update=force_update,
+                update_fields=update_fields,
+            )
+        self._reserved_quantity = self.quantity
 
     def delete(self, *args, **kwargs): # noqa
         # return the product(s) to the shelves
-        self.product.quantity += self.quantity
-        self.product.save()
-        return super().delete(*args, **kwargs)
+        with transaction.atomic():
+            Product.objects.release({self.product_id: getattr(self, '_reserved_quantity', self.quantity)})
+            return super().delete(*args, **kwargs)
 
     def __str__(self) -> str:
         return f"Cart item: {self.quantity} nos of '{self.product.__str__()}'"
@@ -250,8 +521,30 @@ class Order(TimestampsModel):
         return f"{self.status}: {self.quantity} nos of {self.product.__str__()}"
 
 
+# responses of the hot deals and flash sale listings, per marketplace
+promotions_cache = VersionedCache('marketplace-promotions', timeout=30)
+
+
+class FlashSaleQueryset(models.query.QuerySet):
+    def active(self, at=None):
+        "Sales running at `at` (now by default); filtered by marketplace this is a range scan of `flash_sale_active_idx`"
+        at = at or timezone.now()
+        return self.filter(end_datetime__gte=at, start_datetime__lte=at)
+
+    def sync_marketplaces(self):
+        "Copies each sale's marketplace from its product's store in one update, returning how many sales had drifted"
+        return self.exclude(marketplace=F('product__store__marketplace')).update(
+            marketplace=Subquery(Store.objects.filter(products=OuterRef('product')).values('marketplace')[:1])
+        )
+
+
 class FlashSale(TimestampsModel):
     product = models.ForeignKey(Product, related_name='flashsaleproducts', on_delete=models.CASCADE)
+    # denormalized from the product's store, so that live sales are listed without joining through
+    # products and stores. Set on save, and kept in step by `sync_marketplaces` when products or stores move.
+    marketplace = models.ForeignKey(
+        MarketPlace, related_name='flash_sales', on_delete=models.CASCADE, null=True, editable=False
+    )
   
     discount_percentage = models.DecimalField(
         _('discount percentage'), 
@@ -261,6 +554,18 @@ class FlashSale(TimestampsModel):
     start_datetime = models.DateTimeField(_('start datetime'))
     end_datetime = models.DateTimeField(_('end datetime'))
 
+    objects = models.manager.BaseManager.from_queryset(FlashSaleQueryset)()
+
+    class Meta(TimestampsModel.Meta):
+        indexes = [
+            # sales that ended before now fall outside the scanned range, however many there are
+            models.Index(fields=['marketplace', 'end_datetime', 'start_datetime'], name='flash_sale_active_idx'),
+        ]
+
+    def save(self, *args, **kwargs):
+        self.marketplace_id = Store.objects.filter(products=self.product_id).values_list('marketplace', flat=True).get()
+        return super().save(*args, **kwargs)
+
     def __str__(self) -> str:
         return f"Flash Sale for {self.product.name} - {self.discount_percentage}% off"
 
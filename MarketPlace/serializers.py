@@ -1,4 +1,7 @@
+from collections import Counter
+from django.db import transaction
 from rest_framework import serializers
+from helpers.fields import HeaderImageSerializerMixin, ImageVariantsField
 from .models import *
 
 
@@ -52,8 +55,62 @@ class CartItemSerializer(serializers.ModelSerializer):
         }
 
 
+class CartItemBatchEntrySerializer(serializers.Serializer):
+    product = serializers.IntegerField()
+    quantity = serializers.IntegerField(min_value=1, default=1)
+
+
+class CartItemBatchSerializer(serializers.Serializer):
+    "Validates and adds a list of items to a cart, with one product query and one stock reservation"
+
+    max_items = 100
+
+    items = CartItemBatchEntrySerializer(many=True, allow_empty=False, max_length=max_items)
+
+    def validate_items(self, items):
+        products = Product.objects.in_bulk({item['product'] for item in items})
+        errors = [
+            {} if item['product'] in products else
+            {'product': [f'Invalid pk "{item["product"]}" - object does not exist.']}
+            for item in items
+        ]
+        if any(errors):
+            raise serializers.ValidationError(errors)
+        return [{**item, 'product': products[item['product']]} for item in items]
+
+    def create(self, validated_data):
+        cart, items = validated_data['cart'], validated_data['items']
+        quantities = Counter()
+        for item in items:
+            quantities[item['product'].id] += item['quantity']
+        with transaction.atomic():
+            try:
+                Product.objects.reserve(quantities)
+            except InsufficientStock as error:
+                raise serializers.ValidationError({'items': [
+                    {
+                        'quantity': [
+                            f'Invalid quantity: {item["quantity"]}. Product \'{item["product"].__str__()}\' '
+                            f'has a quantity of {error.available[item["product"].id]}.'
+                        ]
+                    } if item['product'].id in error.available else {}
+                    for item in items
+                ]})
+            # the stock is already reserved for the whole batch, bulk_create skips CartItem.save
+            cartitems = CartItem.objects.bulk_create(
+                [CartItem(cart=cart, **item) for item in items]
+            )
+        for cartitem in cartitems:
+            cartitem._reserved_quantity = cartitem.quantity
+        return cartitems
+
+    def to_representation(self, instance):
+        return {'items': CartItemSerializer(instance, many=True).data}
+
+
+class ProductSerializer(HeaderImageSerializerMixin, serializers.ModelSerializer):
+    cover_image_variants = ImageVariantsField(source='cover_image')
 
-class ProductSerializer(serializers.ModelSerializer):
     class Meta:
         model = Product
         fields = '__all__'
@@ -86,7 +143,10 @@ class StoreVendorSerializer(serializers.ModelSerializer):
         }
 
 
-class StoreSerializer(serializers.ModelSerializer):
+class StoreSerializer(HeaderImageSerializerMixin, serializers.ModelSerializer):
+    logo_variants = ImageVariantsField(source='logo')
+    cover_image_variants = ImageVariantsField(source='cover_image')
+
     class Meta:
         model = Store
         fields = '__all__'
@@ -0,0 +1,55 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from decimal import Decimal
+from .models import FlashSale, Product, ProductRating, Store, promotions_cache
+
+
+@receiver(post_save, sender=ProductRating)
+def add_rating_to_product_aggregates(sender, instance, created, **kwargs):
+    if created:
+        Product.objects.filter(pk=instance.product_id).add_ratings(1, instance.value)
+    elif getattr(instance, '_aggregated_value', None) not in (None, instance.value):
+        Product.objects.filter(pk=instance.product_id).add_ratings(0, instance.value - instance._aggregated_value)
+    instance._aggregated_value = instance.value
+
+
+@receiver(post_delete, sender=ProductRating)
+def remove_rating_from_product_aggregates(sender, instance, **kwargs):
+    Product.objects.filter(pk=instance.product_id).add_ratings(
+        -1, -getattr(instance, '_aggregated_value', instance.value)
+    )
+
+
+@receiver(post_save, sender=Product)
+def invalidate_promotions_on_product_save(sender, instance, created, **kwargs):
+    loaded_discount = getattr(instance, '_loaded_discount', None)
+    if created or loaded_discount is None or Decimal(str(instance.discount)) != loaded_discount:
+        promotions_cache.invalidate(instance.marketplace_id)
+    instance._loaded_discount = Decimal(str(instance.discount))
+    if not created and instance.store_id != getattr(instance, '_loaded_store_id', instance.store_id):
+        FlashSale.objects.filter(product=instance).sync_marketplaces()
+    instance._loaded_store_id = instance.store_id
+
+
+@receiver(post_save, sender=Store)
+def sync_marketplaces_on_store_save(sender, instance, created, **kwargs):
+    if not created and instance.marketplace_id != getattr(instance, '_loaded_marketplace_id', instance.marketplace_id):
+        Product.objects.filter(store=instance).update(marketplace=instance.marketplace_id)
+        FlashSale.objects.filter(product__store=instance).sync_marketplaces()
+    instance._loaded_marketplace_id = instance.marketplace_id
+
+
+@receiver(post_delete, sender=Product)
+def invalidate_promotions_on_product_delete(sender, instance, **kwargs):
+    promotions_cache.invalidate(instance.marketplace_id)
+
+
+@receiver(post_save, sender=FlashSale)
+@receiver(post_delete, sender=FlashSale)
+def invalidate_promotions_on_flash_sale_change(sender, instance, **kwargs):
+    invalidate_marketplace_promotions(Store.objects.filter(products=instance.product_id))
+
+
+def invalidate_marketplace_promotions(stores):
+    for marketplace_id in stores.values_list('marketplace_id', flat=True).distinct():
+        promotions_cache.invalidate(marketplace_id)
@@ -2,12 +2,30 @@ from rest_framework.test import APIClient, APITestCase
 from django.core.exceptions import ValidationError
 from django.contrib.auth import get_user_model
 from rest_framework import status
-from django.test import TestCase
+from django.test import TestCase, TransactionTestCase, override_settings, skipUnlessDBFeature
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection, OperationalError
+from django.test.utils import CaptureQueriesContext
 from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+from django.http import HttpRequest
 from django.urls import reverse
+from django.core.management import call_command
 from .models import *
+from .serializers import CartItemBatchSerializer, StoreSerializer
+from .views import StoreProductUpdateView, StoreView
+from helpers import variants
+from helpers.storage import ContentAddressedStorage
+from helpers.uploadhandler import UploadRejected, ValidatingUploadHandler
 from PIL import Image
-import tempfile, os
+from datetime import timedelta
+from decimal import Decimal
+from io import BytesIO, StringIO
+from unittest.mock import patch
+import base64, hashlib, tempfile, os, shutil, threading, time
 
 User = get_user_model()
 
@@ -144,6 +162,149 @@ class CartItem_Product_RelationshipTestCase(TestCase):
         User.objects.all().delete()
 
 
+class ProductStockReservationTestCase(TestCase):
+
+    def setUp(self):
+        user = User.objects.create_user(
+            email= 'test@domain.com',password= 'password'
+        )
+        marketplace = MarketPlace.objects.create(
+            name='E-commerce', cover_image='path/to/image.extension'
+        )
+        vendor = StoreVendor.objects.create(
+            user=user, email=user.email
+        )
+        store = Store.objects.create(
+            marketplace= marketplace,  vendor=vendor, name='Apple',
+            country='US', city='Chicago', province='Stonetown'
+        )
+        product_category = ProductCategory.objects.create(
+            marketplace=marketplace, name='Electronics & Gadgets'
+        )
+        self.product1 = Product.objects.create(
+            store=store, category=product_category,
+            name='Apple Vision Pro', price=3499.99, quantity=10
+        )
+        self.product2 = Product.objects.create(
+            store=store, category=product_category,
+            name='Ergonomic chair', price=2199.99, quantity=2
+        )
+
+    def test_reserve_batch(self):
+        Product.objects.reserve({self.product1.id: 4, self.product2.id: 2})
+        self.product1.refresh_from_db()
+        self.product2.refresh_from_db()
+        self.assertEqual((self.product1.quantity, self.product2.quantity), (6, 0))
+
+    def test_reserve_batch_is_all_or_nothing(self):
+        with self.assertRaises(InsufficientStock) as context:
+            Product.objects.reserve({self.product1.id: 4, self.product2.id: 3})
+        self.assertDictEqual(context.exception.available, {self.product2.id: 2})
+        self.product1.refresh_from_db()
+        self.product2.refresh_from_db()
+        self.assertEqual((self.product1.quantity, self.product2.quantity), (10, 2))
+
+    @skipUnlessDBFeature('has_select_for_update')
+    def test_reserve_batch_locks_rows_in_pk_order(self):
+        with CaptureQueriesContext(connection) as context:
+            Product.objects.reserve({self.product2.id: 1, self.product1.id: 1})
+        lock, update = [query['sql'] for query in context.captured_queries if 'MarketPlace_product' in query['sql']]
+        self.assertTrue(lock.startswith('SELECT'))
+        self.assertIn('ORDER BY "MarketPlace_product"."id" ASC FOR UPDATE', lock)
+        self.assertTrue(update.startswith('UPDATE'))
+
+    def test_release_batch(self):
+        Product.objects.release({self.product1.id: 4, self.product2.id: 1})
+        self.product1.refresh_from_db()
+        self.product2.refresh_from_db()
+        self.assertEqual((self.product1.quantity, self.product2.quantity), (14, 3))
+
+    def test_cartitem_update_does_not_refetch_itself(self):
+        cart = Cart.objects.create(owner=User.objects.get())
+        cartitem = CartItem.objects.create(cart=cart, product=self.product1, quantity=4)
+        cartitem.quantity = 6
+        with CaptureQueriesContext(connection) as context:
+            cartitem.save()
+        self.assertFalse([query for query in context.captured_queries if query['sql'].startswith('SELECT')])
+        self.product1.refresh_from_db()
+        self.assertEqual(self.product1.quantity, 4)
+
+    def tearDown(self):
+        CartItem.objects.all().delete()
+        Cart.objects.all().delete()
+        Product.objects.all().delete()
+        ProductCategory.objects.all().delete()
+        Store.objects.all().delete()
+        MarketPlace.objects.all().delete()
+        User.objects.all().delete()
+
+
+class ProductStockReservationStressTestCase(TransactionTestCase):
+
+    writers = 120
+    stock = 50
+
+    def setUp(self):
+        marketplace = MarketPlace.objects.create(
+            name='E-commerce', cover_image='path/to/image.extension'
+        )
+        vendor_user = User.objects.create_user(
+            email='vendor@domain.com', password='password'
+        )
+        vendor = StoreVendor.objects.create(
+            user=vendor_user, email=vendor_user.email
+        )
+        store = Store.objects.create(
+            marketplace= marketplace,  vendor=vendor, name='Apple',
+            country='US', city='Chicago', province='Stonetown'
+        )
+        product_category = ProductCategory.objects.create(
+            marketplace=marketplace, name='Electronics & Gadgets'
+        )
+        self.product = Product.objects.create(
+            store=store, category=product_category,
+            name='Apple Vision Pro', price=3499.99, quantity=self.stock
+        )
+        self.carts = [
+            Cart.objects.create(
+                owner=User.objects.create(email=f'buyer{i}@domain.com')
+            ) for i in range(self.writers)
+        ]
+
+    def test_concurrent_writers_never_oversell(self):
+        barrier = threading.Barrier(self.writers)
+        outcomes = []
+
+        def add_to_cart(cart):
+            barrier.wait()
+            try:
+                while True:
+                    try:
+                        CartItem.objects.create(cart=cart, product_id=self.product.id, quantity=1)
+                        outcomes.append(True)
+                        return
+                    except ValidationError:
+                        outcomes.append(False)
+                        return
+                    except OperationalError:
+                        # SQLite answers write contention with "database table is locked", try again
+                        time.sleep(0.001)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=add_to_cart, args=(cart,)) for cart in self.carts]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.product.refresh_from_db()
+        self.assertEqual(len(outcomes), self.writers)
+        self.assertEqual(outcomes.count(True), self.stock)
+        self.assertEqual(self.product.quantity, 0)
+        self.assertEqual(CartItem.objects.count(), self.stock)
+
+
 class GetProductCategoriesTestCase(TestCase):
 
     def setUp(self):
@@ -250,6 +411,68 @@ class CartViewTestCase(TestCase):
         self.product.refresh_from_db()
         self.assertEqual(self.product.quantity, 5)
 
+    def test_add_cart_items(self):
+        self.client.force_authenticate(user=self.user)
+        other_product = Product.objects.create(
+            store=self.product.store, category=self.product.category,
+            name='Apple Watch', quantity=10, price=399.99
+        )
+        items = [{'product': (self.product.id, other_product.id)[i % 2], 'quantity': 1} for i in range(12)]
+
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.post(
+                reverse('MarketPlace:add-cart-items'), data={'items': items}, format='json'
+            )
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(len(response.json()['items']), 12)
+        self.assertEqual(response.json()['items'][0]['product_details']['name'], 'Apple Vision Pro')
+        self.assertEqual(self.user.cart.items.count(), 12)
+        self.assertLessEqual(len(context.captured_queries), 8)
+        self.product.refresh_from_db()
+        other_product.refresh_from_db()
+        self.assertEqual((self.product.quantity, other_product.quantity), (4, 4))
+
+    def test_add_cart_items_with_insufficient_stock(self):
+        self.client.force_authenticate(user=self.user)
+
+        response = self.client.post(
+            reverse('MarketPlace:add-cart-items'),
+            data={'items': [{'product': self.product.id, 'quantity': 6}, {'product': self.product.id, 'quantity': 6}]},
+            format='json'
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('has a quantity of 10', response.json()['items'][0]['quantity'][0])
+        self.assertEqual(self.user.cart.items.count(), 0)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.quantity, 10)
+
+    def test_add_cart_items_with_invalid_product(self):
+        self.client.force_authenticate(user=self.user)
+
+        response = self.client.post(
+            reverse('MarketPlace:add-cart-items'),
+            data={'items': [{'product': self.product.id, 'quantity': 1}, {'product': 999, 'quantity': 1}]},
+            format='json'
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertDictEqual(response.json()['items'][0], {})
+        self.assertIn('product', response.json()['items'][1])
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.quantity, 10)
+
+    def test_add_cart_items_limits_batch_size(self):
+        self.client.force_authenticate(user=self.user)
+        items = [{'product': self.product.id, 'quantity': 1}] * (CartItemBatchSerializer.max_items + 1)
+
+        response = self.client.post(reverse('MarketPlace:add-cart-items'), data={'items': items}, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('items', response.json())
+        self.assertEqual(self.user.cart.items.count(), 0)
+
     def test_remove_cart_item(self):
         self.client.force_authenticate(user=self.user)
 
@@ -320,6 +543,33 @@ class CartViewTestCase(TestCase):
         self.assertTrue(hasattr(response, 'json'))
         self.assertEqual(len(response.json()['results']), 2)
 
+    def test_get_user_cart_items_query_count_is_independent_of_page_size(self):
+        self.client.force_authenticate(self.user)
+        self.product.quantity = 1000
+        self.product.save()
+        other_product = Product.objects.create(
+            store=self.product.store, category=self.product.category,
+            name='Apple Watch', quantity=1000, price='399.99', discount='12.50',
+            cover_image='products/cover_images/watch.jpg'
+        )
+
+        query_counts = []
+        for size in (2, 10):
+            CartItem.objects.all().delete()
+            for i in range(size):
+                CartItem.objects.create(cart=self.cart, product=(self.product, other_product)[i % 2], quantity=3)
+            with CaptureQueriesContext(connection) as context:
+                response = self.client.get(reverse('MarketPlace:user-cart-items-list'))
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertEqual(len(response.json()['results']), size)
+            query_counts.append(len(context.captured_queries))
+
+        self.assertEqual(query_counts[0], query_counts[1])
+        watch = next(item for item in response.json()['results'] if item['product'] == other_product.id)
+        self.assertEqual(watch['product_details']['cover_image'], '/media/products/cover_images/watch.jpg')
+        self.assertEqual(watch['actual_price'], '1199.97')
+        self.assertEqual(watch['discounted_price'], '1049.97')
+
     def test_delete_user_cart_items(self):
         self.client.force_authenticate(self.user)
 
@@ -328,6 +578,47 @@ class CartViewTestCase(TestCase):
         response = self.client.delete(reverse('MarketPlace:user-cart-dump'))
 
         self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertEqual(self.user.cart.items.count(), 0)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.quantity, 10)
+
+    @skipUnlessDBFeature('has_select_for_update')
+    def test_delete_cart_items_locks_rows_in_pk_order(self):
+        CartItem.objects.bulk_create([CartItem(cart=self.cart, product=self.product, quantity=1) for _ in range(2)])
+        with CaptureQueriesContext(connection) as context:
+            self.cart.items.all().delete()
+        queries = [query['sql'] for query in context.captured_queries if 'MarketPlace_cartitem' in query['sql']]
+        # the lock comes before the quantities are summed
+        self.assertIn('ORDER BY "MarketPlace_cartitem"."id" ASC FOR UPDATE', queries[0])
+        self.assertIn('SUM(', queries[1])
+
+    def test_delete_user_cart_items_query_count_is_independent_of_cart_size(self):
+        self.client.force_authenticate(self.user)
+        self.product.quantity = 1000
+        self.product.save()
+        other_product = Product.objects.create(
+            store=self.product.store, category=self.product.category,
+            name='Apple Watch', quantity=1000, price=399.99
+        )
+
+        query_counts = []
+        for size in (2, 50):
+            CartItem.objects.bulk_create([
+                CartItem(cart=self.cart, product=(self.product, other_product)[i % 2], quantity=3)
+                for i in range(size)
+            ])
+            with CaptureQueriesContext(connection) as context:
+                response = self.client.delete(reverse('MarketPlace:user-cart-dump'))
+            self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+            query_counts.append(len(context.captured_queries))
+
+        self.assertEqual(query_counts[0], query_counts[1])
+        self.assertEqual(self.user.cart.items.count(), 0)
+        self.product.refresh_from_db()
+        other_product.refresh_from_db()
+        # bulk_create skipped the reservations, so the stock returned is on top of the initial 1000
+        self.assertEqual(self.product.quantity, 1000 + 3 * (1 + 25))
+        self.assertEqual(other_product.quantity, 1000 + 3 * (1 + 25))
 
     def tearDown(self):
         CartItem.objects.all().delete()
@@ -339,6 +630,135 @@ class CartViewTestCase(TestCase):
         User.objects.all().delete()
 
 
+class CartSummaryTestCase(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email='test@domain.com', password='password'
+        )
+        marketplace = MarketPlace.objects.create(
+            name='E-commerce', cover_image='path/to/image.extension'
+        )
+        vendor = StoreVendor.objects.create(
+            user=self.user, email=self.user.email
+        )
+        store = Store.objects.create(
+            marketplace= marketplace,  vendor=vendor, name='Apple',
+            country='US', city='Chicago', province='Stonetown'
+        )
+        product_category = ProductCategory.objects.create(
+            marketplace=marketplace, name='Electronics & Gadgets'
+        )
+        self.product1 = Product.objects.create(
+            store=store, category=product_category, name='Apple Vision Pro',
+            quantity=10, price='3499.99', discount='12.50', currency_symbol='$'
+        )
+        self.product2 = Product.objects.create(
+            store=store, category=product_category, name='Ergonomic chair',
+            quantity=10, price='2199.99', discount='33.33', currency_symbol='€'
+        )
+        self.cart = Cart.objects.create(owner=self.user)
+
+    def test_summary_matches_per_item_totals(self):
+        CartItem.objects.create(cart=self.cart, product=self.product1, quantity=3)
+        CartItem.objects.create(cart=self.cart, product=self.product2, quantity=7)
+        sub_total = total_discount = 0
+        for product, quantity in ((self.product1, 3), (self.product2, 7)):
+            product.refresh_from_db()
+            sub_total += product.discounted_price * quantity
+            total_discount += (product.price - product.discounted_price) * quantity
+
+        with self.assertNumQueries(1):
+            summary = self.cart._summary
+
+        self.assertEqual(summary['sub_total'], sub_total)
+        self.assertEqual(summary['total_discount'], total_discount)
+        self.assertEqual(summary['currency'], '€')
+
+    def test_summary_of_empty_cart(self):
+        self.assertDictEqual(
+            self.cart._summary, {'sub_total':0, 'total_discount':0, 'currency':'₦'}
+        )
+
+    def test_summary_of_cart_loaded_with_totals(self):
+        CartItem.objects.create(cart=self.cart, product=self.product1, quantity=2)
+        cart = Cart.objects.with_totals().get(pk=self.cart.pk)
+
+        with self.assertNumQueries(0):
+            summary = cart._summary
+
+        self.assertEqual(summary['total_discount'], Decimal('874.9975'))
+
+    def tearDown(self):
+        CartItem.objects.all().delete()
+        Cart.objects.all().delete()
+        Product.objects.all().delete()
+        ProductCategory.objects.all().delete()
+        Store.objects.all().delete()
+        MarketPlace.objects.all().delete()
+        User.objects.all().delete()
+
+
+class FlashSaleMarketplaceTestCase(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create(email='flashsale@example.com')
+        self.vendor = StoreVendor.objects.create(user=self.user, email=self.user.email, id_type='NIN')
+        self.marketplace = MarketPlace.objects.create(name='Market 1', cover_image='market.jpg')
+        self.other_marketplace = MarketPlace.objects.create(name='Market 2', cover_image='market.jpg')
+        self.store = Store.objects.create(
+            marketplace=self.marketplace, vendor=self.vendor, name='Store 1',
+            country='Nigeria', city='Lagos', province='Lagos'
+        )
+        self.category = ProductCategory.objects.create(marketplace=self.marketplace, name='Category')
+        self.product = Product.objects.create(store=self.store, category=self.category, name='Product', price=10)
+        self.now = timezone.now()
+        self.flash_sale = FlashSale.objects.create(
+            product=self.product, discount_percentage=20,
+            start_datetime=self.now - timedelta(hours=1), end_datetime=self.now + timedelta(hours=1)
+        )
+
+    def test_marketplace_copied_on_save(self):
+        self.assertEqual(self.flash_sale.marketplace_id, self.marketplace.id)
+
+    def test_active(self):
+        FlashSale.objects.create(
+            product=self.product, discount_percentage=20,
+            start_datetime=self.now - timedelta(days=2), end_datetime=self.now - timedelta(days=1)
+        )
+        FlashSale.objects.create(
+            product=self.product, discount_percentage=20,
+            start_datetime=self.now + timedelta(days=1), end_datetime=self.now + timedelta(days=2)
+        )
+        self.assertQuerysetEqual(
+            FlashSale.objects.filter(marketplace=self.marketplace).active(self.now), [self.flash_sale]
+        )
+
+    def test_moving_store_syncs_flash_sales(self):
+        self.store.marketplace = self.other_marketplace
+        self.store.save()
+        self.flash_sale.refresh_from_db()
+        self.assertEqual(self.flash_sale.marketplace_id, self.other_marketplace.id)
+
+    def test_moving_product_syncs_flash_sales(self):
+        other_store = Store.objects.create(
+            marketplace=self.other_marketplace, vendor=self.vendor, name='Store 2',
+            country='Nigeria', city='Lagos', province='Lagos'
+        )
+        self.product.store = other_store
+        self.product.save()
+        self.flash_sale.refresh_from_db()
+        self.assertEqual(self.flash_sale.marketplace_id, self.other_marketplace.id)
+
+    def test_sync_flash_sale_marketplaces_command(self):
+        FlashSale.objects.update(marketplace=None)
+        out = StringIO()
+        call_command('sync_flash_sale_marketplaces', chunk_size=1, stdout=out)
+        self.flash_sale.refresh_from_db()
+        self.assertEqual(self.flash_sale.marketplace_id, self.marketplace.id)
+        self.assertIn('1 flash sales synced', out.getvalue())
+
+
 class StoreVendorTestCase(TestCase):
 
     def setUp(self):
@@ -434,6 +854,41 @@ class RateProductViewTestCase(TestCase):
 
         self.assertEqual(response.status_code, status.HTTP_201_CREATED)
         self.assertEqual(self.product.ratings.count(), 1)
+        self.product.refresh_from_db()
+        self.assertTupleEqual(
+            (self.product.rating_count, self.product.rating_sum, self.product.rating_avg), (1, 5, 5.0)
+        )
+
+    def test_rating_aggregates_follow_updates_and_deletes(self):
+        rating1 = ProductRating.objects.create(user=self.user, product=self.product, value=4)
+        rating2 = ProductRating.objects.create(user=self.user, product=self.product, value=1)
+        rating2.value = 2
+        rating2.save()
+        self.product.refresh_from_db()
+        self.assertTupleEqual(
+            (self.product.rating_count, self.product.rating_sum, self.product.rating_avg), (2, 6, 3.0)
+        )
+
+        ProductRating.objects.get(pk=rating1.pk).delete()
+        rating2.delete()
+        self.product.refresh_from_db()
+        self.assertTupleEqual(
+            (self.product.rating_count, self.product.rating_sum, self.product.rating_avg), (0, 0, None)
+        )
+
+    def test_rebuild_product_ratings_command(self):
+        ProductRating.objects.bulk_create([
+            ProductRating(user=self.user, product=self.product, value=value) for value in (5, 4, 4)
+        ])
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.rating_count, 0)
+
+        call_command('rebuild_product_ratings', chunk_size=1, stdout=StringIO())
+
+        self.product.refresh_from_db()
+        self.assertTupleEqual(
+            (self.product.rating_count, self.product.rating_sum, self.product.rating_avg), (3, 13, 13 / 3)
+        )
 
     def tearDown(self):
         ProductRating.objects.all().delete()
@@ -549,6 +1004,321 @@ class StoreViewTestCase(TestCase):
         User.objects.all().delete()
 
 
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class UploadValidationTestCase(TestCase):
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create(email='name@domain.com', password='testpassword')
+        self.marketplace = MarketPlace.objects.create(name='E-commerce', cover_image='cover.jpg')
+        StoreVendor.objects.create(user=self.user, email='vendor.email@domain.com', id_type='NIN', is_approved=True)
+        self.client.force_authenticate(user=self.user)
+
+    def tearDown(self):
+        shutil.rmtree(settings.MEDIA_ROOT, ignore_errors=True)
+
+    @staticmethod
+    def image_bytes(image_format='PNG', size=(100, 100)):
+        image = BytesIO()
+        Image.new('RGB', size).save(image, image_format)
+        return image.getvalue()
+
+    def create_store(self, logo):
+        return self.client.post(
+            reverse('MarketPlace:store-list-create'),
+            data={
+                'marketplace': self.marketplace.id, 'name': 'Apple Stores',
+                'country': 'Nigeria', 'city': 'Lagos', 'province': 'Province 3', 'logo': logo
+            },
+            format='multipart'
+        )
+
+    def test_valid_logo(self):
+        response = self.create_store(SimpleUploadedFile('logo.png', self.image_bytes()))
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertTrue(Store.objects.get().logo.name.endswith('.png'))
+
+    def test_bogus_logo_rejected(self):
+        response = self.create_store(SimpleUploadedFile('logo.png', b'<?php echo "not an image"; ?>'))
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('logo', response.json())
+        self.assertFalse(Store.objects.exists())
+
+    def test_mislabelled_logo_rejected(self):
+        response = self.create_store(SimpleUploadedFile('logo.png', self.image_bytes('JPEG')))
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_oversized_logo_rejected(self):
+        with patch.object(StoreView, 'upload_max_sizes', {'logo': 1024}):
+            response = self.create_store(SimpleUploadedFile('logo.png', self.image_bytes(size=(400, 400)) + bytes(2048)))
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(Store.objects.exists())
+
+    def test_upload_limits_read_from_field_validators(self):
+        self.assertEqual(StoreView().get_upload_max_sizes(), {'logo': 5 * 1024 * 1024, 'cover_image': 5 * 1024 * 1024})
+
+    def test_oversized_upload_rejected_while_streaming(self):
+        request = HttpRequest()
+        request.upload_max_sizes = {'resume': 1024}
+        handler = ValidatingUploadHandler(request)
+        handler.new_file('resume', 'resume.pdf', 'application/pdf', None)
+        handler.receive_data_chunk(b'%PDF-1.7\n' + bytes(512), 0)
+        # refused at the chunk that crosses the limit, before the rest of the file is read
+        with self.assertRaises(UploadRejected):
+            handler.receive_data_chunk(bytes(1024), 521)
+
+    def test_upload_without_size_limit(self):
+        # e.g. through the admin, whose views set no limits
+        handler = ValidatingUploadHandler(HttpRequest())
+        handler.new_file('resume', 'resume.pdf', 'application/pdf', 8 * 1024 * 1024)
+        handler.receive_data_chunk(b'%PDF-1.7\n' + bytes(8 * 1024 * 1024), 0)
+        self.assertTrue(handler.checked)
+
+    def test_image_header_split_across_chunks(self):
+        data = self.image_bytes('JPEG')
+        handler = ValidatingUploadHandler()
+        handler.new_file('logo', 'logo.jpg', 'image/jpeg', None)
+        handler.receive_data_chunk(data[:4], 0)
+        self.assertFalse(handler.checked)
+        handler.receive_data_chunk(data[4:], 4)
+        self.assertTrue(handler.checked)
+
+    def test_image_pixel_limit(self):
+        handler = ValidatingUploadHandler()
+        handler.new_file('logo', 'logo.png', 'image/png', None)
+        with patch.object(Image, 'MAX_IMAGE_PIXELS', 100 * 99):
+            with self.assertRaises(UploadRejected):
+                handler.receive_data_chunk(self.image_bytes(), 0)
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class ImageVariantsTestCase(TestCase):
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create(email='name@domain.com', password='testpassword')
+        self.marketplace = MarketPlace.objects.create(name='E-commerce', cover_image='cover.jpg')
+        StoreVendor.objects.create(user=self.user, email='vendor.email@domain.com', id_type='NIN', is_approved=True)
+        self.client.force_authenticate(user=self.user)
+
+    def tearDown(self):
+        shutil.rmtree(settings.MEDIA_ROOT, ignore_errors=True)
+
+    @staticmethod
+    def store_image(name, size=(1600, 1200), image_format='JPEG'):
+        image = BytesIO()
+        Image.new('RGB', size, 'red').save(image, image_format)
+        return default_storage.save(name, ContentFile(image.getvalue()))
+
+    def test_generate_variants(self):
+        name = self.store_image('store/logos/logo.jpg')
+        written = variants.generate_variants(default_storage, name)
+        self.assertCountEqual(written, ['store/logos/logo.thumbnail.webp', 'store/logos/logo.medium.webp'])
+        with default_storage.open('store/logos/logo.thumbnail.webp') as file, Image.open(file) as thumbnail:
+            self.assertEqual((thumbnail.format, thumbnail.size), ('WEBP', (200, 150)))
+        with default_storage.open('store/logos/logo.medium.webp') as file, Image.open(file) as medium:
+            self.assertEqual(medium.size, (800, 600))
+        # only missing variants are written, unless overwritten
+        self.assertListEqual(variants.generate_variants(default_storage, name), [])
+        self.assertEqual(len(variants.generate_variants(default_storage, name, overwrite=True)), 2)
+
+    def test_transparent_image(self):
+        name = self.store_image('store/logos/logo.png', image_format='PNG')
+        Image.new('LA', (300, 300)).save(default_storage.path(name))
+        variants.generate_variants(default_storage, name)
+        with default_storage.open('store/logos/logo.thumbnail.webp') as file, Image.open(file) as thumbnail:
+            self.assertEqual(thumbnail.mode, 'RGBA')
+
+    def test_scheduled_on_upload(self):
+        image = BytesIO()
+        Image.new('RGB', (400, 400)).save(image, 'PNG')
+        with patch.object(variants, 'schedule', side_effect=variants.generate) as schedule:
+            with self.captureOnCommitCallbacks(execute=True):
+                response = self.client.post(
+                    reverse('MarketPlace:store-list-create'),
+                    data={
+                        'marketplace': self.marketplace.id, 'name': 'Apple Stores', 'country': 'Nigeria',
+                        'city': 'Lagos', 'province': 'Province 3', 'logo': SimpleUploadedFile('logo.png', image.getvalue())
+                    },
+                    format='multipart'
+                )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        schedule.assert_called_once()
+        store = Store.objects.get()
+        self.assertTrue(default_storage.exists(variants.variant_name(store.logo.name, 'thumbnail')))
+        # recorded once generated, for serializers to rely on
+        self.assertEqual(store.logo_variants, store.logo.name)
+
+        # saving again without a new upload doesn't queue anything
+        with patch.object(variants, 'schedule') as schedule:
+            with self.captureOnCommitCallbacks(execute=True):
+                store.save()
+        schedule.assert_not_called()
+
+    def test_not_scheduled_without_variants_field(self):
+        image = BytesIO()
+        Image.new('RGB', (400, 400)).save(image, 'PNG')
+        with patch.object(variants, 'schedule') as schedule, self.captureOnCommitCallbacks(execute=True):
+            ProductCategory.objects.create(
+                marketplace=self.marketplace, name='Gadgets', image=SimpleUploadedFile('gadgets.png', image.getvalue())
+            )
+        schedule.assert_not_called()
+
+    def create_store(self, **images):
+        return Store.objects.create(
+            marketplace=self.marketplace, vendor=self.user.store_vendor_profile, name='Apple Stores',
+            country='Nigeria', city='Lagos', province='Province 3', **images
+        )
+
+    def test_serialized_variant_urls(self):
+        store = self.create_store(logo=self.store_image('store/logos/logo.jpg'))
+        variants.generate_variants(default_storage, store.logo.name)
+        # the original stands in until the variants are recorded, and the storage is never asked
+        with patch.object(ContentAddressedStorage, 'exists') as exists:
+            urls = StoreSerializer(store).data['logo_variants']
+        exists.assert_not_called()
+        self.assertDictEqual(urls, {'original': store.logo.url, 'thumbnail': store.logo.url, 'medium': store.logo.url})
+
+        Store._meta.get_field('logo').record_variants(Store, store.pk, store.logo.name)
+        store.refresh_from_db()
+        urls = StoreSerializer(store).data['logo_variants']
+        self.assertEqual(urls['thumbnail'], default_storage.url('store/logos/logo.thumbnail.webp'))
+        self.assertIsNone(StoreSerializer(store).data['cover_image_variants'])
+
+    def test_variants_deleted_with_their_image(self):
+        store = self.create_store(logo=self.store_image('store/logos/logo.jpg'))
+        variants.generate_variants(default_storage, store.logo.name)
+        with self.captureOnCommitCallbacks(execute=True):
+            store.delete()
+        self.assertFalse(default_storage.exists('store/logos/logo.thumbnail.webp'))
+        self.assertFalse(default_storage.exists('store/logos/logo.medium.webp'))
+
+    def test_variants_deleted_when_image_replaced(self):
+        store = self.create_store(logo=self.store_image('store/logos/logo.jpg'))
+        variants.generate_variants(default_storage, store.logo.name)
+        image = BytesIO()
+        Image.new('RGB', (400, 400)).save(image, 'PNG')
+        store.logo = SimpleUploadedFile('new-logo.png', image.getvalue())
+        with patch.object(variants, 'schedule'), self.captureOnCommitCallbacks(execute=True):
+            store.save()
+        self.assertFalse(default_storage.exists('store/logos/logo.thumbnail.webp'))
+        self.assertTrue(default_storage.exists('store/logos/logo.jpg'))
+
+    def test_backfill_command(self):
+        store = self.create_store(logo=self.store_image('store/logos/logo.jpg'))
+        self.store_image('cover.jpg')
+        out = StringIO()
+        call_command('generate_image_variants', '--workers', '2', stdout=out, stderr=StringIO())
+        self.assertIn('Done, 2 variants generated, 0 images failed.', out.getvalue())
+        # the marketplace cover has no variants field, so nothing would serve its variants
+        self.assertFalse(default_storage.exists('cover.thumbnail.webp'))
+        self.assertTrue(default_storage.exists('store/logos/logo.medium.webp'))
+        store.refresh_from_db()
+        self.assertEqual(store.logo_variants, store.logo.name)
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class ContentAddressedStorageTestCase(TestCase):
+
+    def setUp(self):
+        self.storage = ContentAddressedStorage()
+
+    def tearDown(self):
+        shutil.rmtree(settings.MEDIA_ROOT, ignore_errors=True)
+
+    def test_duplicates_stored_once(self):
+        first = self.storage.save('products/cover_images/shoe.jpg', ContentFile(b'same bytes'))
+        second = self.storage.save('store/logos/logo.jpg', ContentFile(b'same bytes'))
+        other = self.storage.save('store/logos/other.jpg', ContentFile(b'other bytes'))
+        self.assertEqual(os.stat(self.storage.path(first)).st_ino, os.stat(self.storage.path(second)).st_ino)
+        self.assertNotEqual(os.stat(self.storage.path(first)).st_ino, os.stat(self.storage.path(other)).st_ino)
+        with self.storage.open(second) as file:
+            self.assertEqual(file.read(), b'same bytes')
+        self.assertCountEqual(self.storage.listdir('')[0], ['products', 'store'])
+
+    def test_same_name_gets_an_available_name(self):
+        first = self.storage.save('store/logos/logo.jpg', ContentFile(b'same bytes'))
+        second = self.storage.save('store/logos/logo.jpg', ContentFile(b'same bytes'))
+        self.assertNotEqual(first, second)
+        self.assertTrue(self.storage.exists(first) and self.storage.exists(second))
+
+    def test_blob_freed_with_last_reference(self):
+        first = self.storage.save('a.jpg', ContentFile(b'same bytes'))
+        second = self.storage.save('b.jpg', ContentFile(b'same bytes'))
+        blob = self.storage.blob_path(hashlib.sha256(b'same bytes').hexdigest())
+
+        self.storage.delete(first)
+        self.assertFalse(self.storage.exists(first))
+        self.assertTrue(os.path.exists(blob))
+        self.storage.delete(second)
+        self.assertFalse(os.path.exists(blob))
+
+    def test_image_fields_use_it(self):
+        self.assertIsInstance(Store._meta.get_field('logo').storage, ContentAddressedStorage)
+        self.assertIsInstance(Product._meta.get_field('cover_image').storage, ContentAddressedStorage)
+
+    def test_content_read_once(self):
+        content = ContentFile(b'same bytes')
+        with patch.object(ContentAddressedStorage, 'digest') as digest, patch.object(
+            content, 'chunks', wraps=content.chunks
+        ) as chunks:
+            name = self.storage.save('a.jpg', content)
+        digest.assert_not_called()
+        chunks.assert_called_once()
+        self.assertTrue(os.path.exists(self.storage.blob_path(hashlib.sha256(b'same bytes').hexdigest())))
+        with self.storage.open(name) as file:
+            self.assertEqual(file.read(), b'same bytes')
+
+    def test_blob_rewritten_when_freed_during_save(self):
+        first = self.storage.save('a.jpg', ContentFile(b'same bytes'))
+        link = os.link
+
+        def link_after_concurrent_delete(source, destination):
+            if destination == self.storage.path('b.jpg') and self.storage.exists(first):
+                # the blob's only other reference goes away between finding the blob and linking to it
+                self.storage.delete(first)
+            return link(source, destination)
+
+        with patch.object(os, 'link', side_effect=link_after_concurrent_delete):
+            second = self.storage.save('b.jpg', ContentFile(b'same bytes'))
+        self.assertFalse(self.storage.exists(first))
+        with self.storage.open(second) as file:
+            self.assertEqual(file.read(), b'same bytes')
+        self.assertEqual(os.stat(self.storage.path(second)).st_nlink, 2)
+
+    def test_deduplicate_existing_media(self):
+        names = ('store/logos/a.jpg', 'store/logos/b.jpg', 'products/cover_images/c.jpg', 'unowned/d.jpg')
+        for name in names:
+            os.makedirs(os.path.dirname(os.path.join(settings.MEDIA_ROOT, name)), exist_ok=True)
+            with open(os.path.join(settings.MEDIA_ROOT, name), 'wb') as file:
+                file.write(b'same bytes' if name != 'store/logos/b.jpg' else b'other bytes')
+        for name in names[:3]:
+            MarketPlace.objects.create(name=name, cover_image=name)
+        a, b, c, d = (os.path.join(settings.MEDIA_ROOT, name) for name in names)
+        # left behind by an interrupted run
+        with open(f'{a}.dedupe', 'wb') as file:
+            file.write(b'partial')
+
+        out = StringIO()
+        call_command('deduplicate_media', '--dry-run', stdout=out)
+        self.assertIn('Would link 3 files and remove 0 orphaned blobs, freeing 10 bytes.', out.getvalue())
+        self.assertEqual(os.stat(a).st_nlink, 1)
+
+        call_command('deduplicate_media', stdout=out)
+        self.assertEqual(os.stat(a).st_ino, os.stat(c).st_ino)
+        self.assertEqual(os.stat(a).st_nlink, 3)
+        self.assertEqual(os.stat(b).st_nlink, 2)
+        with open(c, 'rb') as file:
+            self.assertEqual(file.read(), b'same bytes')
+        self.assertFalse(os.path.exists(f'{a}.dedupe'))
+        # no field refers to it
+        self.assertEqual(os.stat(d).st_nlink, 1)
+
+        out = StringIO()
+        call_command('deduplicate_media', stdout=out)
+        self.assertIn('Done, linked 0 files', out.getvalue())
+
+
 class FavouriteProductTestCase(TestCase):
 
     def setUp(self):
@@ -843,6 +1613,24 @@ class StoreProductViewsTest(TestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(Product.objects.get(id=self.product.id).quantity, 15)
 
+    def test_store_product_update_keeps_rating_aggregates(self):
+        url = reverse("MarketPlace:store-product", kwargs={"store_id": self.store.id, "pk": self.product.id})
+        get_object = StoreProductUpdateView.get_object
+
+        def get_object_then_rate(view):
+            product = get_object(view)
+            # a rating arrives after the product was loaded, before it is saved
+            ProductRating.objects.create(user=self.user, product=self.product, value=5)
+            return product
+
+        with patch.object(StoreProductUpdateView, 'get_object', get_object_then_rate):
+            response = self.client.patch(url, {"quantity": 15}, format="json")
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        product = Product.objects.get(id=self.product.id)
+        self.assertEqual(product.quantity, 15)
+        self.assertTupleEqual((product.rating_count, product.rating_sum, product.rating_avg), (1, 5, 5.0))
+
     def test_store_product_delete_view(self):
         url = reverse(
             "MarketPlace:store-product",
@@ -861,6 +1649,78 @@ class StoreProductViewsTest(TestCase):
         response = self.client.get(url)
         self.assertEqual(response.status_code, status.HTTP_200_OK )
 
+    def test_get_all_products_in_nonexistent_marketplace_view(self):
+        url = reverse("MarketPlace:get_all_products", kwargs={'id': 999})
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual(response.data['message'], "MarketPlace with id '999' not found.")
+
+    def test_get_all_products_query_count(self):
+        url = reverse("MarketPlace:get_all_products", kwargs={'id': self.marketplace.id})
+        with CaptureQueriesContext(connection) as context:
+            self.client.get(url)
+        # a single keyset page, filtered on the product table alone
+        self.assertEqual(len(context.captured_queries), 1)
+        for query in context.captured_queries:
+            self.assertNotIn('MarketPlace_store', query['sql'])
+
+    def test_get_all_products_keyset_pages(self):
+        Product.objects.bulk_create([
+            Product(store=self.store, category=self.category, name=f"Product {i}", price=10) for i in range(44)
+        ])
+        # ties on created_at fall back to the id
+        Product.objects.filter(name__in=["Product 10", "Product 11", "Product 12"]).update(
+            created_at=Product.objects.get(name="Product 30").created_at
+        )
+        expected = list(Product.objects.order_by('-created_at', '-id').values_list('id', flat=True))
+
+        url = reverse("MarketPlace:get_all_products", kwargs={'id': self.marketplace.id})
+        seen, pages = [], []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertNotIn('count', response.data)
+            seen += [product['id'] for product in response.data['results']]
+            pages.append(response.data)
+            url = response.data['next']
+        self.assertListEqual(seen, expected)
+        self.assertListEqual([len(page['results']) for page in pages], [20, 20, 5])
+        self.assertIsNone(pages[0]['previous'])
+
+        response = self.client.get(pages[2]['previous'])
+        self.assertListEqual([product['id'] for product in response.data['results']], expected[20:40])
+        response = self.client.get(response.data['previous'])
+        self.assertListEqual([product['id'] for product in response.data['results']], expected[:20])
+        self.assertIsNone(response.data['previous'])
+
+    def test_get_all_products_invalid_cursor(self):
+        url = reverse("MarketPlace:get_all_products", kwargs={'id': self.marketplace.id})
+        response = self.client.get(url, {'cursor': 'not-a-cursor'})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_retrieve_product_query_count(self):
+        url = reverse("MarketPlace:retrieve_product", kwargs={'id': self.marketplace.id, 'product_id': self.product.id})
+        with self.assertNumQueries(1):
+            self.client.get(url)
+
+    def test_product_marketplace_follows_store(self):
+        bulk_product, = Product.objects.bulk_create([
+            Product(store=self.store, category=self.category, name="Bulk Product", price=10)
+        ])
+        self.assertEqual(self.product.marketplace_id, self.marketplace.id)
+        self.assertEqual(bulk_product.marketplace_id, self.marketplace.id)
+
+        other_marketplace = MarketPlace.objects.create(name="Other Marketplace")
+        self.store.marketplace = other_marketplace
+        self.store.save()
+        self.assertEqual(Product.objects.filter(marketplace=other_marketplace).count(), 2)
+
+    def test_sync_product_marketplaces_command(self):
+        Product.objects.update(marketplace=None)
+        call_command('sync_product_marketplaces', stdout=StringIO())
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.marketplace_id, self.marketplace.id)
+
     def test_retrieve_product_in_marketsplace(self):
         url = reverse(
             "MarketPlace:retrieve_product",
@@ -902,10 +1762,64 @@ class StoreProductViewsTest(TestCase):
         self.assertEqual(response.data['Message'], "No product containing 'Nonexistent' found!")
         self.assertEqual(len(response.data), 1) 
 
+    def test_search_products_ranked_by_relevance(self):
+        Product.objects.bulk_create([
+            Product(store=self.store, category=self.category, name="Leather Bag", price=10,
+                    description="A sturdy bag for everyday use"),
+            Product(store=self.store, category=self.category, name="Walking Shoes", price=10,
+                    description="Comes with a free shoe bag"),
+        ])
+        url = reverse("MarketPlace:search_products", kwargs={'id': self.marketplace.id, 'keyword': 'bag'})
+        response = self.client.get(url, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertListEqual([product['name'] for product in response.data['results']], ["Leather Bag", "Walking Shoes"])
+
+    def test_search_products_matches_prefixes_and_ignores_syntax(self):
+        url = reverse("MarketPlace:search_products", kwargs={'id': self.marketplace.id, 'keyword': 'prod* "tes'})
+        response = self.client.get(url, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['results'][0]['name'], 'Test Product')
+
+    def test_search_products_follows_updates_and_deletes(self):
+        Product.objects.filter(pk=self.product.pk).update(name="Renamed Item")
+        self.assertFalse(Product.objects.search('test').exists())
+        self.assertTrue(Product.objects.search('renamed').exists())
+
+        Product.objects.filter(pk=self.product.pk).delete()
+        self.assertFalse(Product.objects.search('renamed').exists())
+
+    def test_search_products_without_keyword(self):
+        url = reverse("MarketPlace:search_products", kwargs={'id': self.marketplace.id, 'keyword': "''"})
+        response = self.client.get(url, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['results'][0]['id'], self.product.id)
+
+    def test_search_products_query_count(self):
+        url = reverse("MarketPlace:search_products", kwargs={'id': self.marketplace.id, 'keyword': 'Test'})
+        # the page rows alone; the marketplace is only looked up when the page is empty
+        with self.assertNumQueries(1):
+            self.client.get(url, format='json')
+
+    def test_search_products_keyset_pages(self):
+        Product.objects.bulk_create([
+            Product(store=self.store, category=self.category, name=f"Bag {i}", price=10) for i in range(25)
+        ])
+        url = reverse("MarketPlace:search_products", kwargs={'id': self.marketplace.id, 'keyword': 'bag'})
+        first_page = self.client.get(url).data
+        second_page = self.client.get(first_page['next']).data
+        self.assertListEqual([len(first_page['results']), len(second_page['results'])], [20, 5])
+        self.assertEqual(
+            len({product['id'] for product in first_page['results'] + second_page['results']}), 25
+        )
+        self.assertIsNone(second_page['next'])
+
 
 class MarketPlaceViewsTest(TestCase):
 
     def setUp(self):
+        cache.clear()
         self.client = APIClient()
         self.marketplace = MarketPlace.objects.create(name='Test Market', cover_image='test_image.jpg')
 
@@ -951,6 +1865,37 @@ class MarketPlaceViewsTest(TestCase):
         url = reverse('MarketPlace:marketplace-products-popular', kwargs={'pk': self.marketplace.pk})
         response = self.client.get(url)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json()['results'][0]['id'], self.product.id)
+        self.assertEqual(response.json()['results'][0]['rating_avg'], 4.0)
+
+    def test_get_popular_products_view_order(self):
+        top_product = Product.objects.create(
+            store=self.store, category=self.product_category, name='Top Product', price=100.0, quantity=50
+        )
+        ProductRating.objects.create(user=self.user, product=top_product, value=5)
+        unpopular_product = Product.objects.create(
+            store=self.store, category=self.product_category, name='Unpopular Product', price=100.0, quantity=50
+        )
+        ProductRating.objects.create(user=self.user, product=unpopular_product, value=2)
+
+        url = reverse('MarketPlace:marketplace-products-popular', kwargs={'pk': self.marketplace.pk})
+        with self.assertNumQueries(1):
+            response = self.client.get(url)
+        self.assertListEqual([product['id'] for product in response.json()['results']], [top_product.id, self.product.id])
+        self.assertIsNone(response.json()['next'])
+
+    def test_get_popular_products_view_without_popular_products(self):
+        ProductRating.objects.all().delete()
+        url = reverse('MarketPlace:marketplace-products-popular', kwargs={'pk': self.marketplace.pk})
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertListEqual(response.json()['results'], [])
+
+    def test_get_popular_products_view_with_invalid_pk(self):
+        url = reverse('MarketPlace:marketplace-products-popular', kwargs={'pk': 999})
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        self.assertIn('999', response.json()['error'])
 
     def test_hot_deals_view(self):
         url = reverse('MarketPlace:hot_deals', kwargs={'pk': self.marketplace.pk})
@@ -973,10 +1918,95 @@ class MarketPlaceViewsTest(TestCase):
         FlashSale.objects.create(
             product=self.product,
             discount_percentage=60,
-            start_datetime='2023-01-01T00:00:00Z',
-            end_datetime='2024-02-01T00:00:00Z'
+            start_datetime=timezone.now() - timedelta(days=1),
+            end_datetime=timezone.now() + timedelta(days=1)
         )
 
         url = reverse('MarketPlace:flash_sale_products', kwargs={'pk': self.marketplace.pk})
         response = self.client.get(url)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['results'][0]['product'], self.product.pk)
+
+    def test_flash_sale_products_view_invalidated_by_flash_sale_changes(self):
+        url = reverse('MarketPlace:flash_sale_products', kwargs={'pk': self.marketplace.pk})
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_404_NOT_FOUND)
+
+        flash_sale = FlashSale.objects.create(
+            product=self.product,
+            discount_percentage=60,
+            start_datetime=timezone.now() - timedelta(days=1),
+            end_datetime=timezone.now() + timedelta(days=1)
+        )
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_200_OK)
+
+        flash_sale.delete()
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_flash_sale_products_view_uses_denormalized_marketplace(self):
+        FlashSale.objects.create(
+            product=self.product,
+            discount_percentage=60,
+            start_datetime=timezone.now() - timedelta(days=1),
+            end_datetime=timezone.now() + timedelta(days=1)
+        )
+        url = reverse('MarketPlace:flash_sale_products', kwargs={'pk': self.marketplace.pk})
+        with CaptureQueriesContext(connection) as context:
+            self.client.get(url)
+        self.assertEqual(len(context.captured_queries), 1)
+        self.assertNotIn('JOIN', context.captured_queries[0]['sql'])
+
+    def test_hot_deals_view_is_cursor_paginated(self):
+        Product.objects.bulk_create([
+            Product(store=self.store, category=self.product_category, name=f'Deal {i}', price=10, discount=75)
+            for i in range(25)
+        ])
+        url = reverse('MarketPlace:hot_deals', kwargs={'pk': self.marketplace.pk})
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data['results']), 20)
+        self.assertIsNone(response.data['previous'])
+
+        response = self.client.get(response.data['next'])
+        self.assertEqual(len(response.data['results']), 6)
+        self.assertIsNone(response.data['next'])
+
+    def test_hot_deals_view_served_from_cache(self):
+        url = reverse('MarketPlace:hot_deals', kwargs={'pk': self.marketplace.pk})
+        self.client.get(url)
+        with self.assertNumQueries(0):
+            response = self.client.get(url)
+        self.assertEqual(response.data['results'][0]['id'], self.product.id)
+
+    def test_hot_deals_view_cached_by_cursor_only(self):
+        Product.objects.bulk_create([
+            Product(store=self.store, category=self.product_category, name=f'Deal {i}', price=10, discount=75)
+            for i in range(25)
+        ])
+        url = reverse('MarketPlace:hot_deals', kwargs={'pk': self.marketplace.pk})
+        self.client.get(url, {'anything': 'else'})
+        with self.assertNumQueries(0):
+            response = self.client.get(url, {'something': 'different'})
+        self.assertNotIn('anything', response.data['next'])
+
+        next_url = response.data['next']
+        self.client.get(next_url)
+        with self.assertNumQueries(0):
+            self.client.get(next_url + '&anything=else')
+
+        # a cursor positioned on something other than an id
+        cursor = base64.b64encode(b'p=not-an-id').decode()
+        self.assertEqual(self.client.get(url, {'cursor': cursor}).status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_hot_deals_view_invalidated_by_discount_changes(self):
+        url = reverse('MarketPlace:hot_deals', kwargs={'pk': self.marketplace.pk})
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_200_OK)
+
+        self.product.discount = 10
+        self.product.save()
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_hot_deals_view_nonexistent_marketplace(self):
+        url = reverse('MarketPlace:hot_deals', kwargs={'pk': 999})
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual(response.data['error'], 'MarketPlace with pk 999 does not exist')
@@ -39,6 +39,11 @@ urlpatterns = [
         CartView.as_view({'post': 'add_cart_item'}),
         name='add-cart-item'
     ),
+    re_path(
+        '^me/cart/add-items/?$',
+        CartView.as_view({'post': 'add_cart_items'}),
+        name='add-cart-items'
+    ),
     re_path(
         '^me/cart/remove-item/(?P<pk>\d+)/?$',
         CartView.as_view({'delete':'remove_cart_item'}),
@@ -1,17 +1,18 @@
 
 from rest_framework import (
-    generics, viewsets, mixins, decorators, status, permissions
+    generics, viewsets, mixins, decorators, status, permissions, exceptions
 )
 from .permissions import (
     IsApprovedStoreVendor, IsOrderOwner, IsStoreOwner
 )
 from rest_framework.response import Response
-from django.db.models import Count, Avg, Q
+from rest_framework.pagination import CursorPagination
+from django.db.models import Count
 from django.shortcuts import get_object_or_404
 from drf_yasg.utils import swagger_auto_schema
-from django.utils import timezone
 
 from helpers import pagination
+from helpers.uploadhandler import UploadSizeLimitMixin
 from .mixins import ProductQuerysetMixin
 from .serializers import *
 from .models import *
@@ -84,20 +85,24 @@ class CartView(viewsets.GenericViewSet):
 
     def get_queryset(self):
         if hasattr(self.request.user, 'cart'):
-            return CartItem.objects.filter(cart=self.request.user.cart)
-        return []
+            return CartItem.objects.filter(
+                cart=self.request.user.cart
+            ).select_related('product').with_prices()
+        return CartItem.objects.none()
 
     def get_serializer_class(self):
         if self.action=='get_user_cart':
             return CartSerializer
         elif self.action in ['get_user_cart_items', 'add_cart_item']:
             return CartItemSerializer
+        elif self.action == 'add_cart_items':
+            return CartItemBatchSerializer
 
     @decorators.action(detail=True)
     @swagger_auto_schema(tags=['MarketPlace - Cart'])
     def get_user_cart(self, request, *args, **kwargs):
         "API Viewset action to get the currently authenticated user's cart"
-        cart, created = Cart.objects.get_or_create(owner=request.user)
+        cart, created = Cart.objects.with_totals().get_or_create(owner=request.user)
         serializer = self.get_serializer(cart, many=False)
         data = {**serializer.data, **{'new_cart':created}}
         return Response(data, status=status.HTTP_200_OK)
@@ -115,6 +120,18 @@ class CartView(viewsets.GenericViewSet):
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
+    @decorators.action(detail=True)
+    @swagger_auto_schema(tags=['MarketPlace - Cart'])
+    def add_cart_items(self, request, *args, **kwargs):
+        "API Viewset action to add a batch of items to the currently authenticated user's cart"
+        cart, created = Cart.objects.get_or_create(owner=request.user)
+        serializer = self.get_serializer(data=request.data)
+        if serializer.is_valid():
+            serializer.save(cart=cart)
+            return Response(serializer.data, status=status.HTTP_201_CREATED)
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+
     @decorators.action(detail=True)
     @swagger_auto_schema(tags=['MarketPlace - Cart'])
     def remove_cart_item(self, request, *args, **kwargs):
@@ -141,14 +158,13 @@ class CartView(viewsets.GenericViewSet):
     def delete_user_cart_items(self, request, *args, **kwargs):
         "API Viewset action to delete the currently authenticated user's cart items"
         queryset = self.filter_queryset(self.get_queryset())
-        for cartitem in queryset:
-            cartitem.delete()
+        queryset.delete()
         return Response({
             "message":"Cart successfully cleared."
         }, status=status.HTTP_204_NO_CONTENT)
 
 
-class StoreView(viewsets.GenericViewSet, mixins.CreateModelMixin):
+class StoreView(UploadSizeLimitMixin, viewsets.GenericViewSet, mixins.CreateModelMixin):
 
     "API Viewset to perform CRUD operations on the store(s) of the currently authenticated user"
 
@@ -291,7 +307,7 @@ class CancelOrderView(generics.DestroyAPIView):
         return super().delete(request, *args, **kwargs)
 
 
-class StoreProductListCreateView(generics.ListCreateAPIView):
+class StoreProductListCreateView(UploadSizeLimitMixin, generics.ListCreateAPIView):
     """API endpoint for CRUD operations for products within a store"""
 
     serializer_class = ProductSerializer
@@ -330,7 +346,7 @@ class StoreProductListCreateView(generics.ListCreateAPIView):
         )
 
 
-class StoreProductUpdateView(generics.RetrieveUpdateDestroyAPIView):
+class StoreProductUpdateView(UploadSizeLimitMixin, generics.RetrieveUpdateDestroyAPIView):
     serializer_class = ProductSerializer
     permission_classes = [IsStoreOwner]
 
@@ -358,7 +374,7 @@ class StoreProductUpdateView(generics.RetrieveUpdateDestroyAPIView):
 
 
 class GetProductsApiView(generics.ListAPIView, ProductQuerysetMixin):
-    pagination_class = pagination.PaginatorGenerator()(_page_size=20)
+    pagination_class = pagination.PaginatorGenerator()(_page_size=20, _paginator_class=pagination.KeysetPagination)
     serializer_class = ProductSerializer
 
     @swagger_auto_schema(tags=['MarketPlace - Products'])
@@ -367,58 +383,64 @@ class GetProductsApiView(generics.ListAPIView, ProductQuerysetMixin):
 
     def list(self, request, *args, **kwargs):
         marketplace_id = self.kwargs['id']
+        query = self.custom_queryset(marketplace_id)
+        page = self.paginate_queryset(query)
+        results = page if page is not None else list(query)
         try:
-            query = self.custom_queryset(marketplace_id)
+            self.check_marketplace(marketplace_id, results)
         except MarketPlace.DoesNotExist:
             return Response({
                 "message": f"MarketPlace with id '{marketplace_id}' not found."
             }, status=status.HTTP_404_NOT_FOUND)
-        page = self.paginate_queryset(query)
+        serializer = self.serializer_class(results, many=True)
         if page is not None:
-            serializer = self.serializer_class(page, many=True)
             return self.get_paginated_response(serializer.data)
-        serializer = self.serializer_class(query, many=True)
         return Response(serializer.data, status=status.HTTP_200_OK)  
 
 
 class ProductSearchApiView(generics.GenericAPIView, ProductQuerysetMixin):
-    pagination_class = pagination.PaginatorGenerator()(_page_size=20)
+    """
+    Search the products of a marketplace, ranked by relevance in keyset pages, so that the page is the only
+    time the search runs. Without a keyword (`''`), the products are listed by the latest one.
+    """
+    pagination_class = pagination.PaginatorGenerator()(_page_size=20, _paginator_class=pagination.KeysetPagination)
+    search_pagination_class = pagination.PaginatorGenerator()(
+        _page_size=20, _paginator_class=pagination.KeysetPagination, ordering=('-search_rank', '-id')
+    )
     serializer_class = ProductSerializer
 
+    @property
+    def paginator(self):
+        if not hasattr(self, '_paginator'):
+            self._paginator = (
+                self.search_pagination_class() if self.kwargs.get('keyword') != "''" else self.pagination_class()
+            )
+        return self._paginator
+
     @swagger_auto_schema(tags=['MarketPlace - Products'])
     def get(self, request, *args, **kwargs):
 
         marketplace_id = kwargs['id'] 
         search_query = kwargs.get('keyword')
 
+        query = self.custom_queryset(marketplace_id)
+        if search_query != "''":
+            query = query.search(search_query)
+
+        # the page doubles as the existence check, rather than evaluating the search once more
+        results = self.paginate_queryset(query)
         try:
-            query = self.custom_queryset(marketplace_id)
-            
+            self.check_marketplace(marketplace_id, results)
         except MarketPlace.DoesNotExist:
             return Response({"Message": "MarketPlace with id '{}' not found.".format(marketplace_id)},
                             status=status.HTTP_404_NOT_FOUND)
- 
-        if search_query == "''":
-            page = self.paginate_queryset(query)
-            if page is not None:
-                serializer = self.serializer_class(page, many=True)
-                return self.get_paginated_response(serializer.data)
-            serializer = self.serializer_class(query, many=True)
-            return Response(serializer.data, status=status.HTTP_200_OK)
 
-        product_search = query.filter(Q(name__icontains=search_query) | Q(description__icontains=search_query))
-    
-        if not product_search:
+        if not results and search_query != "''":
             return Response({"Message": "No product containing '{}' found!".format(search_query)},
                             status=status.HTTP_404_NOT_FOUND)
-        
-        page = self.paginate_queryset(product_search)
-        if page is not None:
-            serializer = self.serializer_class(page, many=True)
-            return self.get_paginated_response(serializer.data)
-        
-        serializer = self.serializer_class(product_search, many=True)
-        return Response(serializer.data, status=status.HTTP_200_OK)   
+
+        serializer = self.serializer_class(results, many=True)
+        return self.get_paginated_response(serializer.data)
 
 
 class ProductRetrieveApiView(generics.ListAPIView, ProductQuerysetMixin):
@@ -429,15 +451,15 @@ class ProductRetrieveApiView(generics.ListAPIView, ProductQuerysetMixin):
         marketplace_id = kwargs['id'] 
         product_id = kwargs['product_id']
 
-        try:
-            query = self.custom_queryset(marketplace_id)
-        except MarketPlace.DoesNotExist:
-            return Response({"Message": "MarketPlace with id '{}' not found.".format(marketplace_id)},
-                            status=status.HTTP_404_NOT_FOUND)
-        
+        query = self.custom_queryset(marketplace_id)
         try:
             retrieve_product = query.get(id=product_id)
         except query.model.DoesNotExist:
+            try:
+                self.check_marketplace(marketplace_id, None)
+            except MarketPlace.DoesNotExist:
+                return Response({"Message": "MarketPlace with id '{}' not found.".format(marketplace_id)},
+                                status=status.HTTP_404_NOT_FOUND)
             return Response({"Message": "Product with id '{}' not found.".format(product_id)},
                             status=status.HTTP_404_NOT_FOUND)
 
@@ -449,7 +471,9 @@ class FavouriteProductView(viewsets.GenericViewSet, mixins.CreateModelMixin):
 
     "API Viewset to retrieve, create and delete favourite products of the currently authenticated user"
 
-    pagination_class = pagination.PaginatorGenerator()(_page_size=10)
+    pagination_class = pagination.PaginatorGenerator()(
+        _page_size=10, _paginator_class=pagination.KeysetPagination, include_count=True
+    )
     permission_classes = [permissions.IsAuthenticated]
     serializer_class = FavouriteProductSerializer
     def get_queryset(self):
@@ -488,152 +512,99 @@ class FavouriteProductView(viewsets.GenericViewSet, mixins.CreateModelMixin):
         return Response(status=status.HTTP_204_NO_CONTENT)
 
 
-class GetPopularProductsView(generics.ListAPIView):
+class GetPopularProductsView(generics.ListAPIView, ProductQuerysetMixin):
     "API View to get all popular products  within a marketplace"
+    pagination_class = pagination.PaginatorGenerator()(
+        _page_size=20, _paginator_class=pagination.KeysetPagination, ordering=('-rating_avg', '-id')
+    )
     serializer_class = ProductSerializer
 
     def get_queryset(self):
-        market_id = self.kwargs.get('pk')
+        # products with an average rating of 3.5 or above, using the stored rating aggregates
+        # rather than averaging every rating on each request
+        return self.custom_queryset(self.kwargs['pk']).filter(rating_avg__gte=3.5)
 
-        # Retrieve the market place based on the provided id
-        try:
-            market = MarketPlace.objects.get(pk=market_id)
-        except MarketPlace.DoesNotExist:
-            raise MarketPlace.DoesNotExist("MarketPlace not found.")
-
-        # Get all products associated with the market place
-        products = Product.objects.filter(store__marketplace=market)
-
-        # Calculate product popularity based on ratings
-        # Filter out products with an average rating of 3.5 or above
-        popular_products = products.annotate(
-            average_rating=Avg('ratings__value')
-        ).filter(average_rating__gte=3.5)
-
-        # Return the sorted list of popular products
-        return popular_products
-    
     @swagger_auto_schema(tags=['MarketPlace - Products'])
     def get(self, *args, **kwargs):
         return super().get(*args, **kwargs)
 
     def list(self, request, *args, **kwargs):
-        # Check if any popular products were found
+        page = self.paginate_queryset(self.get_queryset())
         try:
-            queryset = self.get_queryset()
+            self.check_marketplace(self.kwargs['pk'], page)
+        except MarketPlace.DoesNotExist as error:
+            return Response({'error': str(error)}, status=status.HTTP_404_NOT_FOUND)
+        return self.get_paginated_response(self.get_serializer(page, many=True).data)
 
-            if queryset:
-                # Return the sorted list of popular products
-               serialized_products = self.serializer_class(queryset, many=True)
-               return Response(serialized_products.data, status=status.HTTP_200_OK)
-            else:
-                return Response({
-                'error': f'Popular products for MarketPlace with {self.lookup_field} '
-                f'{kwargs[self.lookup_url_kwarg or self.lookup_field]} does not exist'
-            }, status=status.HTTP_404_NOT_FOUND)
 
-        except MarketPlace.DoesNotExist:
-            # Handle the exception and return a specific error response
+class PromotionsListMixin:
+    """
+    Cursor-paginated promotion listings, with each page cached per marketplace in `promotions_cache`
+    until a product discount or flash sale of the marketplace changes.
+    """
+    pagination_class = pagination.PaginatorGenerator()(_page_size=20, _paginator_class=CursorPagination, ordering='-id')
+    not_found_message = ''
+
+    def list(self, request, *args, **kwargs):
+        market_id = kwargs['pk']
+        # pages are cached and linked by the URL's path (which holds the marketplace) and the decoded cursor alone,
+        # so other query parameters neither make new cache entries nor end up in cached links
+        base_url = request.build_absolute_uri(request.path)
+        cursor = self.paginator.decode_cursor(request)
+        if cursor is not None and cursor.position is not None:
+            try:
+                cursor = cursor._replace(position=int(cursor.position))
+            except ValueError:
+                raise exceptions.NotFound(self.paginator.invalid_cursor_message)
+        cache_key = f'{self.__class__.__name__}:{base_url}:{tuple(cursor) if cursor else None}'
+        cached = promotions_cache.get(market_id, cache_key)
+        if cached is not None:
+            return Response(cached[1], status=cached[0])
+
+        page = self.paginate_queryset(self.get_queryset())
+        self.paginator.base_url = base_url
+        if page:
+            response = self.get_paginated_response(self.get_serializer(page, many=True).data)
+        elif MarketPlace.objects.filter(pk=market_id).exists():
+            response = Response({
+                'error': self.not_found_message.format(lookup_field=self.lookup_field, lookup_value=market_id)
+            }, status=status.HTTP_404_NOT_FOUND)
+        else:
+            # not cached, since creating a marketplace doesn't invalidate anything
             return Response({
-                'error': f'MarketPlace with {self.lookup_field} '
-                f'{kwargs[self.lookup_url_kwarg or self.lookup_field]} does not exist'
+                'error': f'MarketPlace with {self.lookup_field} {market_id} does not exist'
             }, status=status.HTTP_404_NOT_FOUND)
+        promotions_cache.set(market_id, cache_key, (response.status_code, response.data))
+        return response
 
 
-class HotDealsView(generics.ListAPIView):
+class HotDealsView(PromotionsListMixin, generics.ListAPIView):
     "API View to get hot deals products  within a marketplace "
     serializer_class = ProductSerializer
+    not_found_message = 'Hot deals for MarketPlace with {lookup_field} {lookup_value} do not exist'
 
     def get_queryset(self):
-        market_id = self.kwargs.get('pk')
-
-        # Retrieve the market place based on the provided id
-        try:
-            market = MarketPlace.objects.get(pk=market_id)
-        except MarketPlace.DoesNotExist:
-            raise MarketPlace.DoesNotExist("MarketPlace not found.")
-
         # Get all products associated with the market place and have discount greater than 50%
-        hot_deals = Product.objects.filter(store__marketplace=market, discount__gte=50)
-        
-        return hot_deals
+        return Product.objects.filter(marketplace=self.kwargs.get('pk'), discount__gte=50)
     
     @swagger_auto_schema(tags=['MarketPlace - Products'])
     def get(self, *args, **kwargs):
         return super().get(*args, **kwargs)
 
-    def list(self, request, *args, **kwargs):
-        # Check if any hot deals were found
-        try:
-            queryset = self.get_queryset()
-
-            if queryset:
-                # Return the sorted list of hot deals
-                serialized_hot_deals = self.serializer_class(queryset, many=True)
-                return Response(serialized_hot_deals.data, status=status.HTTP_200_OK)
-            else:
-                return Response({
-                    'error': f'Hot deals for MarketPlace with {self.lookup_field} '
-                             f'{kwargs[self.lookup_url_kwarg or self.lookup_field]} do not exist'
-                }, status=status.HTTP_404_NOT_FOUND)
 
-        except MarketPlace.DoesNotExist:
-            # Handle the exception when market doesn't exist 
-            return Response({
-                'error': f'MarketPlace with {self.lookup_field} '
-                         f'{kwargs[self.lookup_url_kwarg or self.lookup_field]} does not exist'
-            }, status=status.HTTP_404_NOT_FOUND)
-
-
-class FlashSaleProductsView(generics.ListAPIView):
+class FlashSaleProductsView(PromotionsListMixin, generics.ListAPIView):
     "API View to get all  products on flash sales within a marketplace"
     serializer_class = FlashSaleSerializer
+    not_found_message = 'No flash sales found for products of MarketPlace with {lookup_field} {lookup_value} exist'
 
     def get_queryset(self):
-        market_id = self.kwargs.get('pk')
-
-        # Retrieve the market place based on the provided id
-        try:
-            market = MarketPlace.objects.get(pk=market_id)
-        except MarketPlace.DoesNotExist:
-            raise MarketPlace.DoesNotExist("MarketPlace not found.")
-
         # Get all flash sales associated with the market place
-        now = timezone.now()
-        flash_sales = FlashSale.objects.filter(
-            product__store__marketplace=market,
-            start_datetime__lte=now,
-            end_datetime__gte=now
-        )
-
-        return flash_sales
+        return FlashSale.objects.filter(marketplace=self.kwargs.get('pk')).active()
     
     @swagger_auto_schema(tags=['MarketPlace - Products'])
     def get(self, *args, **kwargs):
         return super().get(*args, **kwargs)
 
-    def list(self, request, *args, **kwargs):
-      # Check if any hot deals were found
-        try:
-            queryset = self.get_queryset()
-
-            if queryset.exists():
-                serialized_flash_sales = self.serializer_class(queryset, many=True)
-                return Response(serialized_flash_sales.data, status=status.HTTP_200_OK)
-            else:
-                return Response({
-                    'error': f'No flash sales found for products of MarketPlace with {self.lookup_field} '
-                             f'{kwargs[self.lookup_url_kwarg or self.lookup_field]} exist'
-                },
-                status=status.HTTP_404_NOT_FOUND
-            )
-  
-        except MarketPlace.DoesNotExist:
-            # Handle the exception when market doesn't exist 
-            return Response({
-                'error': f'MarketPlace with {self.lookup_field} {kwargs[self.lookup_url_kwarg or self.lookup_field]} does not exist'
-            }, status=status.HTTP_404_NOT_FOUND)
-
 
 class CreateFlashSaleView(generics.CreateAPIView):
     "API View to get all popular products  within a marketplace"
@@ -1,8 +1,8 @@
 
 from .models import TimestampsModel
-from .fields import ValidatedImageField, ValidatedResumeFileField
+from .fields import ValidatedImageField, ValidatedResumeFileField, HeaderImageField, HeaderImageSerializerMixin, ImageVariantsField
 from .validators import ImageSizeValidator, FileSizeValidator, validate_positive_decimal
-from .pagination import PaginatorGenerator
+from .pagination import PaginatorGenerator, KeysetPagination, EstimatedCountPaginator
 
 __all__ = [
     # models
@@ -11,6 +11,9 @@ __all__ = [
     # fields
     'ValidatedImageField',
     'ValidatedResumeFileField',
+    'HeaderImageField',
+    'HeaderImageSerializerMixin',
+    'ImageVariantsField',
 
     # validators
     'ImageSizeValidator',
@@ -18,7 +21,9 @@ __all__ = [
     'validate_positive_decimal',
 
     # pagination
-    'PaginatorGenerator'
+    'PaginatorGenerator',
+    'KeysetPagination',
+    'EstimatedCountPaginator',
 ]
 
 
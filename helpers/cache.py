@@ -0,0 +1,42 @@
+import time
+from django.core.cache import cache
+
+
+class VersionedCache:
+    """
+    Caches values per namespace (e.g. one marketplace) under a version number kept alongside them.
+    `invalidate` bumps the version, so every key of the namespace goes stale at once without
+    having to find and delete them; the orphaned entries simply expire.
+    Versions live in the default cache, so an invalidation only reaches the processes sharing it:
+    with the per-process cache used when `REDIS_URL` isn't set, other workers serve their entries until they expire.
+    """
+
+    def __init__(self, prefix:str, timeout:int=30):
+        self.prefix = prefix
+        self.timeout = timeout
+
+    def _version_key(self, namespace):
+        return f'{self.prefix}:{namespace}:version'
+
+    def _version(self, namespace):
+        version_key = self._version_key(namespace)
+        # versions start from the clock rather than 1, so an evicted version can't be
+        # restarted at a number whose entries are still cached
+        cache.add(version_key, time.time_ns() // 1000, timeout=None)
+        return cache.get(version_key)
+
+    def _key(self, namespace, key):
+        return f'{self.prefix}:{namespace}:{self._version(namespace)}:{key}'
+
+    def get(self, namespace, key, default=None):
+        return cache.get(self._key(namespace, key), default)
+
+    def set(self, namespace, key, value, timeout=None):
+        cache.set(self._key(namespace, key), value, timeout=self.timeout if timeout is None else timeout)
+
+    def invalidate(self, namespace):
+        try:
+            cache.incr(self._version_key(namespace))
+        except ValueError:
+            # no version yet, so nothing has been cached for this namespace either
+            pass
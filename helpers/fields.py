@@ -1,19 +1,131 @@
-from django.db import models 
+from functools import partial
+from django import forms
+from django.db import models, transaction
+from django.db.models.signals import post_delete
+from django.core.exceptions import ValidationError
 from django.core.validators import FileExtensionValidator
+from PIL import Image
+from rest_framework import serializers
+from . import variants
+from .storage import get_content_addressed_storage
 from .validators import ImageSizeValidator
 from .validators import FileSizeValidator
 
 
-class ValidatedImageField(models.ImageField):
+class HeaderImageFormField(forms.ImageField):
+    """
+    A form `ImageField` that identifies the image from its header alone, which `ValidatingUploadHandler`
+    has already checked, instead of copying the whole upload into memory for Pillow to verify
+    """
+
+    def to_python(self, data):
+        f = forms.FileField.to_python(self, data)
+        if f is None:
+            return None
+        try:
+            with Image.open(f.temporary_file_path() if hasattr(f, 'temporary_file_path') else f) as image:
+                f.image = image
+                f.content_type = Image.MIME.get(image.format)
+        except Exception as exc:
+            raise ValidationError(self.error_messages['invalid_image'], code='invalid_image') from exc
+        if hasattr(f, 'seek') and callable(f.seek):
+            f.seek(0)
+        return f
+
+
+class HeaderImageField(serializers.ImageField):
+    "DRF's `ImageField`, validated by `HeaderImageFormField`"
 
     def __init__(self, *args, **kwargs):
+        kwargs.setdefault('_DjangoImageField', HeaderImageFormField)
+        super().__init__(*args, **kwargs)
+
+
+class HeaderImageSerializerMixin:
+    "Builds the image fields of a `ModelSerializer` as `HeaderImageField`s"
+    serializer_field_mapping = {
+        **serializers.ModelSerializer.serializer_field_mapping, models.ImageField: HeaderImageField
+    }
+
+
+class ImageVariantsField(serializers.ReadOnlyField):
+    "The URLs of an image and its resized variants, e.g. `ImageVariantsField(source='cover_image')`"
+
+    def to_representation(self, value):
+        if not value:
+            return None
+        request = self.context.get('request')
+        urls = variants.variant_urls(value, value.field.has_variants(value.instance))
+        return {name: request.build_absolute_uri(url) if request else url for name, url in urls.items()}
+
+
+class ValidatedImageField(models.ImageField):
+    """
+    An `ImageField` with size and extension validators, whose uploads are stored deduplicated
+    (see `helpers.storage`). Fields with a `variants_field` get resized WebP variants (see `helpers.variants`)
+    generated in the background once their uploads are committed, and the variants are deleted along with
+    their image, or when it is replaced. `variants_field` names a `CharField` of the model where the name of
+    the image whose variants have been generated is recorded, so that serializing them needs no storage
+    lookups (see `ImageVariantsField`). Without one, no variants are made, since nothing would serve them.
+    """
+
+    def __init__(self, *args, variants_field=None, **kwargs):
+        self.variants_field = variants_field
         allowed_extensions = kwargs.pop('extensions', ('png', 'jpg', 'jpeg', 'jfif'))
         max_bytes_size = int(kwargs.get('max_bytes_size', 5*1024*1024))
         size_validator = ImageSizeValidator(max_bytes_size)
         extension_validator = FileExtensionValidator(allowed_extensions=(allowed_extensions))
         kwargs.setdefault('validators', [size_validator, extension_validator])
+        kwargs.setdefault('storage', get_content_addressed_storage)
         return super().__init__(*args, **kwargs)
 
+    def deconstruct(self):
+        name, path, args, kwargs = super().deconstruct()
+        if self.variants_field:
+            kwargs['variants_field'] = self.variants_field
+        return name, path, args, kwargs
+
+    def contribute_to_class(self, cls, name, **kwargs):
+        super().contribute_to_class(cls, name, **kwargs)
+        if not cls._meta.abstract:
+            post_delete.connect(self.delete_variants_of, sender=cls, weak=False)
+
+    def formfield(self, **kwargs):
+        return super().formfield(**{'form_class': HeaderImageFormField, **kwargs})
+
+    def pre_save(self, model_instance, add):
+        uploaded = getattr(model_instance, self.attname)
+        is_new_upload = bool(uploaded) and not uploaded._committed
+        replaced = None
+        if is_new_upload and not add and model_instance.pk is not None:
+            replaced = type(model_instance)._default_manager.filter(pk=model_instance.pk).values_list(
+                self.attname, flat=True
+            ).first()
+        file = super().pre_save(model_instance, add)
+        if is_new_upload and self.variants_field:
+            transaction.on_commit(partial(self.schedule_variants, model_instance, file.name))
+        if replaced and replaced != file.name:
+            transaction.on_commit(partial(variants.delete_variants, self.storage, replaced))
+        return file
+
+    def schedule_variants(self, model_instance, name):
+        variants.schedule(
+            self.storage, name, partial(self.record_variants, type(model_instance), model_instance.pk, name)
+        )
+
+    def record_variants(self, model, pk, name):
+        "Marks the variants of `name` as generated, unless the image has been replaced in the meantime"
+        model._default_manager.filter(pk=pk, **{self.attname: name}).update(**{self.variants_field: name})
+
+    def has_variants(self, model_instance) -> bool:
+        file = getattr(model_instance, self.attname)
+        return bool(self.variants_field and file) and getattr(model_instance, self.variants_field) == file.name
+
+    def delete_variants_of(self, sender, instance, **kwargs):
+        file = getattr(instance, self.attname)
+        if file:
+            transaction.on_commit(partial(variants.delete_variants, self.storage, file.name))
+
 
 class ValidatedResumeFileField(models.FileField):
 
@@ -22,4 +134,5 @@ class ValidatedResumeFileField(models.FileField):
         size_validator = FileSizeValidator(5*1024*1024)
         extension_validator = FileExtensionValidator(allowed_extensions=allowed_extensions)
         kwargs.setdefault('validators', [size_validator, extension_validator])
+        kwargs.setdefault('storage', get_content_addressed_storage)
         return super().__init__(*args, **kwargs)
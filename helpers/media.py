@@ -0,0 +1,35 @@
+from concurrent.futures import ThreadPoolExecutor
+
+
+# storage writes are I/O-bound, so a handful of threads overlap them without contending for much else
+MAX_UPLOAD_WORKERS = 8
+
+
+def store_uploads(model, field_name:str, uploads, max_workers:int=MAX_UPLOAD_WORKERS, **values) -> list:
+    """
+    Builds an unsaved `model(**values)` per upload and writes the uploads to the storage of `field_name`
+    in parallel, leaving the rows themselves to a single `bulk_create` by the caller.
+    If any upload fails, the ones already stored are deleted again before the error is raised.
+    """
+    instances = [model(**values) for _ in uploads]
+    if not instances:
+        return instances
+
+    def store(instance, upload):
+        getattr(instance, field_name).save(upload.name, upload, save=False)
+
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(instances))) as executor:
+        futures = [executor.submit(store, instance, upload) for instance, upload in zip(instances, uploads)]
+    errors = [future.exception() for future in futures if future.exception() is not None]
+    if errors:
+        delete_stored(instances, field_name)
+        raise errors[0]
+    return instances
+
+
+def delete_stored(instances, field_name:str):
+    "Removes the stored files of `instances`, e.g. after the transaction meant to record them rolled back"
+    for instance in instances:
+        field_file = getattr(instance, field_name)
+        if field_file.name:
+            field_file.storage.delete(field_file.name)
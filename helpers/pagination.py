@@ -1,12 +1,244 @@
 
+import base64
+import hashlib
+import json
 from typing import Any
+from django.core.cache import cache
+from django.core.exceptions import EmptyResultSet, ValidationError
+from django.core.paginator import EmptyPage, Page, PageNotAnInteger, Paginator
+from django.db import connections
+from django.db.models import Q
+from django.utils.functional import cached_property
+from django.utils.translation import gettext_lazy as _
 from rest_framework import pagination
+from rest_framework.exceptions import NotFound
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
 
 
 class PaginatorGenerator:
-    def __call__(self, _page_size:int=10, _paginator_class:Any=pagination.PageNumberPagination):
+    def __call__(self, _page_size:int=10, _paginator_class:Any=pagination.PageNumberPagination, **attributes):
         
         class PaginatorClass(_paginator_class):
             page_size = _page_size
+
+        # any other class attributes of the paginator, e.g. the `ordering` of a `CursorPagination`
+        for name, value in attributes.items():
+            setattr(PaginatorClass, name, value)
         
         return PaginatorClass
+
+
+class KeysetPagination(pagination.BasePagination):
+    """
+    Pages through a queryset by the values of its last row rather than an offset, so that every page
+    is an indexed range scan however deep it is. `ordering` must be made of non-null fields or annotations
+    ending in a unique one, and defaults to `TimestampsModel.Meta.ordering` with `id` as the tie-breaker. Cursors are opaque, base64-encoded
+    ordering values. The total `count` costs an extra query and is only included when `include_count` is set.
+    """
+    page_size = 10
+    ordering = ('-created_at', '-id')
+    cursor_query_param = 'cursor'
+    include_count = False
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.count = queryset.count() if self.include_count else None
+        values, reverse = self.decode_cursor(queryset, request.query_params.get(self.cursor_query_param))
+
+        ordering = [self.reverse_field(field) for field in self.ordering] if reverse else list(self.ordering)
+        queryset = queryset.order_by(*ordering)
+        if values is not None:
+            queryset = queryset.filter(self.keyset_filter(ordering, values))
+        results = list(queryset[:self.page_size + 1])
+        has_more = len(results) > self.page_size
+        results = results[:self.page_size]
+
+        if reverse:
+            results.reverse()
+            self.has_next, self.has_previous = values is not None, has_more
+        else:
+            self.has_next, self.has_previous = has_more, values is not None
+        self.page = results
+        return results
+
+    def get_paginated_response(self, data):
+        response = {'next': self.get_next_link(), 'previous': self.get_previous_link(), 'results': data}
+        if self.include_count:
+            response = {'count': self.count, **response}
+        return Response(response)
+
+    def get_paginated_response_schema(self, schema):
+        properties = {
+            'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+            'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+            'results': schema,
+        }
+        if self.include_count:
+            properties = {'count': {'type': 'integer'}, **properties}
+        return {'type': 'object', 'properties': properties}
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return replace_query_param(self.base_url, self.cursor_query_param, self.encode_cursor(self.page[-1], False))
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        if not self.page:
+            return remove_query_param(self.base_url, self.cursor_query_param)
+        return replace_query_param(self.base_url, self.cursor_query_param, self.encode_cursor(self.page[0], True))
+
+    @staticmethod
+    def reverse_field(field):
+        return field[1:] if field.startswith('-') else f'-{field}'
+
+    @staticmethod
+    def keyset_filter(ordering, values):
+        "Rows after `values` in `ordering`: (a > x) OR (a = x AND b > y) OR ..., with < for descending fields"
+        condition, equal = Q(), Q()
+        for field, value in zip(ordering, values):
+            name = field.lstrip('-')
+            condition |= equal & Q(**{f'{name}__lt' if field.startswith('-') else f'{name}__gt': value})
+            equal &= Q(**{name: value})
+        # the redundant bound on the first field gives the planner a range to seek the index with,
+        # which it can't derive from the OR on its own
+        first = ordering[0]
+        return Q(**{f"{first.lstrip('-')}__lte" if first.startswith('-') else f'{first}__gte': values[0]}) & condition
+
+    def encode_cursor(self, instance, reverse:bool) -> str:
+        values = [getattr(instance, field.lstrip('-')) for field in self.ordering]
+        # str() rather than DjangoJSONEncoder, which would cut datetimes down to milliseconds
+        payload = json.dumps({'v': values, 'r': reverse}, default=str)
+        return base64.urlsafe_b64encode(payload.encode()).decode()
+
+    def decode_cursor(self, queryset, cursor):
+        "The ordering values and direction in `cursor`, each coerced to its field's type so a crafted one can't fail the query"
+        if not cursor:
+            return None, False
+        try:
+            payload = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+            if not isinstance(payload['v'], list) or len(payload['v']) != len(self.ordering):
+                raise ValueError
+            values = [self.to_python(queryset, field, value) for field, value in zip(self.ordering, payload['v'])]
+            return values, bool(payload.get('r'))
+        except (KeyError, TypeError, ValueError, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+
+    @staticmethod
+    def to_python(queryset, field, value):
+        name = field.lstrip('-')
+        if name in queryset.query.annotations:
+            output_field = queryset.query.annotations[name].output_field
+        else:
+            output_field = queryset.model._meta.pk if name == 'pk' else queryset.model._meta.get_field(name)
+        value = output_field.to_python(value)
+        if value is None:
+            # the ordering is made of non-null fields, and None can't be compared against
+            raise ValueError
+        return value
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    A Django paginator whose `count` is exact up to `exact_count_threshold` rows, counted with a
+    LIMIT so it never scans further. Past it, the count is the planner's estimate where the database
+    has one (postgres), and exact elsewhere. `count_is_estimate` tells which of the two it is.
+    Either way the count is cached for `cache_timeout` seconds per query signature (the SQL and its parameters).
+    Since it may be off, the count is only reported: pages are fetched one row past their end, which is
+    what decides whether there is a next one, and only a page with no rows at all is out of range.
+    """
+    exact_count_threshold = 1000
+    cache_timeout = 60
+
+    def validate_number(self, number):
+        try:
+            if isinstance(number, float) and not number.is_integer():
+                raise ValueError
+            number = int(number)
+        except (TypeError, ValueError):
+            raise PageNotAnInteger(_('That page number is not an integer'))
+        if number < 1:
+            raise EmptyPage(_('That page number is less than 1'))
+        return number
+
+    def page(self, number):
+        number = self.validate_number(number)
+        bottom = (number - 1) * self.per_page
+        rows = list(self.object_list[bottom:bottom + self.per_page + 1])
+        if not rows and number > 1:
+            raise EmptyPage(_('That page contains no results'))
+        return EstimatedCountPage(rows[:self.per_page], number, self, has_next=len(rows) > self.per_page)
+
+    @cached_property
+    def _count(self):
+        queryset = self.object_list
+        if not hasattr(queryset, 'query'):
+            return len(queryset), False
+        cache_key = self.cache_key(queryset)
+        cached = cache.get(cache_key) if cache_key else None
+        if cached is not None:
+            return cached
+
+        count, is_estimate = queryset[:self.exact_count_threshold + 1].count(), False
+        if count > self.exact_count_threshold:
+            estimate = self.estimate_count(queryset)
+            count, is_estimate = (estimate, True) if estimate is not None else (queryset.count(), False)
+        if cache_key:
+            cache.set(cache_key, (count, is_estimate), self.cache_timeout)
+        return count, is_estimate
+
+    @property
+    def count(self):
+        return self._count[0]
+
+    @property
+    def count_is_estimate(self):
+        return self._count[1]
+
+    @staticmethod
+    def cache_key(queryset):
+        try:
+            sql, params = queryset.query.sql_with_params()
+        except EmptyResultSet:
+            # e.g. `pk__in=[]`, which counts without touching the database anyway
+            return None
+        signature = hashlib.sha1(f'{queryset.db}:{sql}:{params!r}'.encode()).hexdigest()
+        return f'paginator-count:{signature}'
+
+    @staticmethod
+    def estimate_count(queryset):
+        "The planner's row estimate for `queryset`, or None when the database doesn't offer one"
+        connection = connections[queryset.db]
+        if connection.vendor != 'postgresql':
+            return None
+        with connection.cursor() as cursor:
+            if not queryset.query.where:
+                # unfiltered, so the table statistics answer without planning anything
+                cursor.execute(
+                    "SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass",
+                    [connection.ops.quote_name(queryset.model._meta.db_table)]
+                )
+                row = cursor.fetchone()
+                if row and row[0] >= 0:
+                    return row[0]
+            sql, params = queryset.order_by().query.sql_with_params()
+            cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+            plan = cursor.fetchone()[0]
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        return int(plan[0]['Plan']['Plan Rows'])
+
+
+class EstimatedCountPage(Page):
+    "A page of `EstimatedCountPaginator`, which knows whether a next page exists from its rows rather than the count"
+
+    def __init__(self, object_list, number, paginator, has_next:bool):
+        super().__init__(object_list, number, paginator)
+        self._has_next = has_next
+
+    def has_next(self):
+        return self._has_next
@@ -0,0 +1,274 @@
+import abc
+import re
+from django.db import connections
+from django.db.models import BooleanField, FloatField, Q, Value
+from django.db.models.expressions import Case, RawSQL, When
+from django.db.models.signals import post_migrate
+from rest_framework import filters
+
+
+# relative weight of each field letter, matching the defaults of postgres' `ts_rank`
+WEIGHTS = {'A': 1.0, 'B': 0.4, 'C': 0.2, 'D': 0.1}
+
+TOKEN_PATTERN = re.compile(r'\w+')
+
+_registry = {}
+
+
+def tokenize(text:str) -> list:
+    "Splits user input into plain word tokens, so no search syntax ever reaches the database"
+    return TOKEN_PATTERN.findall(text.lower())
+
+
+class SearchBackend(abc.ABC):
+    """
+    Full-text search over a fixed set of model fields, each with a weight letter from `WEIGHTS`, plus
+    typo-tolerant matching on `fuzzy_fields` where the backend supports it. Backends create their own
+    database objects in `install`, which runs after every `migrate`, because the generated migrations
+    cannot express them.
+    """
+
+    def __init__(self, model, fields:dict, fuzzy_fields=()):
+        self.model = model
+        self.fields = fields
+        self.fuzzy_fields = fuzzy_fields
+
+    @property
+    def table(self):
+        return self.model._meta.db_table
+
+    def columns(self, fields=None):
+        return [self.model._meta.get_field(name).column for name in (self.fields if fields is None else fields)]
+
+    def install(self, connection):
+        pass
+
+    def search(self, queryset, text:str):
+        "Filters `queryset` to the rows matching every token of `text`, ranked by relevance as `search_rank`"
+        tokens = tokenize(text)
+        if not tokens:
+            return queryset.none()
+        return self.match(queryset, tokens).order_by('-search_rank', '-pk')
+
+    @abc.abstractmethod
+    def match(self, queryset, tokens:list):
+        "Filters `queryset` to the rows matching `tokens` and annotates their `search_rank`"
+
+
+class ContainsSearchBackend(SearchBackend):
+    "Unindexed `icontains` search, for databases without a full-text engine"
+
+    def match(self, queryset, tokens):
+        for token in tokens:
+            queryset = queryset.filter(
+                Q.create([(f'{name}__icontains', token) for name in self.fields], connector=Q.OR)
+            )
+        return queryset.annotate(search_rank=Case(
+            *[When(Q.create([(f'{name}__icontains', token) for token in tokens]), then=Value(WEIGHTS[weight]))
+              for name, weight in sorted(self.fields.items(), key=lambda item: item[1])],
+            default=Value(0.0), output_field=FloatField()
+        ))
+
+
+class PostgresSearchBackend(SearchBackend):
+    """
+    A generated, stored `tsvector` column with a GIN index, so postgres keeps the vector in step with
+    every write, including bulk ones. Fuzzy fields get `pg_trgm` GIN indexes and also match each search
+    word on trigram word similarity, so that e.g. a misspelt city still finds its listings.
+    """
+    config = 'english'
+    vector_column = 'search_vector'
+
+    def install(self, connection):
+        qn = connection.ops.quote_name
+        vector = ' || '.join(
+            f"setweight(to_tsvector('{self.config}', coalesce({qn(column)}, '')), '{weight}')"
+            for column, weight in zip(self.columns(), self.fields.values())
+        )
+        with connection.cursor() as cursor:
+            # the column's comment holds the expression it was generated from. Postgres can't alter the
+            # expression of a generated column, so the column is recreated whenever the fields or weights change.
+            cursor.execute(
+                "SELECT col_description(attrelid, attnum) FROM pg_attribute "
+                "WHERE attrelid = %s::regclass AND attname = %s AND NOT attisdropped",
+                [qn(self.table), self.vector_column]
+            )
+            row = cursor.fetchone()
+            if row is None or row[0] != vector:
+                if row is not None:
+                    cursor.execute(f"ALTER TABLE {qn(self.table)} DROP COLUMN {qn(self.vector_column)}")
+                cursor.execute(
+                    f"ALTER TABLE {qn(self.table)} ADD COLUMN {qn(self.vector_column)} "
+                    f"tsvector GENERATED ALWAYS AS ({vector}) STORED"
+                )
+                cursor.execute(f"COMMENT ON COLUMN {qn(self.table)}.{qn(self.vector_column)} IS %s", [vector])
+            cursor.execute(
+                f"CREATE INDEX IF NOT EXISTS {qn(self.table + '_search_idx')} "
+                f"ON {qn(self.table)} USING gin ({qn(self.vector_column)})"
+            )
+            if self.fuzzy_fields:
+                cursor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+            for column in self.columns(self.fuzzy_fields):
+                cursor.execute(
+                    f"CREATE INDEX IF NOT EXISTS {qn(f'{self.table}_{column}_trgm_idx')} "
+                    f"ON {qn(self.table)} USING gin ({qn(column)} gin_trgm_ops)"
+                )
+
+    def match(self, queryset, tokens):
+        connection = connections[queryset.db]
+        qn = connection.ops.quote_name
+        vector = f'{qn(self.table)}.{qn(self.vector_column)}'
+        fuzzy_columns = [f'{qn(self.table)}.{qn(column)}' for column in self.columns(self.fuzzy_fields)]
+        # every token has to match the vector, or a word of a fuzzy field with some typos. Word similarity
+        # (`<%`, doubled to escape it from the parameter substitution) compares the token with the closest
+        # stretch of the field, where the similarity of the whole multi-word search text would stay too low.
+        token_match = '(' + ' OR '.join(
+            [f"{vector} @@ to_tsquery('{self.config}', %s)"] + [f'%s <%% {column}' for column in fuzzy_columns]
+        ) + ')'
+        match = ' AND '.join([token_match] * len(tokens))
+        match_params = [param for token in tokens for param in [f'{token}:*'] + [token] * len(fuzzy_columns)]
+        rank = ' + '.join(
+            [f"ts_rank({vector}, to_tsquery('{self.config}', %s))"]
+            + [f'word_similarity(%s, {column})' for _ in tokens for column in fuzzy_columns]
+        )
+        rank_params = [' & '.join(f'{token}:*' for token in tokens)] + [
+            token for token in tokens for _ in fuzzy_columns
+        ]
+        return queryset.alias(
+            search_match=RawSQL(match, match_params, output_field=BooleanField())
+        ).filter(search_match=True).annotate(
+            search_rank=RawSQL(rank, rank_params, output_field=FloatField())
+        )
+
+
+class SQLiteSearchBackend(SearchBackend):
+    """
+    An external-content FTS5 table over the model's table, kept in sync by triggers, so rows written
+    through `bulk_create` or `QuerySet.update` are indexed as well.
+    """
+
+    @property
+    def fts_table(self):
+        return f'{self.table}_fts'
+
+    @staticmethod
+    def is_available(connection):
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT sqlite_compileoption_used('ENABLE_FTS5')")
+            return bool(cursor.fetchone()[0])
+
+    def install(self, connection):
+        qn = connection.ops.quote_name
+        table, fts_table, pk = qn(self.table), qn(self.fts_table), qn(self.model._meta.pk.column)
+        columns = ', '.join(qn(column) for column in self.columns())
+        new = ', '.join(f'new.{qn(column)}' for column in self.columns())
+        old = ', '.join(f'old.{qn(column)}' for column in self.columns())
+        create = (
+            f"CREATE VIRTUAL TABLE {fts_table} USING fts5("
+            f"{columns}, content={table}, content_rowid={pk}, tokenize='porter unicode61')"
+        )
+        triggers = [qn(self.fts_table + suffix) for suffix in ('_ai', '_ad', '_au')]
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = %s", [self.fts_table])
+            row = cursor.fetchone()
+            # sqlite keeps the statement a table was created with, so a change of fields shows up in it
+            exists = row is not None and row[0] == create
+            if not exists:
+                for trigger in triggers:
+                    cursor.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+                cursor.execute(f"DROP TABLE IF EXISTS {fts_table}")
+                cursor.execute(create)
+            cursor.execute(
+                f"CREATE TRIGGER IF NOT EXISTS {triggers[0]} AFTER INSERT ON {table} BEGIN "
+                f"INSERT INTO {fts_table}(rowid, {columns}) VALUES (new.{pk}, {new}); END"
+            )
+            cursor.execute(
+                f"CREATE TRIGGER IF NOT EXISTS {triggers[1]} AFTER DELETE ON {table} BEGIN "
+                f"INSERT INTO {fts_table}({fts_table}, rowid, {columns}) VALUES ('delete', old.{pk}, {old}); END"
+            )
+            cursor.execute(
+                f"CREATE TRIGGER IF NOT EXISTS {triggers[2]} AFTER UPDATE ON {table} BEGIN "
+                f"INSERT INTO {fts_table}({fts_table}, rowid, {columns}) VALUES ('delete', old.{pk}, {old}); "
+                f"INSERT INTO {fts_table}(rowid, {columns}) VALUES (new.{pk}, {new}); END"
+            )
+            if not exists:
+                cursor.execute(f"INSERT INTO {fts_table}({fts_table}) VALUES ('rebuild')")
+
+    def match(self, queryset, tokens):
+        connection = connections[queryset.db]
+        qn = connection.ops.quote_name
+        fts_table = qn(self.fts_table)
+        pk = f'{qn(self.table)}.{qn(self.model._meta.pk.column)}'
+        query = ' '.join(f'"{token}"*' for token in tokens)
+        weights = ', '.join(str(WEIGHTS[weight]) for weight in self.fields.values())
+        # bm25 scores are negative, with the best match lowest. The scores are materialized once per query:
+        # matching the index again for every candidate row costs seconds on large tables.
+        return queryset.filter(
+            pk__in=RawSQL(f"SELECT rowid FROM {fts_table} WHERE {fts_table} MATCH %s", [query])
+        ).annotate(search_rank=RawSQL(
+            f"WITH scores AS MATERIALIZED (SELECT rowid, -bm25({fts_table}, {weights}) AS score FROM {fts_table} "
+            f"WHERE {fts_table} MATCH %s) SELECT score FROM scores WHERE rowid = {pk}",
+            [query], output_field=FloatField()
+        ))
+
+
+def get_backend_class(connection):
+    if connection.vendor == 'postgresql':
+        return PostgresSearchBackend
+    if connection.vendor == 'sqlite' and SQLiteSearchBackend.is_available(connection):
+        return SQLiteSearchBackend
+    return ContainsSearchBackend
+
+
+class SearchIndex:
+    "The search configuration of one model, resolving the backend per database alias on first use"
+
+    def __init__(self, model, fields:dict, fuzzy_fields=()):
+        self.model = model
+        self.fields = fields
+        self.fuzzy_fields = fuzzy_fields
+        self._backends = {}
+
+    def backend(self, using):
+        if using not in self._backends:
+            self._backends[using] = get_backend_class(connections[using])(self.model, self.fields, self.fuzzy_fields)
+        return self._backends[using]
+
+    def search(self, queryset, text:str):
+        return self.backend(queryset.db).search(queryset, text)
+
+
+def register(model, fields:dict, fuzzy_fields=()) -> SearchIndex:
+    """
+    Makes `fields` of `model` searchable; `fields` maps field names to a weight letter from A (highest) to D.
+    `fuzzy_fields` additionally match misspellings, on backends with trigram support.
+    """
+    _registry[model] = SearchIndex(model, fields, fuzzy_fields)
+    return _registry[model]
+
+
+def get_index(model) -> SearchIndex:
+    return _registry[model]
+
+
+class SearchIndexFilter(filters.SearchFilter):
+    """
+    A drop-in for DRF's `SearchFilter` on models registered here: the `search` terms go through the
+    model's search index, ranked by relevance, instead of an `icontains` per field and term.
+    Views using it should leave their default ordering to the model, so the rank order survives `OrderingFilter`.
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        terms = ' '.join(self.get_search_terms(request))
+        if not terms or queryset.model not in _registry:
+            return super().filter_queryset(request, queryset, view)
+        return get_index(queryset.model).search(queryset, terms)
+
+
+def install_search_indexes(sender, app_config, using, **kwargs):
+    for model, index in _registry.items():
+        if model._meta.app_config is app_config:
+            index.backend(using).install(connections[using])
+
+
+post_migrate.connect(install_search_indexes, dispatch_uid='helpers.search.install_search_indexes')
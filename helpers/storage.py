@@ -0,0 +1,93 @@
+import hashlib
+import os
+import tempfile
+from django.core.files.storage import FileSystemStorage
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """
+    A `FileSystemStorage` that keeps each distinct content once, as a blob named by its sha256 under
+    `blob_dir`, and saves every name as a hard link to its blob. Names, `upload_to` paths and URLs are
+    unchanged, but a duplicate upload costs a directory entry rather than another copy.
+    The blob's link count doubles as its reference count: deleting a name only frees the blob once no other name links to it.
+    """
+    blob_dir = '.blobs'
+
+    def blob_path(self, digest:str) -> str:
+        return os.path.join(self.location, self.blob_dir, digest[:2], digest[2:4], digest)
+
+    @staticmethod
+    def digest(file) -> str:
+        sha256 = hashlib.sha256()
+        for chunk in file.chunks():
+            sha256.update(chunk)
+        return sha256.hexdigest()
+
+    def _save(self, name, content):
+        # the content is hashed while it is written to a temporary file, which then becomes its blob:
+        # an upload is read once, however large
+        blob_root = os.path.join(self.location, self.blob_dir)
+        os.makedirs(blob_root, exist_ok=True)
+        fd, temporary = tempfile.mkstemp(dir=blob_root, prefix='incoming-')
+        try:
+            sha256 = hashlib.sha256()
+            with os.fdopen(fd, 'wb') as file:
+                for chunk in content.chunks():
+                    sha256.update(chunk)
+                    file.write(chunk)
+            if self.file_permissions_mode is not None:
+                os.chmod(temporary, self.file_permissions_mode)
+            blob = self.blob_path(sha256.hexdigest())
+
+            while True:
+                full_path = self.path(name)
+                os.makedirs(os.path.dirname(blob), exist_ok=True)
+                os.makedirs(os.path.dirname(full_path), exist_ok=True)
+                try:
+                    os.link(temporary, blob)
+                except FileExistsError:
+                    # already stored, with identical bytes
+                    pass
+                try:
+                    os.link(blob, full_path)
+                    break
+                except FileExistsError:
+                    # another file got the name in the meantime
+                    name = self.get_available_name(name)
+                except FileNotFoundError:
+                    # a concurrent `delete` freed the blob after it was found, so it is written again
+                    continue
+        finally:
+            os.remove(temporary)
+        return str(name).replace('\\', '/')
+
+    def delete(self, name):
+        if not name:
+            raise ValueError('The name must be given to delete().')
+        path = self.path(name)
+        try:
+            links = os.stat(path).st_nlink
+        except FileNotFoundError:
+            return
+        blob = None
+        if links == 2:
+            # the blob itself is the other link, so this is its last reference; only then is the file hashed
+            with self.open(name) as file:
+                blob = self.blob_path(self.digest(file))
+        super().delete(name)
+        if blob is not None and os.path.exists(blob) and os.stat(blob).st_nlink == 1:
+            os.remove(blob)
+
+    def listdir(self, path):
+        directories, files = super().listdir(path)
+        if os.path.normpath(path) in ('', '.'):
+            directories = [directory for directory in directories if directory != self.blob_dir]
+        return directories, files
+
+
+content_addressed_storage = ContentAddressedStorage()
+
+
+def get_content_addressed_storage():
+    "The storage of `helpers.fields`, as a callable so migrations reference it rather than serialize it"
+    return content_addressed_storage
@@ -0,0 +1,124 @@
+import os
+from io import BytesIO
+from django.core.exceptions import SuspiciousOperation
+from django.core.files.uploadhandler import FileUploadHandler
+from PIL import Image, UnidentifiedImageError
+from rest_framework import exceptions
+from .validators import FileSizeValidator, ImageSizeValidator
+
+
+# the leading bytes every file of an extension starts with
+SIGNATURES = {
+    'png': (b'\x89PNG\r\n\x1a\n',),
+    'jpg': (b'\xff\xd8\xff',),
+    'jpeg': (b'\xff\xd8\xff',),
+    'jfif': (b'\xff\xd8\xff',),
+    'gif': (b'GIF87a', b'GIF89a'),
+    'pdf': (b'%PDF-',),
+    'docx': (b'PK\x03\x04',),
+}
+
+# the Pillow format each image extension must parse as
+IMAGE_FORMATS = {'png': 'PNG', 'jpg': 'JPEG', 'jpeg': 'JPEG', 'jfif': 'JPEG', 'gif': 'GIF'}
+
+# how far into an image its header may run (e.g. behind large EXIF blocks) before it's given up on
+MAX_IMAGE_HEADER_SIZE = 256 * 1024
+
+
+class UploadRejected(exceptions.ValidationError, SuspiciousOperation):
+    """
+    Raised while an upload is still arriving, so DRF views answer it with a 400 like any other
+    validation error, and plain Django views (through `SuspiciousOperation`) do as well.
+    """
+
+
+class ValidatingUploadHandler(FileUploadHandler):
+    """
+    Validates each uploaded file chunk by chunk, ahead of the handlers that buffer it in memory or a
+    temporary file, so a bad upload is refused before it costs either:
+    - files over the size limit of their form field, when the view has set one (see `UploadSizeLimitMixin`),
+      are rejected once they reach it
+    - files with an extension from `SIGNATURES` must start with one of its signatures
+    - images must have a header Pillow reads as their extension's format, within `Image.MAX_IMAGE_PIXELS`.
+      Only the header is parsed; no pixel data is decoded.
+    Other extensions are only held to the size limit, leaving the field validators to judge them.
+    """
+
+    def new_file(self, field_name, file_name, content_type, content_length, charset=None, content_type_extra=None):
+        super().new_file(field_name, file_name, content_type, content_length, charset, content_type_extra)
+        self.max_size = getattr(self.request, 'upload_max_sizes', {}).get(field_name)
+        self.extension = os.path.splitext(file_name)[1].lstrip('.').lower()
+        self.received = 0
+        self.head = b''
+        self.checked = self.extension not in SIGNATURES
+        if self.max_size is not None and content_length is not None and content_length > self.max_size:
+            self.reject('is too large')
+
+    def receive_data_chunk(self, raw_data, start):
+        self.received += len(raw_data)
+        if self.max_size is not None and self.received > self.max_size:
+            self.reject('is too large')
+        if not self.checked:
+            self.head += raw_data
+            self.check_header(complete=False)
+        return raw_data
+
+    def file_complete(self, file_size):
+        if not self.checked:
+            self.check_header(complete=True)
+        # leaves the file itself to the next handler
+        return None
+
+    def check_header(self, complete:bool):
+        signatures = SIGNATURES[self.extension]
+        if len(self.head) < max(map(len, signatures)) and not complete:
+            return
+        if not self.head.startswith(signatures):
+            self.reject(f'is not a valid {self.extension} file')
+        if self.extension not in IMAGE_FORMATS:
+            self.checked = True
+            return
+
+        try:
+            # `open` only parses the header; pixel data would be decoded by `load`, which is never called
+            with Image.open(BytesIO(self.head)) as image:
+                image_format, (width, height) = image.format, image.size
+        except (UnidentifiedImageError, Image.DecompressionBombError, OSError, SyntaxError):
+            if complete or len(self.head) >= MAX_IMAGE_HEADER_SIZE:
+                self.reject(f'is not a valid {self.extension} image')
+            # the header may continue in the next chunk
+            return
+        if image_format != IMAGE_FORMATS[self.extension]:
+            self.reject(f'is not a valid {self.extension} image')
+        if Image.MAX_IMAGE_PIXELS and width * height > Image.MAX_IMAGE_PIXELS:
+            self.reject('has too many pixels')
+        self.checked, self.head = True, b''
+
+    def reject(self, reason:str):
+        raise UploadRejected({self.field_name: [f'The uploaded file {self.file_name} {reason}.']})
+
+
+class UploadSizeLimitMixin:
+    """
+    For views taking uploads: hands `ValidatingUploadHandler` the size limit of each file field, so oversized
+    files are refused while they stream in. The limits are read from the size validators of the serializer
+    model's fields, and `upload_max_sizes` ({field name: bytes}) adds to or overrides them.
+    """
+    upload_max_sizes = {}
+
+    def initialize_request(self, request, *args, **kwargs):
+        # set before anything parses the body, which is when the upload handlers run
+        request.upload_max_sizes = self.get_upload_max_sizes()
+        return super().initialize_request(request, *args, **kwargs)
+
+    def get_upload_max_sizes(self):
+        max_sizes = {}
+        model = getattr(getattr(self.serializer_class, 'Meta', None), 'model', None)
+        for field in model._meta.get_fields() if model else ():
+            limits = [
+                validator.max_bytes_size for validator in getattr(field, 'validators', ())
+                if isinstance(validator, (ImageSizeValidator, FileSizeValidator))
+            ]
+            if limits:
+                max_sizes[field.name] = min(limits)
+        return {**max_sizes, **self.upload_max_sizes}
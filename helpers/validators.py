@@ -9,7 +9,7 @@ class ImageSizeValidator:
         self.max_bytes_size = max_bytes_size
     
     def __call__(self, image):
-        image_size_in_bytes = image.file.size
+        image_size_in_bytes = image.size
 
         if image_size_in_bytes > self.max_bytes_size:
             raise ValidationError(f"File Size cannot be more than {self.max_bytes_size/(1024*1024)}MB")
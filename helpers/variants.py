@@ -0,0 +1,115 @@
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import close_old_connections
+from PIL import Image, ImageOps
+
+
+# the longest side of each variant, all stored as WebP next to the original
+VARIANTS = {
+    'thumbnail': 200,
+    'medium': 800,
+}
+WEBP_QUALITY = 80
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def variant_name(name:str, variant:str) -> str:
+    "e.g. `products/cover_images/shoe.jpg` -> `products/cover_images/shoe.thumbnail.webp`"
+    return f'{os.path.splitext(name)[0]}.{variant}.webp'
+
+
+def generate_variants(storage, name:str, overwrite:bool=False) -> list:
+    """
+    Writes the missing `VARIANTS` of the image `name` to `storage`, or all of them with `overwrite`,
+    and returns the names written. The original is decoded once, at a reduced scale where the format allows it.
+    """
+    missing = {
+        variant: variant_name(name, variant) for variant in VARIANTS
+        if overwrite or not storage.exists(variant_name(name, variant))
+    }
+    if not missing:
+        return []
+    with storage.open(name, 'rb') as file, Image.open(file) as original:
+        # lets JPEG decode straight at (a power of two above) the largest variant's size
+        largest = max(VARIANTS[variant] for variant in missing)
+        original.draft('RGB', (largest, largest))
+        image = ImageOps.exif_transpose(original)
+        if image.mode not in ('RGB', 'RGBA'):
+            image = image.convert('RGBA' if 'A' in image.getbands() or 'transparency' in image.info else 'RGB')
+
+        written = []
+        for variant, path in missing.items():
+            resized = image.copy()
+            resized.thumbnail((VARIANTS[variant], VARIANTS[variant]), Image.LANCZOS)
+            buffer = BytesIO()
+            resized.save(buffer, 'WEBP', quality=WEBP_QUALITY)
+            if storage.exists(path):
+                storage.delete(path)
+            written.append(storage.save(path, ContentFile(buffer.getvalue())))
+    return written
+
+
+def delete_variants(storage, name:str):
+    for variant in VARIANTS:
+        storage.delete(variant_name(name, variant))
+
+
+def variant_urls(field_file, generated:bool) -> dict:
+    """
+    The URL of every variant of `field_file` once they are `generated`, the original's until then.
+    The URLs are built from the names alone, without asking the storage whether the variants exist.
+    """
+    urls = {'original': field_file.url}
+    for variant in VARIANTS:
+        urls[variant] = field_file.storage.url(variant_name(field_file.name, variant)) if generated else urls['original']
+    return urls
+
+
+def get_executor() -> ThreadPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=getattr(settings, 'IMAGE_VARIANT_WORKERS', 2), thread_name_prefix='image-variants'
+            )
+        return _executor
+
+
+def generate(storage, name:str, on_generated=None) -> list:
+    "`generate_variants`, then `on_generated()` once all of them are written"
+    written = generate_variants(storage, name)
+    if on_generated is not None:
+        on_generated()
+    return written
+
+
+def schedule(storage, name:str, on_generated=None):
+    """
+    Queues `generate` on the local worker pool, off the request path. Resizing releases the GIL
+    for most of its work, so a few threads keep up without taking CPUs from the web workers.
+    """
+    future = get_executor().submit(_generate_in_worker, storage, name, on_generated)
+    future.add_done_callback(_log_failure)
+    return future
+
+
+def _generate_in_worker(storage, name, on_generated):
+    try:
+        return generate(storage, name, on_generated)
+    finally:
+        # the worker threads outlive requests, so their database connections are recycled as a request's would be
+        close_old_connections()
+
+
+def _log_failure(future):
+    if future.exception() is not None:
+        logger.error('Generating image variants failed', exc_info=future.exception())
@@ -111,6 +111,14 @@ WSGI_APPLICATION = "zionnet.wsgi.application"
 MEDIA_URL = "/media/"
 MEDIA_ROOT = os.path.join(BASE_DIR, "media")
 
+# Uploads are validated while they stream in, before Django's own handlers buffer them. Size limits are
+# per field, set by the views taking uploads (see `helpers.uploadhandler.UploadSizeLimitMixin`)
+FILE_UPLOAD_HANDLERS = [
+    "helpers.uploadhandler.ValidatingUploadHandler",
+    "django.core.files.uploadhandler.MemoryFileUploadHandler",
+    "django.core.files.uploadhandler.TemporaryFileUploadHandler",
+]
+
 # Database
 # https://docs.djangoproject.com/en/4.2/ref/settings/#databases
 
@@ -122,6 +130,21 @@ DATABASES = {
     )
 }
 
+# Cache
+# `helpers.cache.VersionedCache` invalidates by bumping a version kept in this cache, which only reaches every
+# worker when they all share it: set REDIS_URL wherever more than one process serves requests. Without it each
+# process keeps a cache of its own, which is fine for a single development server.
+REDIS_URL = envvar("REDIS_URL", default="")
+
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.redis.RedisCache",
+        "LOCATION": REDIS_URL,
+    } if REDIS_URL else {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+    }
+}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators